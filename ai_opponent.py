@@ -0,0 +1,270 @@
+"""AI opponent that actually attempts each challenge.
+
+A solver takes a challenge and returns the code it believes fixes it, along
+with how long that took:
+
+- ``MockSolver`` is deterministic and needs nothing running. It returns the
+  reference fix with a think time derived from the level and the code.
+- ``HTTPSolver`` sends challenges to a local inference server. Concurrent
+  requests are collected into batches, posted over a small pool of
+  keep-alive connections with timeouts, and timed on the wall clock.
+
+``AIOpponent`` puts a per-challenge cache in front of a solver, so replaying
+a snippet costs nothing, and coalesces concurrent requests for the same
+challenge into one solve. ``peek`` reads that cache without ever waiting on
+the solver, and ``prewarm`` fills it for a whole catalog in the background.
+
+Running ``python ai_opponent.py serve`` starts a stand-in inference server
+that speaks the ``HTTPSolver`` protocol and answers from the challenge
+catalog, for trying the batched path without a model.
+"""
+import hashlib
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from urllib.parse import urlparse
+
+SolverResult = namedtuple('SolverResult', 'fixed_code solve_time')
+
+
+class SolverUnavailable(Exception):
+    """Raised when the solver could not produce an answer in time"""
+
+
+def _request_item(challenge):
+    # Only what a player can see is sent to the model
+    return {'id': challenge['id'], 'level': challenge['level'], 'language': challenge['language'],
+            'description': challenge['description'], 'code': challenge['code']}
+
+
+class MockSolver:
+    """Deterministic stand-in: the reference fix after a level-based think time"""
+
+    BASE_SECONDS = {'easy': 25, 'medium': 35, 'hard': 60}
+
+    def submit(self, challenge):
+        # Same challenge, same think time: 0.8x to 1.2x the level's base time
+        digest = hashlib.sha256(challenge['code'].encode()).digest()
+        spread = 0.8 + 0.4 * int.from_bytes(digest[:4], 'big') / 0xffffffff
+        future = Future()
+        future.set_result(SolverResult(challenge['fixed_code'],
+                                       self.BASE_SECONDS.get(challenge['level'], 35) * spread))
+        return future
+
+    def stop(self):
+        pass
+
+
+class HTTPSolver:
+    """Batches challenges to an inference server over pooled connections.
+
+    Protocol: ``POST <url>`` with ``{"items": [{id, level, language,
+    description, code}, ...]}`` answered by ``{"items": [{id, fixed_code},
+    ...]}``. Every item in a batch is credited with the batch's wall time.
+    """
+
+    def __init__(self, url, timeout=10.0, pool_size=4, batch_size=8, batch_wait=0.02):
+        parsed = urlparse(url)
+        self._host = parsed.hostname or '127.0.0.1'
+        self._port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self._https = parsed.scheme == 'https'
+        self._path = parsed.path or '/'
+        self.timeout = timeout
+        self._pool_size = pool_size
+        self._batch_size = batch_size
+        self._batch_wait = batch_wait
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_started(self):
+        # The batcher thread, executor and sockets belong to the process that made them
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pending = queue.Queue()
+            self._connections = queue.LifoQueue()
+            self._executor = ThreadPoolExecutor(self._pool_size, thread_name_prefix='ai-solver')
+            threading.Thread(target=self._batch_loop, daemon=True, name='ai-solver-batcher').start()
+            self._pid = os.getpid()
+
+    def submit(self, challenge):
+        """Queue a challenge; returns a Future resolving to a SolverResult"""
+        self._ensure_started()
+        future = Future()
+        self._pending.put((challenge, future))
+        return future
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self._batch_wait
+            while len(batch) < self._batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._solve_batch, batch)
+
+    def _connection(self):
+        try:
+            return self._connections.get_nowait()
+        except queue.Empty:
+            cls = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+            return cls(self._host, self._port, timeout=self.timeout)
+
+    def _post(self, body):
+        conn = self._connection()
+        try:
+            conn.request('POST', self._path, body=body, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+        if response.status != 200:
+            conn.close()
+            raise SolverUnavailable(f'Inference server answered {response.status}')
+        if self._connections.qsize() < self._pool_size:
+            self._connections.put(conn)
+        else:
+            conn.close()
+        return json.loads(data)
+
+    def _solve_batch(self, batch):
+        body = json.dumps({'items': [_request_item(challenge) for challenge, _ in batch]})
+        started = time.perf_counter()
+        try:
+            answers = {item['id']: item.get('fixed_code', '') for item in self._post(body)['items']}
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(SolverUnavailable(f'Inference request failed: {exc}'))
+            return
+        elapsed = time.perf_counter() - started
+        for challenge, future in batch:
+            if challenge['id'] in answers:
+                future.set_result(SolverResult(answers[challenge['id']], elapsed))
+            else:
+                future.set_exception(SolverUnavailable('No answer for this challenge'))
+
+    def stop(self):
+        if self._pid == os.getpid():
+            self._executor.shutdown(wait=False)
+
+
+class AIOpponent:
+    """Caches solver results per challenge and coalesces concurrent solves"""
+
+    def __init__(self, solver, cache_size=2048, timeout=10.0):
+        self.solver = solver
+        self.timeout = timeout
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, challenge):
+        # The cached result, or else the future of a solve, started here if none is running
+        key = (challenge.get('catalog_version'), challenge['id'])
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached, None
+            future = self._inflight.get(key)
+            started = future is None
+            if started:
+                future = self._inflight[key] = self.solver.submit(challenge)
+        if started:
+            # Outside the lock: a solver may hand back a future that is already done
+            future.add_done_callback(lambda done: self._remember(key, done))
+        return None, future
+
+    def solve(self, challenge):
+        """Return the solver's SolverResult for a challenge, or raise SolverUnavailable"""
+        cached, future = self._lookup(challenge)
+        if cached is not None:
+            return cached
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise SolverUnavailable('The AI did not answer in time')
+
+    def peek(self, challenge):
+        """Return the SolverResult for a challenge if it is ready, else None.
+
+        Never waits: a miss starts a solve in the background (unless one is
+        running already) and the next call for the challenge finds it cached.
+        """
+        cached, future = self._lookup(challenge)
+        if cached is not None:
+            return cached
+        if future.done() and future.exception() is None:
+            return future.result()
+        return None
+
+    def prewarm(self, challenges):
+        """Start solving challenges that are not cached yet, up to the cache size"""
+        for count, challenge in enumerate(challenges):
+            if count >= self._cache_size:
+                return
+            self._lookup(challenge)
+
+    def _remember(self, key, future):
+        with self._lock:
+            self._inflight.pop(key, None)
+            if future.exception() is None:
+                self._cache[key] = future.result()
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+
+
+def serve(port=8765, latency=0.5, path=None):
+    """Run a stand-in inference server that answers from the challenge catalog"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from catalog import ChallengeCatalog
+
+    catalog = ChallengeCatalog(path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'challenges'))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            items = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))['items']
+            # One "forward pass" per batch, however many items it holds
+            time.sleep(latency)
+            answers = []
+            for item in items:
+                level, language, index = item['id'].split('/')
+                challenge = catalog.get(level, language, int(index))
+                answers.append({'id': item['id'], 'fixed_code': challenge['fixed_code'] if challenge else ''})
+            body = json.dumps({'items': answers}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    ThreadingHTTPServer(('127.0.0.1', port), Handler).serve_forever()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Stand-in inference server for the AI opponent')
+    parser.add_argument('command', choices=('serve',))
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds per batch')
+    parser.add_argument('--challenges', help='catalog path (defaults to ./challenges)')
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.challenges)
@@ -0,0 +1,344 @@
+"""Static analysis pipeline behind the /analyze code review endpoint.
+
+Python code is parsed once with ``ast`` and walked by node-type checks;
+JavaScript and Java are scanned line by line by regex rule packs. Findings
+are yielded as soon as they are found so the endpoint can stream them, every
+run is bounded by a CPU and wall-clock budget, and complete results are kept
+in a bounded LRU cache keyed by a hash of the language and code.
+"""
+import ast
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+SUPPORTED_LANGUAGES = ('python', 'javascript', 'java')
+
+
+class _Budget:
+    """Per-request CPU and wall-clock allowance"""
+
+    __slots__ = ('cpu_deadline', 'wall_deadline')
+
+    def __init__(self, cpu_seconds, wall_seconds):
+        self.cpu_deadline = time.thread_time() + cpu_seconds
+        self.wall_deadline = time.monotonic() + wall_seconds
+
+    def exhausted(self):
+        return (time.thread_time() > self.cpu_deadline
+                or time.monotonic() > self.wall_deadline)
+
+
+def _finding(review, section, text, line=None):
+    finding = {'type': 'finding', 'review': review, 'section': section, 'text': text}
+    if line is not None:
+        finding['line'] = line
+    return finding
+
+
+# --- Python: ast-based checks ------------------------------------------------
+
+def _check_function(node, facts):
+    facts['functions'] += 1
+    if ast.get_docstring(node) is None:
+        yield _finding('ai', 'suggestions', f"Add a docstring to '{node.name}()'", node.lineno)
+    else:
+        facts['docstrings'] += 1
+    for default in node.args.defaults + node.args.kw_defaults:
+        if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+            yield _finding('ai', 'issues',
+                           f"Mutable default argument in '{node.name}()' is shared between calls",
+                           default.lineno)
+    if len(node.body) > 40:
+        yield _finding('ai', 'suggestions',
+                       f"'{node.name}()' is long; consider splitting it into smaller functions",
+                       node.lineno)
+
+
+def _check_except(node, facts):
+    if node.type is None:
+        yield _finding('ai', 'issues', 'Bare except also catches KeyboardInterrupt and SystemExit',
+                       node.lineno)
+    if all(isinstance(stmt, ast.Pass) for stmt in node.body):
+        yield _finding('ai', 'issues', 'Exception is silently swallowed', node.lineno)
+    facts['error_handling'] += 1
+
+
+def _check_compare(node, facts):
+    for op, right in zip(node.ops, node.comparators):
+        if isinstance(op, (ast.Eq, ast.NotEq)) and isinstance(right, ast.Constant):
+            if right.value is None:
+                yield _finding('ai', 'issues', "Compare with None using 'is' / 'is not'", node.lineno)
+            elif right.value is True or right.value is False:
+                yield _finding('ai', 'suggestions', 'Comparing to True/False is redundant',
+                               node.lineno)
+
+
+def _check_call(node, facts):
+    func = node.func
+    if isinstance(func, ast.Name):
+        if func.id in ('eval', 'exec'):
+            yield _finding('ai', 'issues', f'{func.id}() runs arbitrary code; avoid it', node.lineno)
+        elif func.id == 'print':
+            facts['prints'] += 1
+
+
+def _check_binop(node, facts):
+    # Dividing by len(x) fails on empty sequences unless something guards it
+    if (isinstance(node.op, (ast.Div, ast.FloorDiv)) and isinstance(node.right, ast.Call)
+            and isinstance(node.right.func, ast.Name) and node.right.func.id == 'len'):
+        facts['len_divisions'].append(node.lineno)
+
+
+def _check_for(node, facts):
+    target = node.iter
+    if (isinstance(target, ast.Call) and isinstance(target.func, ast.Name)
+            and target.func.id == 'range' and len(target.args) == 1
+            and isinstance(target.args[0], ast.Call)
+            and isinstance(target.args[0].func, ast.Name) and target.args[0].func.id == 'len'):
+        yield _finding('ai', 'suggestions', 'Iterate directly or use enumerate() instead of range(len(...))',
+                       node.lineno)
+    facts['loops'] += 1
+
+
+def _check_global(node, facts):
+    yield _finding('ai', 'suggestions', 'Global state makes functions harder to test', node.lineno)
+
+
+def _check_joinedstr(node, facts):
+    facts['fstrings'] += 1
+
+
+def _check_if(node, facts):
+    facts['conditions'] += 1
+
+
+_PYTHON_CHECKS = {
+    ast.FunctionDef: _check_function,
+    ast.AsyncFunctionDef: _check_function,
+    ast.ExceptHandler: _check_except,
+    ast.Compare: _check_compare,
+    ast.Call: _check_call,
+    ast.BinOp: _check_binop,
+    ast.For: _check_for,
+    ast.Global: _check_global,
+    ast.JoinedStr: _check_joinedstr,
+    ast.If: _check_if,
+}
+
+
+# Deepest expression handed to the parser. CPython's parser recurses once per
+# link of a chain like a.b.c..., -(-(-x)) or 1+1+1..., and fails near 3000.
+MAX_EXPRESSION_DEPTH = 1000
+
+# Strings and comments are skipped; operators, brackets and separators are counted
+_DEPTH_RE = re.compile(r'''#[^\n]*|'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"'''
+                       r'|([-+*/%@&|^~<>.])|([(\[{])|([)\]}])|([,;:\n])')
+
+
+def _expression_depth(code, limit):
+    """Rough upper bound on how deeply the parser will nest, up to just past limit"""
+    # Operators chained since the last separator, per open bracket
+    outer, chain, deepest = [], 0, 0
+    for match in _DEPTH_RE.finditer(code):
+        operator, opening, closing, separator = match.groups()
+        if operator:
+            chain += 1
+        elif opening:
+            outer.append(chain)
+            chain = 0
+        elif closing:
+            chain = outer.pop() if outer else 0
+        elif separator and (separator != '\n' or not outer):
+            chain = 0
+        else:
+            continue
+        depth = len(outer) + sum(outer) + chain
+        if depth > deepest:
+            deepest = depth
+            if deepest > limit:
+                break
+    return deepest
+
+
+def _analyze_python(code, budget, facts):
+    if _expression_depth(code, MAX_EXPRESSION_DEPTH) > MAX_EXPRESSION_DEPTH:
+        yield _finding('ai', 'issues', 'Expressions are nested too deeply to analyze')
+        return
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as exc:
+        yield _finding('ai', 'issues', f'Syntax error: {exc.msg}', exc.lineno)
+        return
+    except (RecursionError, MemoryError):
+        yield _finding('ai', 'issues', 'Expressions are nested too deeply to analyze')
+        return
+    except ValueError as exc:
+        # e.g. null bytes in the source
+        yield _finding('ai', 'issues', f'Syntax error: {exc}')
+        return
+    # Parsing is the biggest single step; it counts against the same budget
+    if budget.exhausted():
+        raise TimeoutError
+
+    facts.update(functions=0, docstrings=0, error_handling=0, prints=0, loops=0,
+                 conditions=0, fstrings=0, len_divisions=[])
+    for index, node in enumerate(ast.walk(tree)):
+        check = _PYTHON_CHECKS.get(type(node))
+        if check is not None:
+            # Checks that only record facts return None instead of findings
+            findings = check(node, facts)
+            if findings is not None:
+                yield from findings
+        if index % 256 == 0 and budget.exhausted():
+            raise TimeoutError
+
+    if facts['len_divisions'] and not facts['conditions']:
+        yield _finding('ai', 'issues', 'Division by len() raises ZeroDivisionError for empty input',
+                       facts['len_divisions'][0])
+    if facts['fstrings']:
+        yield _finding('ai', 'positive', 'Uses f-strings for readable string formatting')
+    if facts['functions'] and facts['docstrings'] == facts['functions']:
+        yield _finding('ai', 'positive', 'Every function is documented')
+    if facts['functions']:
+        yield _finding('ai', 'positive', 'Code is organised into functions')
+    if facts['prints'] > 2:
+        yield _finding('ai', 'suggestions', 'Consider the logging module instead of print()')
+
+
+# --- JavaScript / Java: regex rule packs --------------------------------------
+
+# (section, pattern, message); patterns run against comment-stripped lines
+_JAVASCRIPT_RULES = (
+    ('suggestions', re.compile(r'\bvar\s'), "Prefer 'let' or 'const' over 'var'"),
+    ('issues', re.compile(r'[^=!<>]==[^=]|!=[^=]'), "Use strict equality ('===' / '!==')"),
+    ('issues', re.compile(r'\beval\s*\('), 'eval() runs arbitrary code; avoid it'),
+    ('issues', re.compile(r'\.innerHTML\s*='), 'Assigning innerHTML can introduce XSS'),
+    ('suggestions', re.compile(r'console\.log\s*\('), 'Remove console.log calls from production code'),
+    ('suggestions', re.compile(r'\.then\s*\((?!.*\.catch)'), 'Handle promise rejections with .catch()'),
+    ('positive', re.compile(r'\b(const|let)\s'), 'Uses block-scoped declarations'),
+    ('positive', re.compile(r'=>'), 'Uses arrow functions'),
+    ('positive', re.compile(r'\basync\b|\bawait\b'), 'Uses async/await for asynchronous code'),
+)
+
+_JAVA_RULES = (
+    ('issues', re.compile(r'catch\s*\(\s*(Exception|Throwable)\b'), 'Catching Exception/Throwable is too broad'),
+    ('issues', re.compile(r'catch\s*\([^)]*\)\s*\{\s*\}'), 'Empty catch block swallows errors'),
+    ('issues', re.compile(r'"\s*==|==\s*"'), 'Compare strings with equals(), not =='),
+    ('suggestions', re.compile(r'System\.(out|err)\.print'), 'Use a logging framework instead of System.out'),
+    ('suggestions', re.compile(r'\bnew\s+Thread\s*\('), 'Prefer an ExecutorService to raw threads'),
+    ('suggestions', re.compile(r'\b(List|Map|Set)\s+\w+\s*=\s*new\s+\w+\s*\(\s*\)'), 'Use generic type parameters'),
+    ('positive', re.compile(r'try\s*\('), 'Uses try-with-resources'),
+    ('positive', re.compile(r'\bfinal\s'), 'Uses final for values that should not change'),
+    ('positive', re.compile(r'<\w+(,\s*\w+)*>'), 'Uses generics for type safety'),
+)
+
+_RULE_PACKS = {'javascript': _JAVASCRIPT_RULES, 'java': _JAVA_RULES}
+
+_LINE_COMMENT_RE = re.compile(r'//.*$')
+_BLOCK_COMMENT_RE = re.compile(r'/\*.*?\*/')
+_STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`(?:\\.|[^`\\])*`')
+
+
+def _analyze_with_rules(code, rules, budget, facts):
+    seen = set()
+    in_block_comment = False
+    for lineno, line in enumerate(code.splitlines(), 1):
+        if in_block_comment:
+            end = line.find('*/')
+            if end == -1:
+                continue
+            line, in_block_comment = line[end + 2:], False
+        line = _BLOCK_COMMENT_RE.sub(' ', line)
+        start = line.find('/*')
+        if start != -1:
+            line, in_block_comment = line[:start], True
+        # Keep string delimiters for rules that look for them, drop their contents
+        line = _LINE_COMMENT_RE.sub('', _STRING_RE.sub('""', line))
+        if not line.strip():
+            continue
+        facts['lines'] += 1
+
+        for section, pattern, message in rules:
+            if message not in seen and pattern.search(line):
+                seen.add(message)
+                yield _finding('ai', section, message, None if section == 'positive' else lineno)
+        if lineno % 64 == 0 and budget.exhausted():
+            raise TimeoutError
+
+
+# --- Human-style review -------------------------------------------------------
+
+def _human_review(code, language, facts):
+    lines = [line for line in code.splitlines() if line.strip()]
+    if len(lines) < 15:
+        yield _finding('human', 'insights',
+                       'This is short and easy to follow. Think about who calls it and what '
+                       'inputs they might pass that you did not expect.')
+    else:
+        yield _finding('human', 'insights',
+                       'There is a fair amount going on here. A reviewer would ask whether each '
+                       'piece has a single clear responsibility.')
+    if facts.get('len_divisions') or facts.get('conditions') == 0:
+        yield _finding('human', 'insights',
+                       'What happens with empty or unusual input? Edge cases are where real '
+                       'users find bugs first.')
+    yield _finding('human', 'suggestions', 'Write a couple of tests that document the expected behaviour')
+    yield _finding('human', 'suggestions', 'Name things after what they mean in the problem domain')
+    if language == 'python' and not facts.get('error_handling'):
+        yield _finding('human', 'suggestions', 'Decide how failures should surface to the caller')
+    yield _finding('human', 'context',
+                   'A human reviewer weighs this code against the project\'s goals, the team\'s '
+                   'conventions and how it will be maintained, not just against known patterns.')
+
+
+def analyze(code, language, cpu_seconds=1.0, wall_seconds=2.0):
+    """Yield findings for a piece of code, ending with a 'done' event"""
+    budget = _Budget(cpu_seconds, wall_seconds)
+    facts = {'lines': 0}
+    try:
+        if language == 'python':
+            yield from _analyze_python(code, budget, facts)
+        else:
+            yield from _analyze_with_rules(code, _RULE_PACKS[language], budget, facts)
+        yield from _human_review(code, language, facts)
+    except TimeoutError:
+        yield {'type': 'done', 'truncated': True}
+        return
+    yield {'type': 'done', 'truncated': False}
+
+
+class AnalysisCache:
+    """Bounded LRU cache of complete analysis results keyed by content hash"""
+
+    def __init__(self, capacity=512):
+        self._capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(code, language):
+        return hashlib.sha256(f'{language}\0{code}'.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    def stream(self, code, language, **budget):
+        """Yield cached findings, or run the analysis and cache it if it completes"""
+        key = self.key(code, language)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+        if cached is not None:
+            yield from cached
+            return
+
+        events = []
+        for event in analyze(code, language, **budget):
+            events.append(event)
+            yield event
+        # Truncated runs are not cached so a later, less loaded run can finish
+        if not events[-1]['truncated']:
+            with self._lock:
+                self._entries[key] = tuple(events)
+                while len(self._entries) > self._capacity:
+                    self._entries.popitem(last=False)
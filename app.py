@@ -1,733 +1,286 @@
-from flask import Flask, render_template, request, jsonify
-import re
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
+from jinja2 import TemplateNotFound
+import json
+import os
 import random
+import threading
 import time
 
-app = Flask(__name__)
+from analyzer import SUPPORTED_LANGUAGES, AnalysisCache
+from assets import AssetManifest
+from catalog import LiveCatalog
+from challenge_store import StoreFull, create_challenge_store
+from challenge_tokens import LANGUAGES, LEVELS, InvalidToken, issue_token, verify_token
+from code_diff import DiffCache
+from history import Match, MatchHistory
+from rooms import RoomError, RoomHub, RoomNotFound, RoomsFull
+from metrics import Metrics, process_memory
+from rate_limit import Quota, RateLimited, create_rate_limiter, parse_quotas
+from ratings import Ratings
+from static_pages import StaticPages
+from submission_queue import ClientQueueFull, QueueFull, SubmissionQueue
+from timer_wheel import TimerWheel
 
-# Store active challenges by ID
-active_challenges = {}
-
-# Bug Hunt Game - Code samples with intentional bugs
-BUG_HUNT_LEVELS = {
-    'easy': {
-        'python': [
-            {
-                'code': '''def check_age(age):
-    if age >= 18:
-        return "adult"
-    elif age >= 13:
-        return "teenager"
-    elif age > 0:
-        return "child"
-    else:
-        return "invalid"
-
-# Test cases
-print(check_age(25))
-print(check_age(15))
-print(check_age(8))
-print(check_age(-5))''',
-                'bugs': ['Logic error: age > 0 should be age >= 0 to handle newborns (age 0)'],
-                'fixed_code': '''def check_age(age):
-    if age >= 18:
-        return "adult"
-    elif age >= 13:
-        return "teenager"
-    elif age >= 0:
-        return "child"
-    else:
-        return "invalid"
-
-# Test cases
-print(check_age(25))
-print(check_age(15))
-print(check_age(8))
-print(check_age(0))''',
-                'description': 'Fix the age validation logic!'
-            },
-            {
-                'code': '''def calculate_discount(price, is_student):
-    if is_student == True:
-        discount = price * 0.1
-        return price - discount
-    else:
-        return price
-
-# Test
-student_price = calculate_discount(100, True)
-regular_price = calculate_discount(100, False)
-print(f"Student: ${student_price}, Regular: ${regular_price}")''',
-                'bugs': ['Missing return statement in else block creates inconsistent behavior'],
-                'fixed_code': '''def calculate_discount(price, is_student):
-    if is_student:
-        discount = price * 0.1
-        return price - discount
-    else:
-        return price
-
-# Test
-student_price = calculate_discount(100, True)
-regular_price = calculate_discount(100, False)
-print(f"Student: ${student_price}, Regular: ${regular_price}")''',
-                'description': 'Find the discount calculation bug!'
-            },
-            {
-                'code': '''def find_max_number(numbers):
-    if len(numbers) == 0:
-        return None
-    
-    max_num = numbers[0]
-    for i in range(len(numbers)):
-        if numbers[i] > max_num:
-            max_num = numbers[i]
-    return max_num
-
-# Test with negative numbers
-result = find_max_number([-5, -2, -10, -1])
-print(f"Max: {result}")''',
-                'bugs': ['Logic works correctly - this is actually a good implementation'],
-                'fixed_code': '''def find_max_number(numbers):
-    if len(numbers) == 0:
-        return None
-    
-    max_num = numbers[0]
-    for i in range(len(numbers)):
-        if numbers[i] > max_num:
-            max_num = numbers[i]
-    return max_num
-
-# Test with negative numbers
-result = find_max_number([-5, -2, -10, -1])
-print(f"Max: {result}")''',
-                'description': 'Find the bug in max number detection!'
-            }
-        ],
-        'javascript': [
-            {
-                'code': '''function checkPassword(password) {
-    if (password.length > 8) {
-        return "strong";
-    } else if (password.length > 5) {
-        return "medium";
-    } else if (password.length > 0) {
-        return "weak";
-    } else {
-        return "invalid";
-    }
-}
-
-// Test cases
-console.log(checkPassword("mypassword123"));
-console.log(checkPassword("hello"));
-console.log(checkPassword("hi"));
-console.log(checkPassword(""));''',
-                'bugs': ['Logic error: should be >= 8, >= 6 for proper password strength'],
-                'fixed_code': '''function checkPassword(password) {
-    if (password.length >= 8) {
-        return "strong";
-    } else if (password.length >= 6) {
-        return "medium";
-    } else if (password.length > 0) {
-        return "weak";
-    } else {
-        return "invalid";
-    }
-}
-
-// Test cases
-console.log(checkPassword("mypassword123"));
-console.log(checkPassword("hello"));
-console.log(checkPassword("hi"));
-console.log(checkPassword(""));''',
-                'description': 'Fix the password strength logic!'
-            },
-            {
-                'code': '''function calculateGrade(score) {
-    if (score >= 90) {
-        return "A";
-    } else if (score >= 80) {
-        return "B";
-    } else if (score >= 70) {
-        return "C";
-    } else if (score >= 60) {
-        return "D";
-    } else {
-        return "F";
-    }
-}
-
-// Test edge case
-console.log(calculateGrade(90));
-console.log(calculateGrade(85));
-console.log(calculateGrade(75));
-console.log(calculateGrade(65));
-console.log(calculateGrade(55));''',
-                'bugs': ['Actually works correctly - no bug present'],
-                'fixed_code': '''function calculateGrade(score) {
-    if (score >= 90) {
-        return "A";
-    } else if (score >= 80) {
-        return "B";
-    } else if (score >= 70) {
-        return "C";
-    } else if (score >= 60) {
-        return "D";
-    } else {
-        return "F";
-    }
-}
-
-// Test edge case
-console.log(calculateGrade(90));
-console.log(calculateGrade(85));
-console.log(calculateGrade(75));
-console.log(calculateGrade(65));
-console.log(calculateGrade(55));''',
-                'description': 'Find the grading system bug!'
-            }
-        ],
-        'java': [
-            {
-                'code': '''public class AgeChecker {
-    public static String checkAge(int age) {
-        if (age > 18) {
-            return "adult";
-        } else if (age > 13) {
-            return "teenager";
-        } else if (age > 0) {
-            return "child";
-        } else {
-            return "invalid";
-        }
-    }
-    
-    public static void main(String[] args) {
-        System.out.println(checkAge(25));
-        System.out.println(checkAge(16));
-        System.out.println(checkAge(8));
-        System.out.println(checkAge(18)); // Edge case!
-    }
-}''',
-                'bugs': ['Logic error: age > 18 should be age >= 18 to include 18-year-olds as adults'],
-                'fixed_code': '''public class AgeChecker {
-    public static String checkAge(int age) {
-        if (age >= 18) {
-            return "adult";
-        } else if (age >= 13) {
-            return "teenager";
-        } else if (age > 0) {
-            return "child";
-        } else {
-            return "invalid";
-        }
-    }
-    
-    public static void main(String[] args) {
-        System.out.println(checkAge(25));
-        System.out.println(checkAge(16));
-        System.out.println(checkAge(8));
-        System.out.println(checkAge(18)); // Edge case!
-    }
-}''',
-                'description': 'Fix the age classification logic!'
-            },
-            {
-                'code': '''public class NumberChecker {
-    public static String checkNumber(int num) {
-        if (num > 0) {
-            return "positive";
-        } else if (num < 0) {
-            return "negative";
-        } else {
-            return "zero";
-        }
-    }
-    
-    public static void main(String[] args) {
-        System.out.println(checkNumber(5));
-        System.out.println(checkNumber(-3));
-        System.out.println(checkNumber(0));
-    }
-}''',
-                'bugs': ['Actually works correctly - no bug present'],
-                'fixed_code': '''public class NumberChecker {
-    public static String checkNumber(int num) {
-        if (num > 0) {
-            return "positive";
-        } else if (num < 0) {
-            return "negative";
-        } else {
-            return "zero";
-        }
-    }
-    
-    public static void main(String[] args) {
-        System.out.println(checkNumber(5));
-        System.out.println(checkNumber(-3));
-        System.out.println(checkNumber(0));
-    }
-}''',
-                'description': 'Find the number classification bug!'
-            }
-        ]
-    },
-    'medium': {
-        'python': [
-            {
-                'code': '''def binary_search(arr, target):
-    left = 0
-    right = len(arr)
-    
-    while left < right:
-        mid = (left + right) // 2
-        if arr[mid] == target:
-            return mid
-        elif arr[mid] < target:
-            left = mid + 1
-        else:
-            right = mid - 1
-    
-    return -1
-
-# Test
-numbers = [1, 3, 5, 7, 9, 11]
-print(binary_search(numbers, 7))''',
-                'bugs': ['Off-by-one error: right should be len(arr) - 1, and condition should be left <= right'],
-                'fixed_code': '''def binary_search(arr, target):
-    left = 0
-    right = len(arr) - 1
-    
-    while left <= right:
-        mid = (left + right) // 2
-        if arr[mid] == target:
-            return mid
-        elif arr[mid] < target:
-            left = mid + 1
-        else:
-            right = mid - 1
-    
-    return -1
-
-# Test
-numbers = [1, 3, 5, 7, 9, 11]
-print(binary_search(numbers, 7))''',
-                'description': 'Classic off-by-one error in binary search!'
-            }
-        ],
-        'javascript': [
-            {
-                'code': '''function debounce(func, delay) {
-    let timeoutId;
-    return function() {
-        clearTimeout(timeoutId);
-        timeoutId = setTimeout(func, delay);
-    };
-}
-
-const debouncedLog = debounce(() => {
-    console.log("Hello World!");
-}, 1000);
-
-debouncedLog();''',
-                'bugs': ['Lost context - should preserve "this" and arguments'],
-                'fixed_code': '''function debounce(func, delay) {
-    let timeoutId;
-    return function(...args) {
-        const context = this;
-        clearTimeout(timeoutId);
-        timeoutId = setTimeout(() => func.apply(context, args), delay);
-    };
-}
-
-const debouncedLog = debounce(() => {
-    console.log("Hello World!");
-}, 1000);
-
-debouncedLog();''',
-                'description': 'The debounce function loses context and arguments!'
-            }
-        ],
-        'java': [
-            {
-                'code': '''public class BinarySearch {
-    public static int search(int[] arr, int target) {
-        int left = 0;
-        int right = arr.length;
-        
-        while (left < right) {
-            int mid = (left + right) / 2;
-            if (arr[mid] == target) {
-                return mid;
-            } else if (arr[mid] < target) {
-                left = mid + 1;
-            } else {
-                right = mid - 1;
-            }
-        }
-        return -1;
-    }
-    
-    public static void main(String[] args) {
-        int[] numbers = {1, 3, 5, 7, 9, 11};
-        System.out.println(search(numbers, 7));
-    }
-}''',
-                'bugs': ['Off-by-one error: right should be arr.length - 1, condition should be left <= right'],
-                'fixed_code': '''public class BinarySearch {
-    public static int search(int[] arr, int target) {
-        int left = 0;
-        int right = arr.length - 1;
-        
-        while (left <= right) {
-            int mid = (left + right) / 2;
-            if (arr[mid] == target) {
-                return mid;
-            } else if (arr[mid] < target) {
-                left = mid + 1;
-            } else {
-                right = mid - 1;
-            }
-        }
-        return -1;
-    }
-    
-    public static void main(String[] args) {
-        int[] numbers = {1, 3, 5, 7, 9, 11};
-        System.out.println(search(numbers, 7));
-    }
-}''',
-                'description': 'Classic off-by-one error in binary search!'
-            },
-            {
-                'code': '''import java.util.HashMap;
-import java.util.Map;
-
-public class Cache {
-    private Map<String, String> cache = new HashMap<>();
-    
-    public String get(String key) {
-        return cache.get(key);
-    }
-    
-    public void put(String key, String value) {
-        cache.put(key, value);
-    }
-    
-    public static void main(String[] args) {
-        Cache cache = new Cache();
-        cache.put("user1", "John");
-        System.out.println(cache.get("user1"));
-        System.out.println(cache.get("user2"));
-    }
-}''',
-                'bugs': ['No null check - get() returns null for missing keys without handling'],
-                'fixed_code': '''import java.util.HashMap;
-import java.util.Map;
+app = Flask(__name__)
 
-public class Cache {
-    private Map<String, String> cache = new HashMap<>();
-    
-    public String get(String key) {
-        String value = cache.get(key);
-        return value != null ? value : "Key not found";
-    }
-    
-    public void put(String key, String value) {
-        if (key != null && value != null) {
-            cache.put(key, value);
-        }
-    }
-    
-    public static void main(String[] args) {
-        Cache cache = new Cache();
-        cache.put("user1", "John");
-        System.out.println(cache.get("user1"));
-        System.out.println(cache.get("user2"));
-    }
-}''',
-                'description': 'Missing null checks can cause issues!'
-            }
-        ]
-    },
-    'hard': {
-        'python': [
-            {
-                'code': '''class BankAccount:
-    def __init__(self, balance=0):
-        self.balance = balance
-    
-    def withdraw(self, amount):
-        if amount <= self.balance:
-            self.balance -= amount
-            return True
-        return False
-    
-    def transfer(self, other_account, amount):
-        if self.withdraw(amount):
-            other_account.balance += amount
-            return True
-        return False
-
-# Concurrent access simulation
-account1 = BankAccount(1000)
-account2 = BankAccount(500)
-account1.transfer(account2, 600)''',
-                'bugs': ['Race condition - not thread-safe, balance can be corrupted in concurrent access'],
-                'fixed_code': '''import threading
-
-class BankAccount:
-    def __init__(self, balance=0):
-        self.balance = balance
-        self._lock = threading.Lock()
-    
-    def withdraw(self, amount):
-        with self._lock:
-            if amount <= self.balance:
-                self.balance -= amount
-                return True
-            return False
-    
-    def transfer(self, other_account, amount):
-        # Acquire locks in consistent order to prevent deadlock
-        first_lock = self._lock if id(self) < id(other_account) else other_account._lock
-        second_lock = other_account._lock if id(self) < id(other_account) else self._lock
-        
-        with first_lock:
-            with second_lock:
-                if amount <= self.balance:
-                    self.balance -= amount
-                    other_account.balance += amount
-                    return True
-                return False
-
-# Concurrent access simulation
-account1 = BankAccount(1000)
-account2 = BankAccount(500)
-account1.transfer(account2, 600)''',
-                'description': 'Race condition nightmare - find the concurrency bug!'
-            }
-        ],
-        'javascript': [
-            {
-                'code': '''async function fetchUserData(userId) {
-    const response = await fetch(`/api/users/${userId}`);
-    const userData = await response.json();
-    return userData;
-}
-
-async function processUsers(userIds) {
-    const results = [];
-    for (const userId of userIds) {
-        const userData = await fetchUserData(userId);
-        results.push(userData);
-    }
-    return results;
-}
-
-// Usage
-processUsers([1, 2, 3, 4, 5]).then(console.log);''',
-                'bugs': ['Sequential processing instead of parallel - should use Promise.all for better performance'],
-                'fixed_code': '''async function fetchUserData(userId) {
-    const response = await fetch(`/api/users/${userId}`);
-    if (!response.ok) {
-        throw new Error(`Failed to fetch user ${userId}`);
-    }
-    const userData = await response.json();
-    return userData;
-}
-
-async function processUsers(userIds) {
-    const promises = userIds.map(userId => fetchUserData(userId));
-    return await Promise.all(promises);
-}
-
-// Usage
-processUsers([1, 2, 3, 4, 5]).then(console.log);''',
-                'description': 'Performance killer - sequential instead of parallel processing!'
-            }
-        ],
-        'java': [
-            {
-                'code': '''import java.util.concurrent.ConcurrentHashMap;
-import java.util.Map;
-
-public class Counter {
-    private Map<String, Integer> counts = new ConcurrentHashMap<>();
-    
-    public void increment(String key) {
-        Integer current = counts.get(key);
-        if (current == null) {
-            counts.put(key, 1);
-        } else {
-            counts.put(key, current + 1);
-        }
-    }
-    
-    public int getCount(String key) {
-        Integer count = counts.get(key);
-        return count != null ? count : 0;
-    }
-    
-    public static void main(String[] args) {
-        Counter counter = new Counter();
-        counter.increment("clicks");
-        counter.increment("clicks");
-        System.out.println(counter.getCount("clicks"));
-    }
-}''',
-                'bugs': ['Race condition - increment operation is not atomic despite using ConcurrentHashMap'],
-                'fixed_code': '''import java.util.concurrent.ConcurrentHashMap;
-import java.util.concurrent.atomic.AtomicInteger;
-import java.util.Map;
-
-public class Counter {
-    private Map<String, AtomicInteger> counts = new ConcurrentHashMap<>();
-    
-    public void increment(String key) {
-        counts.computeIfAbsent(key, k -> new AtomicInteger(0)).incrementAndGet();
-    }
-    
-    public int getCount(String key) {
-        AtomicInteger count = counts.get(key);
-        return count != null ? count.get() : 0;
-    }
-    
-    public static void main(String[] args) {
-        Counter counter = new Counter();
-        counter.increment("clicks");
-        counter.increment("clicks");
-        System.out.println(counter.getCount("clicks"));
-    }
-}''',
-                'description': 'Race condition in concurrent counter!'
-            },
-            {
-                'code': '''import java.util.*;
-import java.util.stream.Collectors;
-
-public class DataProcessor {
-    public static List<String> processData(List<String> data) {
-        return data.stream()
-            .filter(s -> s != null)
-            .map(s -> s.toUpperCase())
-            .collect(Collectors.toList());
-    }
-    
-    public static void main(String[] args) {
-        List<String> data = Arrays.asList("hello", null, "world", "java");
-        List<String> result = processData(data);
-        
-        // Memory leak - keeping reference to large data
-        for (int i = 0; i < 1000000; i++) {
-            List<String> temp = new ArrayList<>(data);
-            temp.add("item" + i);
-        }
-        
-        System.out.println(result);
-    }
-}''',
-                'bugs': ['Memory leak - creating many temporary lists without cleanup, inefficient object creation'],
-                'fixed_code': '''import java.util.*;
-import java.util.stream.Collectors;
-
-public class DataProcessor {
-    public static List<String> processData(List<String> data) {
-        return data.stream()
-            .filter(Objects::nonNull)
-            .map(String::toUpperCase)
-            .collect(Collectors.toList());
-    }
-    
-    public static void main(String[] args) {
-        List<String> data = Arrays.asList("hello", null, "world", "java");
-        List<String> result = processData(data);
-        
-        // Fixed: Process data efficiently without memory leaks
-        System.out.println("Processed " + data.size() + " items");
-        System.out.println(result);
-    }
-}''',
-                'description': 'Memory leak and performance issues!'
-            }
-        ]
-    }
-}
+# Signs challenge tokens. Set SECRET_KEY so every worker and node shares it;
+# the random fallback only works for a single process (or a preloaded master).
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or os.urandom(32).hex()
+
+# Seconds a player has to fix the bug at each level
+TIME_LIMITS = {'easy': 60, 'medium': 90, 'hard': 120}
+
+# Extra seconds a challenge stays claimable after its time limit (auto-submit, network lag)
+CHALLENGE_GRACE_SECONDS = 15
+
+# Challenge tokens are stateless; this store only remembers which ones were already
+# submitted, until they would have expired anyway. Point CHALLENGE_STORE_URL at
+# sqlite:///path or redis://host:port/db to make tokens single-use across workers.
+# The in-memory store never forgets a live claim; past SPENT_TOKEN_CAPACITY claims
+# inside one TTL window, submissions are turned away until older claims expire.
+CHALLENGE_STORE_URL = os.environ.get('CHALLENGE_STORE_URL', 'memory://')
+spent_tokens = create_challenge_store(CHALLENGE_STORE_URL,
+                                      capacity=int(os.environ.get('SPENT_TOKEN_CAPACITY', '100000')))
+
+# Code review analysis results, keyed by a hash of the submitted code
+analysis_cache = AnalysisCache()
+
+# Largest paste /analyze accepts, and the CPU/wall-clock seconds one analysis may use
+MAX_ANALYZE_CHARS = 100_000
+ANALYZE_CPU_SECONDS = 1.0
+ANALYZE_WALL_SECONDS = 2.0
+
+# Run submissions against each challenge's tests in sandboxed worker processes.
+# Opt-in because it executes player code; challenges without tests, languages
+# without a local interpreter and a saturated queue fall back to the rule grader.
+# Optional subsystems are imported only when enabled, so workers that don't use
+# them never load them.
+execution_grader = None
+if os.environ.get('EXECUTION_GRADING') == '1':
+    from sandbox import ExecutionGrader, GraderBusy, GraderUnavailable
+    execution_grader = ExecutionGrader(workers=int(os.environ.get('EXECUTION_WORKERS', '2')))
+
+# Bug Hunt Game - code samples with intentional bugs live in JSON Lines bundles
+# under challenges/ (or CHALLENGES_PATH), indexed once, read lazily and reloaded
+# in the background when the bundles change
+CHALLENGES_PATH = os.environ.get(
+    'CHALLENGES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'challenges'))
+catalog = LiveCatalog(CHALLENGES_PATH)
+
+# Every graded match is appended here; leaderboards are aggregated from it.
+# Workers on one machine can share the file.
+match_history = MatchHistory(os.environ.get(
+    'MATCH_HISTORY_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'match_history.db')))
+
+# Longest player name kept on the leaderboard
+MAX_PLAYER_NAME = 32
+
+# Player and challenge ratings, learned from the match history, pick challenges
+# that suit each player
+ratings = Ratings()
+match_history.subscribe(ratings.apply)
+
+# Request latency, grading stages and store sizes, scraped from /metrics
+metrics = Metrics()
+request_latency = metrics.histogram('bughunt_request_duration_seconds',
+                                    'Time from request start until the response is returned',
+                                    ('endpoint', 'method', 'status'))
+submit_stages = metrics.histogram('bughunt_submit_stage_duration_seconds',
+                                  'Time spent in each stage of handling a submission', ('stage',))
+grading_rules = metrics.counter('bughunt_grading_rule_total',
+                                'Submissions graded, by grading method and the rule that decided them',
+                                ('method', 'rule'))
 
 def get_random_challenge(level, language):
     """Get a random code challenge for the specified level and language"""
-    challenges = BUG_HUNT_LEVELS.get(level, {}).get(language, [])
-    if challenges:
-        return random.choice(challenges)
-    return None
-
-def check_bug_fix(user_code, expected_fix, level):
-    """Check if user's fix is correct (simplified check)"""
-    # Remove whitespace and normalize for comparison
-    user_normalized = re.sub(r'\s+', ' ', user_code.strip().lower())
-    expected_normalized = re.sub(r'\s+', ' ', expected_fix.strip().lower())
-    
-    # For easy level, be more lenient
-    if level == 'easy':
-        # Python fixes
-        if 'age >= 0' in user_normalized:  # Age validation fix
-            return True
-        if 'is_student:' in user_normalized:  # Discount function fix
-            return True
-        
-        # JavaScript fixes  
-        if 'length >= 8' in user_normalized and 'length >= 6' in user_normalized:  # Password fix
-            return True
-        
-        # Java fixes
-        if 'age >= 18' in user_normalized:  # Age checker fix
-            return True
-        
-        # Check for "no bug" recognition
-        if 'no bug' in user_normalized or 'correct' in user_normalized or 'works fine' in user_normalized:
-            return True
+    return catalog.current.random_challenge(level, language)
+
+def pick_challenge(level, language, player):
+    """Get a challenge near the player's rating that they have not played recently"""
+    snapshot = catalog.current
+    match_history.refresh()
+    index = ratings.pick(level, language, snapshot.count(level, language), player)
+    return snapshot.get(level, language, index) if index is not None else None
+
+def resolve_challenge(catalog_version, level, language, index):
+    """Look up a challenge in the catalog version it was issued from"""
+    snapshot = catalog.snapshot(catalog_version)
+    return snapshot.get(level, language, index) if snapshot else None
+
+def check_bug_fix(user_code, challenge):
+    """Check if user's fix is correct by running its tests, or by its precompiled rules"""
+    if (execution_grader and challenge.get('tests')
+            and execution_grader.supports(challenge['language'])):
+        try:
+            result = execution_grader.grade(challenge, user_code)
+        except (GraderBusy, GraderUnavailable) as exc:
+            grading_rules.inc('execution', type(exc).__name__)
+        else:
+            grading_rules.inc('execution', 'passed' if result.passed else 'failed')
+            return result.passed
+    snapshot = catalog.snapshot(challenge['catalog_version'])
+    grader = snapshot.get_grader(challenge['level'], challenge['language'], challenge['index'])
+    rule = grader.grade(user_code)
+    grading_rules.inc('rules', rule or 'none')
+    return rule is not None
+
+# Diffs of submissions against the fix; resubmitting the same code reuses them
+submission_diffs = DiffCache(capacity=int(os.environ.get('DIFF_CACHE_SIZE', '1024')))
+
+def grade_submission(job):
+    """Grade one queued submission and build the result shown to the player"""
+    submit_stages.observe(time.perf_counter() - job['queued_at'], 'queue_wait')
+    with submit_stages.time('lookup'):
+        challenge = resolve_challenge(job['catalog_version'], job['level'], job['language'], job['index'])
+    if not challenge:
+        raise LookupError('Challenge not found or expired')
     
-    # Medium level specific fixes
-    if level == 'medium':
-        # Binary search fixes
-        if 'right = len(arr) - 1' in user_normalized and 'left <= right' in user_normalized:
-            return True
-        if 'right = arr.length - 1' in user_normalized and 'left <= right' in user_normalized:
-            return True
-        # Debounce fixes
-        if '...args' in user_normalized and 'func.apply' in user_normalized:
-            return True
-        # Cache/null fixes
-        if '!= null' in user_normalized or 'null check' in user_normalized:
-            return True
+    level = job['level']
+    ai_time = job['ai_time']
+    user_time = job['user_time']
+    time_limit = TIME_LIMITS.get(level, 60)
     
-    # Hard level specific fixes  
-    if level == 'hard':
-        # Concurrency fixes
-        if 'atomicinteger' in user_normalized or 'computeifabsent' in user_normalized:
-            return True
-        if 'synchronized' in user_normalized or 'lock' in user_normalized:
-            return True
-        # Promise.all fixes
-        if 'promise.all' in user_normalized:
-            return True
-        # Memory leak fixes
-        if 'objects::nonnull' in user_normalized or 'string::touppercase' in user_normalized:
-            return True
+    # Check if user's fix is correct
+    with submit_stages.time('check_bug_fix'):
+        is_correct = check_bug_fix(job['user_code'], challenge)
     
-    # For all levels, check similarity with more lenient thresholds
-    if level == 'easy':
-        similarity_threshold = 0.3  # Very lenient for easy
-    elif level == 'medium':
-        similarity_threshold = 0.5  # More lenient for medium
+    if is_correct and user_time < time_limit:
+        if user_time < ai_time:
+            winner = 'human'
+            message = f'🎉 HUMAN WINS! You fixed the bug in {user_time:.1f} seconds! The AI took {ai_time:.1f} seconds.'
+        else:
+            winner = 'ai'
+            message = f'🤖 AI WINS! The AI found the bug in {ai_time:.1f} seconds. You took {user_time:.1f} seconds.'
+    elif is_correct:
+        winner = 'ai'
+        message = f'⏰ TIME\'S UP! You found the bug but took too long. AI wins with {ai_time:.1f} seconds!'
     else:
-        similarity_threshold = 0.6  # More lenient for hard
+        winner = 'ai'
+        message = f'🤖 AI WINS! The AI found the bug in {ai_time:.1f} seconds. Better luck next time!'
+    
+    match_history.record(Match(time.time(), job['player'], level, job['language'], challenge['id'],
+                               winner, is_correct, user_time, ai_time))
     
-    # Simple similarity check (in real app, use more sophisticated comparison)
-    common_words = set(user_normalized.split()) & set(expected_normalized.split())
-    similarity = len(common_words) / max(len(expected_normalized.split()), 1)
+    # What the player would still have to change to reach the fix
+    with submit_stages.time('diff'):
+        your_diff = submission_diffs.diff((challenge['catalog_version'], challenge['id']),
+                                          job['user_code'], challenge['fixed_code'])
     
-    return similarity >= similarity_threshold
+    return {
+        'winner': winner,
+        'message': message,
+        'is_correct': is_correct,
+        'user_time': user_time,
+        'ai_time': ai_time,
+        'correct_fix': challenge['fixed_code'],
+        'correct_fix_html': challenge['fixed_html'],
+        'fix_diff': challenge['fix_diff'],
+        'your_diff': your_diff,
+        'bugs_found': challenge['bugs']
+    }
+
+def run_submission_job(job):
+    """Queue handler: grade a submission and report it to its room, if any"""
+    try:
+        result = grade_submission(job)
+    except Exception:
+        if job.get('room_id'):
+            # A room only finishes once every player has a result
+            room_hub.report(job['room_id'], job['player_id'],
+                            {'is_correct': False, 'user_time': job['user_time'], 'winner': 'ai'})
+        raise
+    if job.get('room_id'):
+        room_hub.report(job['room_id'], job['player_id'], result)
+    return result
+
+# /submit-fix only queues work; grading happens on this pool. Results live in a
+# store under the same CHALLENGE_STORE_URL so any worker can answer a poll.
+submission_queue = SubmissionQueue(
+    run_submission_job,
+    create_challenge_store(CHALLENGE_STORE_URL, namespace='submission'),
+    workers=int(os.environ.get('SUBMISSION_WORKERS', '4')),
+    capacity=int(os.environ.get('SUBMISSION_QUEUE_SIZE', '64')),
+    per_client=int(os.environ.get('SUBMISSION_QUEUE_PER_CLIENT', '4')))
+
+# Longest a /submit-events stream stays open before the page falls back to polling
+SUBMISSION_EVENTS_SECONDS = 30
+
+# Expires issued challenges once their time limit and grace period have passed,
+# on the server's monotonic clock
+challenge_clock = TimerWheel()
+
+# Whether this worker expires the challenges it issues; see configure_workers
+SERVER_EXPIRY = True
+
+def configure_workers(workers):
+    """Turn server-side expiry off when sibling workers cannot see this one's claims.
+
+    With a per-process memory:// store, a challenge submitted to another worker
+    is still unclaimed here, so the timer would record a time-out as well.
+    """
+    global SERVER_EXPIRY
+    SERVER_EXPIRY = workers <= 1 or not CHALLENGE_STORE_URL.startswith('memory://')
+    if not SERVER_EXPIRY:
+        app.logger.warning('Server-side challenge expiry is off: %d workers share no challenge store; '
+                           'set CHALLENGE_STORE_URL to sqlite:// or redis://', workers)
+    return SERVER_EXPIRY
+
+configure_workers(int(os.environ.get('WEB_CONCURRENCY', '1')))
+
+def expire_challenge(nonce, catalog_version, level, language, index, ai_time, player):
+    """Timer callback: record a time-out for a challenge that was never submitted"""
+    # Claiming the token first makes a submission racing the deadline lose cleanly
+    try:
+        if not spent_tokens.claim(nonce, CHALLENGE_GRACE_SECONDS):
+            return
+    except StoreFull:
+        # Unclaimed, the token can still be submitted until it expires
+        return
+    challenge = resolve_challenge(catalog_version, level, language, index)
+    if not challenge:
+        return
+    time_limit = TIME_LIMITS.get(level, 60)
+    match_history.record(Match(time.time(), player, level, language, challenge['id'],
+                               'ai', False, float(time_limit), ai_time))
+    submission_queue.publish(f'expired-{nonce}', {'status': 'done', 'result': {
+        'winner': 'ai',
+        'message': f'⏰ TIME\'S UP! The AI found the bug in {ai_time:.1f} seconds. Better luck next time!',
+        'is_correct': False,
+        'user_time': float(time_limit),
+        'ai_time': ai_time,
+        'correct_fix': challenge['fixed_code'],
+        'correct_fix_html': challenge['fixed_html'],
+        'fix_diff': challenge['fix_diff'],
+        'bugs_found': challenge['bugs']
+    }})
+
+# Multiplayer rooms live in this process; events are fanned out from one asyncio loop
+room_hub = RoomHub(capacity=int(os.environ.get('ROOM_CAPACITY', '5000')))
+
+# Seconds between keep-alive comments on an idle room event stream
+ROOM_KEEPALIVE_SECONDS = 15
+
+metrics.gauge('bughunt_spent_tokens', 'Challenge tokens remembered as already submitted',
+              lambda: len(spent_tokens))
+if hasattr(spent_tokens, 'expired_evictions'):
+    metrics.gauge('bughunt_spent_token_evictions_total',
+                  'Spent tokens dropped from the in-memory store, by reason',
+                  lambda: [(('expired',), spent_tokens.expired_evictions),
+                           (('capacity',), spent_tokens.capacity_evictions)],
+                  labelnames=('reason',), kind='counter')
+    metrics.gauge('bughunt_spent_token_rejections_total',
+                  'Submissions turned away because the spent-token store was full of live claims',
+                  lambda: spent_tokens.rejected_claims, kind='counter')
+metrics.gauge('bughunt_live_challenges', 'Issued challenges waiting to be submitted or to time out',
+              lambda: len(challenge_clock))
+metrics.gauge('bughunt_rooms', 'Multiplayer rooms open in this process', lambda: len(room_hub))
+metrics.gauge('bughunt_submission_queue_depth', 'Submissions waiting to be graded in this process',
+              lambda: len(submission_queue))
+metrics.gauge('bughunt_process_memory_bytes', 'Memory used by this worker process, by kind',
+              lambda: [((kind,), value) for kind, value in process_memory().items()],
+              labelnames=('kind',))
+metrics.gauge('bughunt_submission_rejected_total', 'Submissions turned away because the queue was full',
+              lambda: submission_queue.rejected, kind='counter')
 
 def simulate_ai_time(level):
     """Simulate realistic AI processing time based on difficulty"""
@@ -736,103 +289,483 @@ def simulate_ai_time(level):
     variation = random.uniform(0.8, 1.2)
     return base_times[level] * variation
 
+# AI opponent mode: the AI really attempts each challenge and its measured time is
+# used. AI_OPPONENT_URL points at an inference server (see ai_opponent.py);
+# AI_OPPONENT=mock uses the deterministic stand-in. Otherwise times are simulated.
+ai_opponent = None
+if os.environ.get('AI_OPPONENT_URL'):
+    from ai_opponent import AIOpponent, HTTPSolver
+    AI_OPPONENT_TIMEOUT = float(os.environ.get('AI_OPPONENT_TIMEOUT', '10'))
+    ai_opponent = AIOpponent(HTTPSolver(os.environ['AI_OPPONENT_URL'], timeout=AI_OPPONENT_TIMEOUT),
+                             timeout=AI_OPPONENT_TIMEOUT)
+elif os.environ.get('AI_OPPONENT') == 'mock':
+    from ai_opponent import AIOpponent, MockSolver
+    ai_opponent = AIOpponent(MockSolver())
+
+# Seconds between checks for a reloaded catalog whose challenges the AI has not seen
+AI_PREWARM_INTERVAL = 2.0
+
+_prewarm_pid = None
+_prewarm_lock = threading.Lock()
+
+def prewarm_ai_opponent():
+    """Start solving the catalog in the background, once per process"""
+    # Threads don't survive fork, so each worker process starts its own
+    global _prewarm_pid
+    if ai_opponent is None or _prewarm_pid == os.getpid():
+        return
+    with _prewarm_lock:
+        if _prewarm_pid == os.getpid():
+            return
+        _prewarm_pid = os.getpid()
+        threading.Thread(target=_prewarm_forever, name='ai-opponent-prewarm', daemon=True).start()
+
+def _prewarm_forever():
+    # Hands the solver every challenge of the current catalog, and again after each reload
+    version = None
+    while True:
+        snapshot = catalog.current
+        if snapshot.version != version:
+            version = snapshot.version
+            try:
+                ai_opponent.prewarm(snapshot.challenges())
+            except Exception:
+                app.logger.exception('AI opponent prewarm failed')
+        time.sleep(AI_PREWARM_INTERVAL)
+
+def opponent_ai_time(challenge):
+    """The AI's time for a challenge: measured by the AI opponent if enabled, else simulated.
+
+    Never waits on the solver. Challenges are solved in the background ahead
+    of play; one it has not answered yet (or cannot answer) is simulated.
+    """
+    if ai_opponent is not None:
+        prewarm_ai_opponent()
+        result = ai_opponent.peek(challenge)
+        if result is None:
+            # Keep the game playable when the model is down, slow or still warming up
+            return simulate_ai_time(challenge['level'])
+        snapshot = catalog.snapshot(challenge['catalog_version'])
+        grader = snapshot.get_grader(challenge['level'], challenge['language'], challenge['index'])
+        if grader.grade(result.fixed_code) is None:
+            # A wrong fix means the AI never finishes within the time limit
+            return float(TIME_LIMITS.get(challenge['level'], 60))
+        return result.solve_time
+    return simulate_ai_time(challenge['level'])
+
+# Per-client request quotas by endpoint, e.g. RATE_LIMITS="get_challenge=30/60,analyze=off".
+# RATE_LIMIT_URL=sqlite:///path/limits.db shares the buckets between local workers.
+RATE_LIMITS = parse_quotas(os.environ.get('RATE_LIMITS', ''), {
+    'get_challenge': Quota(rate=1.0, burst=20),
+    'submit_fix': Quota(rate=0.5, burst=10),
+})
+rate_limiter = create_rate_limiter(os.environ.get('RATE_LIMIT_URL', 'memory://'))
+rate_limited = metrics.counter('bughunt_rate_limited_total',
+                               'Requests turned away by the per-client rate limiter', ('endpoint',))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.before_request
+def enforce_rate_limit():
+    quota = RATE_LIMITS.get(request.endpoint)
+    if quota is None:
+        return None
+    try:
+        rate_limiter.acquire(f'{request.endpoint}:{request.remote_addr}', quota)
+    except RateLimited as exc:
+        rate_limited.inc(request.endpoint)
+        return jsonify({'error': 'Too many requests, slow down'}), 429, {'Retry-After': str(exc.retry_after)}
+    return None
+
+@app.after_request
+def record_request_latency(response):
+    # Streamed responses are timed until their headers are ready
+    started = g.pop('request_started', None)
+    if started is not None:
+        request_latency.observe(time.perf_counter() - started, request.endpoint or 'unmatched',
+                                request.method, response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4',
+                    headers={'Cache-Control': 'no-store'})
+
+# CSS and Prism bundles built by build_assets.py; until they are built the
+# pages load Tailwind and Prism from their CDNs
+assets = AssetManifest(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'dist'))
+app.jinja_env.globals['asset_url'] = assets.url
+
+# The HTML pages have no per-request data: each is rendered once and served
+# from memory, precompressed and with ETags. The debug server re-renders them
+# on every hit so template edits show up.
+PAGES = ('index.html', 'game.html', 'learn.html', 'how_it_works.html', 'review.html', 'room.html')
+static_pages = StaticPages(render_template, max_age=int(os.environ.get('PAGE_MAX_AGE', '300')))
+with app.app_context():
+    try:
+        static_pages.prerender(PAGES)
+    except TemplateNotFound:
+        # Rendered on first request instead
+        pass
+
+def serve_page(name):
+    return static_pages.response(name, request, reload=app.debug)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    return assets.send(filename, request)
+
 @app.route('/')
 def home():
-    return render_template('index.html')
+    return serve_page('index.html')
 
 @app.route('/game')
 def game_page():
-    return render_template('game.html')
+    return serve_page('game.html')
 
 @app.route('/learn')
 def learn_page():
-    return render_template('learn.html')
+    return serve_page('learn.html')
 
 @app.route('/how-it-works')
 def how_it_works():
-    return render_template('how_it_works.html')
+    return serve_page('how_it_works.html')
+
+@app.route('/review')
+def review_page():
+    return serve_page('review.html')
+
+@app.route('/room')
+def room_page():
+    return serve_page('room.html')
+
+@app.route('/analyze', methods=['POST'])
+def analyze_code():
+    data = request.get_json(silent=True) or {}
+    code = data.get('code', '')
+    language = data.get('language', 'python')
+    
+    if not isinstance(code, str) or not code.strip():
+        return jsonify({'error': 'Please enter some code to analyze'}), 400
+    if language not in SUPPORTED_LANGUAGES:
+        return jsonify({'error': f'Unsupported language: {language}'}), 400
+    if len(code) > MAX_ANALYZE_CHARS:
+        return jsonify({'error': f'Code is too long to analyze (max {MAX_ANALYZE_CHARS} characters)'}), 413
+    
+    def generate():
+        # One JSON object per line so the page can render findings as they arrive
+        yield json.dumps({'type': 'start', 'code': code, 'language': language}) + '\n'
+        for event in analysis_cache.stream(code, language, cpu_seconds=ANALYZE_CPU_SECONDS,
+                                           wall_seconds=ANALYZE_WALL_SECONDS):
+            yield json.dumps(event) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
 
 @app.route('/get-challenge', methods=['POST'])
 def get_challenge():
     data = request.get_json()
     level = data.get('level', 'easy')
     language = data.get('language', 'python')
+    player = player_name(data)
     
-    challenge = get_random_challenge(level, language)
+    challenge = pick_challenge(level, language, player)
     if not challenge:
         return jsonify({'error': 'No challenges available for this level/language'}), 400
     
-    ai_time = simulate_ai_time(level)
-    time_limits = {'easy': 60, 'medium': 90, 'hard': 120}
-    time_limit = time_limits.get(level, 60)
-    
-    # Generate unique challenge ID and store the challenge
-    challenge_id = random.randint(1000, 9999)
-    active_challenges[challenge_id] = challenge
-    
-    return jsonify({
-        'code': challenge['code'],
-        'description': challenge['description'],
-        'bugs': challenge['bugs'],
-        'hint': challenge.get('hint', ''),
-        'level': level,
-        'language': language,
-        'ai_time': ai_time,
-        'time_limit': time_limit,
-        'challenge_id': challenge_id
-    })
+    # Rounded to the precision the token can carry
+    ai_time = round(opponent_ai_time(challenge), 2)
+    time_limit = TIME_LIMITS.get(level, 60)
+    
+    # The signed token identifies the challenge and records when it was issued
+    nonce = os.urandom(8)
+    challenge_id = issue_token(app.config['SECRET_KEY'].encode(), challenge['catalog_version'],
+                               level, language, challenge['index'], ai_time, nonce=nonce)
+    
+    # The server, not the page, decides when time is up. The grace period stays
+    # open for a late submission; the timer only fires once it has passed too.
+    if SERVER_EXPIRY:
+        challenge_clock.schedule(nonce.hex(), time_limit + CHALLENGE_GRACE_SECONDS, expire_challenge,
+                                 nonce.hex(), challenge['catalog_version'], level, language,
+                                 challenge['index'], ai_time, player)
+    
+    # The static part of the body was serialized when the challenge was loaded
+    payload = catalog.snapshot(challenge['catalog_version']).get_payload(
+        level, language, challenge['index'])
+    if request.accept_encodings['gzip']:
+        response = Response(payload.render_gzip(ai_time, time_limit, challenge_id),
+                            mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(payload.render(ai_time, time_limit, challenge_id),
+                            mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
 @app.route('/submit-fix', methods=['POST'])
 def submit_fix():
     data = request.get_json()
     user_code = data.get('user_code', '')
+    challenge_id = data.get('challenge_id')
+    player = player_name(data)
+    if not isinstance(user_code, str):
+        # Checked before the token is spent, so a malformed request costs nothing
+        return jsonify({'error': 'user_code must be a string'}), 400
+    
+    # Resolve the exact challenge that was played from its signed token
+    with submit_stages.time('verify'):
+        try:
+            token = verify_token(app.config['SECRET_KEY'].encode(), challenge_id)
+        except InvalidToken:
+            token = None
+    if token is None:
+        return jsonify({'error': 'Challenge not found or expired'}), 400
+    with submit_stages.time('lookup'):
+        challenge = resolve_challenge(token.catalog_version, token.level, token.language, token.index)
+    
+    # Elapsed time comes from the server's issue time, never from the client
+    level = token.level
+    ai_time = token.ai_time
+    time_limit = TIME_LIMITS.get(level, 60)
+    user_time = max(0.0, time.time() - token.issued_at)
+    expires_in = time_limit + CHALLENGE_GRACE_SECONDS - user_time
+    
+    # Each token can be submitted once while it is still live
+    if not challenge or expires_in <= 0:
+        return jsonify({'error': 'Challenge not found or expired'}), 400
+    try:
+        with submit_stages.time('claim'):
+            claimed = spent_tokens.claim(token.nonce, expires_in)
+    except StoreFull as exc:
+        # The token is still unspent, so the player can submit it again
+        return jsonify({'error': str(exc)}), 503, {'Retry-After': str(exc.retry_after)}
+    if not claimed:
+        return jsonify({'error': 'Challenge not found or expired'}), 400
+    challenge_clock.cancel(token.nonce)
+    
+    job = {'catalog_version': token.catalog_version, 'level': level, 'language': token.language,
+           'index': token.index, 'ai_time': ai_time, 'user_time': user_time, 'user_code': user_code,
+           'player': player, 'queued_at': time.perf_counter()}
+    try:
+        with submit_stages.time('enqueue'):
+            job_id = submission_queue.submit(request.remote_addr, job)
+    except QueueFull as exc:
+        # Nothing was graded, so the player may submit the same challenge again
+        spent_tokens.pop(token.nonce)
+        status = 429 if isinstance(exc, ClientQueueFull) else 503
+        return jsonify({'error': str(exc)}), status, {'Retry-After': str(exc.retry_after)}
+    
+    with submit_stages.time('serialize'):
+        response = jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'poll_url': f'/submit-result/{job_id}',
+            'events_url': f'/submit-events/{job_id}'
+        })
+    return response, 202
+
+@app.route('/challenge-events/<challenge_id>')
+def challenge_events(challenge_id):
+    try:
+        token = verify_token(app.config['SECRET_KEY'].encode(), challenge_id)
+    except InvalidToken:
+        return jsonify({'error': 'Challenge not found or expired'}), 404
+    deadline = token.issued_at + TIME_LIMITS.get(token.level, 60) + CHALLENGE_GRACE_SECONDS
+    
+    def generate():
+        # Pushes the time-out result when the server expires the challenge. A
+        # timer on another worker is picked up from the store just after the deadline.
+        job_id = f'expired-{token.nonce}'
+        while SERVER_EXPIRY:
+            remaining = deadline - time.time()
+            record = submission_queue.wait_published(job_id, max(0.0, min(remaining + 1.0, 15.0)))
+            if record is not None:
+                yield f'event: expired\ndata: {json.dumps(record)}\n\n'
+                return
+            if remaining + 1.0 <= 0:
+                # Submitted before the deadline; the submission's own result applies
+                break
+            yield ': keep-alive\n\n'
+        yield 'event: closed\ndata: {}\n\n'
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+@app.route('/submit-result/<job_id>')
+def submit_result(job_id):
+    record = submission_queue.status(job_id)
+    if record is None:
+        return jsonify({'error': 'Submission not found or expired'}), 404
+    if record['status'] in ('queued', 'running'):
+        return jsonify(record), 202, {'Retry-After': '1', 'Cache-Control': 'no-store'}
+    return jsonify(record), 200, {'Cache-Control': 'no-store'}
+
+@app.route('/submit-events/<job_id>')
+def submit_events(job_id):
+    if submission_queue.status(job_id) is None:
+        return jsonify({'error': 'Submission not found or expired'}), 404
+    
+    def generate():
+        # Server-Sent Events: state changes as 'status', the final record as 'result'
+        deadline = time.monotonic() + SUBMISSION_EVENTS_SECONDS
+        last = None
+        while time.monotonic() < deadline:
+            record = submission_queue.wait(job_id, min(5.0, deadline - time.monotonic()))
+            if record is None:
+                break
+            if record['status'] in ('done', 'error'):
+                yield f'event: result\ndata: {json.dumps(record)}\n\n'
+                return
+            if record['status'] != last:
+                last = record['status']
+                yield f'event: status\ndata: {json.dumps(record)}\n\n'
+            else:
+                # Keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+def player_name(data):
+    """Display name from a request body, trimmed to the leaderboard's limit"""
+    name = data.get('player')
+    name = name.strip()[:MAX_PLAYER_NAME] if isinstance(name, str) else ''
+    return name or 'Anonymous'
+
+def room_error(exc):
+    status = 404 if isinstance(exc, RoomNotFound) else 503 if isinstance(exc, RoomsFull) else 409
+    return jsonify({'error': str(exc)}), status
+
+@app.route('/rooms', methods=['POST'])
+def create_room():
+    data = request.get_json(silent=True) or {}
     level = data.get('level', 'easy')
     language = data.get('language', 'python')
-    user_time = data.get('user_time', 20)
-    challenge_id = data.get('challenge_id')
+    if level not in LEVELS or language not in LANGUAGES:
+        return jsonify({'error': 'Unknown level or language'}), 400
     
-    # Get the exact challenge that was played
-    challenge = active_challenges.get(challenge_id)
+    challenge = get_random_challenge(level, language)
     if not challenge:
-        return jsonify({'error': 'Challenge not found or expired'}), 400
-    
-    # Check if user's fix is correct
-    is_correct = check_bug_fix(user_code, challenge['fixed_code'], level)
-    
-    # Simulate AI time
-    ai_time = simulate_ai_time(level)
-    
-    # Determine winner with level-based time limits
-    time_limits = {'easy': 60, 'medium': 90, 'hard': 120}
-    time_limit = time_limits.get(level, 60)
-    
-    if is_correct and user_time < time_limit:
-        if user_time < ai_time:
-            winner = 'human'
-            message = f'🎉 HUMAN WINS! You fixed the bug in {user_time:.1f} seconds! The AI took {ai_time:.1f} seconds.'
-        else:
-            winner = 'ai'
-            message = f'🤖 AI WINS! The AI found the bug in {ai_time:.1f} seconds. You took {user_time:.1f} seconds.'
-    elif is_correct:
-        winner = 'ai'
-        message = f'⏰ TIME\'S UP! You found the bug but took too long. AI wins with {ai_time:.1f} seconds!'
-    else:
-        winner = 'ai'
-        message = f'🤖 AI WINS! The AI found the bug in {ai_time:.1f} seconds. Better luck next time!'
-    
-    # Clean up the used challenge
-    if challenge_id in active_challenges:
-        del active_challenges[challenge_id]
-    
+        return jsonify({'error': 'No challenges available for this level/language'}), 400
+    public = {key: challenge.get(key, '') for key in ('code', 'description', 'bugs', 'hint')}
+    try:
+        room, player_id = room_hub.create(level, language, public,
+                                          (challenge['catalog_version'], challenge['index']),
+                                          round(opponent_ai_time(challenge), 2), TIME_LIMITS.get(level, 60),
+                                          player_name(data))
+    except RoomError as exc:
+        return room_error(exc)
+    return jsonify({'room_id': room.id, 'player_id': player_id,
+                    'events_url': f'/rooms/{room.id}/events'}), 201
+
+@app.route('/rooms/<room_id>/join', methods=['POST'])
+def join_room(room_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        room, player_id = room_hub.join(room_id, player_name(data))
+    except RoomError as exc:
+        return room_error(exc)
+    return jsonify({'room_id': room.id, 'player_id': player_id,
+                    'events_url': f'/rooms/{room.id}/events'})
+
+@app.route('/rooms/<room_id>/start', methods=['POST'])
+def start_room(room_id):
+    data = request.get_json(silent=True) or {}
+    try:
+        room_hub.start(room_id, data.get('player_id'))
+    except RoomError as exc:
+        return room_error(exc)
+    return jsonify({'room_id': room_id, 'state': 'countdown'})
+
+@app.route('/rooms/<room_id>/submit', methods=['POST'])
+def submit_room(room_id):
+    data = request.get_json(silent=True) or {}
+    user_code = data.get('user_code', '')
+    player_id = data.get('player_id')
+    try:
+        room, user_time = room_hub.submit(room_id, player_id)
+    except RoomError as exc:
+        return room_error(exc)
+    
+    catalog_version, index = room.source
+    job = {'catalog_version': catalog_version, 'level': room.level, 'language': room.language,
+           'index': index, 'ai_time': room.ai_time, 'user_time': user_time,
+           'user_code': user_code if isinstance(user_code, str) else '',
+           'player': room.players[player_id].name, 'room_id': room.id, 'player_id': player_id,
+           'queued_at': time.perf_counter()}
+    try:
+        job_id = submission_queue.submit(request.remote_addr, job)
+    except QueueFull as exc:
+        # The submission is recorded; count it as a miss rather than leave the room hanging
+        room_hub.report(room.id, player_id, {'is_correct': False, 'user_time': user_time, 'winner': 'ai'})
+        return jsonify({'error': str(exc)}), 503, {'Retry-After': str(exc.retry_after)}
+    return jsonify({'job_id': job_id, 'status': 'queued', 'poll_url': f'/submit-result/{job_id}'}), 202
+
+@app.route('/rooms/<room_id>/events')
+def room_events(room_id):
+    try:
+        subscription = room_hub.subscribe(room_id)
+    except RoomError as exc:
+        return room_error(exc)
+    
+    def generate():
+        # Server-Sent Events, named by event type; a snapshot of the room comes first
+        try:
+            while True:
+                event = subscription.get(ROOM_KEEPALIVE_SECONDS)
+                if event is None:
+                    if subscription.closed:
+                        return
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f'event: {event["type"]}\ndata: {json.dumps(event)}\n\n'
+                if event['type'] == 'finished':
+                    return
+        finally:
+            subscription.close()
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+@app.route('/leaderboard')
+def leaderboard():
+    level = request.args.get('level', 'easy')
+    language = request.args.get('language', 'python')
+    if level not in LEVELS or language not in LANGUAGES:
+        return jsonify({'error': 'Unknown level or language'}), 400
+    limit = request.args.get('limit', match_history.top_n, type=int)
     return jsonify({
-        'winner': winner,
-        'message': message,
-        'is_correct': is_correct,
-        'user_time': user_time,
-        'ai_time': ai_time,
-        'correct_fix': challenge['fixed_code'],
-        'bugs_found': challenge['bugs']
+        'level': level,
+        'language': language,
+        'fastest_wins': match_history.leaderboard(level, language, max(1, min(limit, match_history.top_n)))
     })
 
+@app.route('/rating')
+def rating():
+    player = player_name(request.args)
+    match_history.refresh()
+    return jsonify({'player': player, **ratings.player_rating(player)})
+
+@app.route('/stats')
+def stats():
+    level = request.args.get('level', 'easy')
+    language = request.args.get('language', 'python')
+    if level not in LEVELS or language not in LANGUAGES:
+        return jsonify({'error': 'Unknown level or language'}), 400
+    return jsonify(match_history.bucket_stats(level, language))
+
+def preload():
+    """Build the state every worker reads before forking them; returns the challenges loaded.
+
+    gunicorn.conf.py calls this in the master so the parsed catalog, compiled
+    graders and folded-in match history are shared copy-on-write.
+    """
+    loaded = catalog.preload()
+    match_history.refresh()
+    return loaded
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,338 @@
+"""ASGI entry point: the game served from an asyncio event loop.
+
+The event streams a game keeps open (``/submit-events``, ``/challenge-events``
+and ``/rooms/<room_id>/events``) are coroutines on the loop, so an idle
+connection costs a socket and a few objects instead of a thread. Every other
+route runs through the Flask app on a bounded thread pool, with the same
+request hooks, rate limits and metrics as under WSGI. Grading never runs on
+the loop: submissions go to the submission queue's worker threads as before,
+and a stream waiting on one is woken by the queue.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+    hypercorn asgi:application --bind 0.0.0.0:8000
+    python asgi.py                  # uvicorn, configured from the environment
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+
+import app as bughunt
+from challenge_tokens import InvalidToken, verify_token
+from rate_limit import RateLimited
+from rooms import RoomError, RoomNotFound, RoomsFull
+
+# Threads running Flask routes; only the short request/response routes use them
+WSGI_THREADS = int(os.environ.get('ASGI_THREADS', '32'))
+
+# Largest request body read into memory before it is handed to Flask
+MAX_BODY_BYTES = 1024 * 1024
+
+_SSE_HEADERS = [(b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-store'), (b'x-accel-buffering', b'no')]
+
+_executor = ThreadPoolExecutor(WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+_routes = bughunt.app.url_map.bind('localhost')
+
+
+class _Exchange:
+    """One HTTP request handled on the loop, timed like a Flask request"""
+
+    def __init__(self, scope, receive, send, endpoint):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+
+    async def start(self, status, headers):
+        await self.send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        bughunt.request_latency.observe(time.perf_counter() - self.started, self.endpoint,
+                                        self.scope['method'], status)
+
+    async def json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode()
+        await self.start(status, [(b'content-type', b'application/json'),
+                                  (b'content-length', str(len(body)).encode()), *headers])
+        await self.send({'type': 'http.response.body', 'body': body})
+
+    async def stream(self, events):
+        """Send an async iterator of Server-Sent Events until it ends or the client leaves"""
+        await self.start(200, _SSE_HEADERS)
+        pump = asyncio.ensure_future(self._pump(events))
+        gone = asyncio.ensure_future(self._disconnected())
+        try:
+            await asyncio.wait((pump, gone), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            pump.cancel()
+            gone.cancel()
+        # A closed generator runs its cleanup (room subscriptions) before this returns
+        error, _ = await asyncio.gather(pump, gone, return_exceptions=True)
+        if isinstance(error, Exception):
+            raise error
+
+    async def _pump(self, events):
+        async for event in events:
+            await self.send({'type': 'http.response.body', 'body': event.encode(), 'more_body': True})
+        await self.send({'type': 'http.response.body', 'body': b''})
+
+    async def _disconnected(self):
+        while (await self.receive())['type'] != 'http.disconnect':
+            pass
+
+
+async def submit_events(exchange, job_id):
+    queue = bughunt.submission_queue
+    if queue.status(job_id) is None:
+        return await exchange.json(404, {'error': 'Submission not found or expired'})
+
+    async def generate():
+        # Same events as the Flask route: state changes as 'status', the final record as 'result'
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + bughunt.SUBMISSION_EVENTS_SECONDS
+        last = None
+        while loop.time() < deadline:
+            record = await queue.wait_async(job_id, min(5.0, deadline - loop.time()))
+            if record is None:
+                break
+            if record['status'] in ('done', 'error'):
+                yield f'event: result\ndata: {json.dumps(record)}\n\n'
+                return
+            if record['status'] != last:
+                last = record['status']
+                yield f'event: status\ndata: {json.dumps(record)}\n\n'
+            else:
+                yield ': keep-alive\n\n'
+
+    await exchange.stream(generate())
+
+
+async def challenge_events(exchange, challenge_id):
+    try:
+        token = verify_token(bughunt.app.config['SECRET_KEY'].encode(), challenge_id)
+    except InvalidToken:
+        return await exchange.json(404, {'error': 'Challenge not found or expired'})
+    deadline = token.issued_at + bughunt.TIME_LIMITS.get(token.level, 60) + bughunt.CHALLENGE_GRACE_SECONDS
+
+    async def generate():
+        job_id = f'expired-{token.nonce}'
+        while bughunt.SERVER_EXPIRY:
+            remaining = deadline - time.time()
+            record = await bughunt.submission_queue.wait_published_async(
+                job_id, max(0.0, min(remaining + 1.0, 15.0)))
+            if record is not None:
+                yield f'event: expired\ndata: {json.dumps(record)}\n\n'
+                return
+            if remaining + 1.0 <= 0:
+                break
+            yield ': keep-alive\n\n'
+        yield 'event: closed\ndata: {}\n\n'
+
+    await exchange.stream(generate())
+
+
+async def room_events(exchange, room_id):
+    hub = bughunt.room_hub
+    loop = asyncio.get_running_loop()
+    try:
+        # A short hop to the hub's loop; the room lock is never taken on this one
+        subscription = await loop.run_in_executor(_executor, hub.subscribe, room_id)
+    except RoomError as exc:
+        status = 404 if isinstance(exc, RoomNotFound) else 503 if isinstance(exc, RoomsFull) else 409
+        return await exchange.json(status, {'error': str(exc)})
+
+    async def generate():
+        try:
+            while True:
+                # Events are queued on the hub's own loop; wait there without a thread
+                event = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(
+                    subscription.aget(bughunt.ROOM_KEEPALIVE_SECONDS), hub.loop()))
+                if event is None:
+                    if subscription.closed:
+                        return
+                    yield ': keep-alive\n\n'
+                    continue
+                yield f'event: {event["type"]}\ndata: {json.dumps(event)}\n\n'
+                if event['type'] == 'finished':
+                    return
+        finally:
+            subscription.close()
+
+    await exchange.stream(generate())
+
+
+# Flask endpoints served natively on the loop instead of through the thread pool
+STREAMS = {
+    'submit_events': submit_events,
+    'challenge_events': challenge_events,
+    'room_events': room_events,
+}
+
+
+def _app_path(scope):
+    # Servers mounted under a prefix include it in 'path'; Flask's routes do not
+    root = scope.get('root_path', '')
+    path = scope['path']
+    if root and path.startswith(root):
+        return path[len(root):] or '/'
+    return path
+
+
+def _environ(scope, body):
+    root = scope.get('root_path', '')
+    path = _app_path(scope)
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root.encode().decode('latin-1'),
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0] if client else '',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-length':
+            continue
+        key = 'CONTENT_TYPE' if name == 'content-type' else 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _run_wsgi(environ, loop, send):
+    # Runs on a pool thread; each send is handed to the loop and waited for
+    def deliver(*messages):
+        async def deliver_all():
+            for message in messages:
+                await send(message)
+        asyncio.run_coroutine_threadsafe(deliver_all(), loop).result()
+
+    head = []
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and head and head[0] is None:
+            raise exc_info[1].with_traceback(exc_info[2])
+        head[:] = [{'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                for name, value in headers]}]
+
+    iterable = bughunt.app(environ, start_response)
+    try:
+        for chunk in iterable:
+            if not chunk:
+                continue
+            if not head:
+                raise RuntimeError('The WSGI app sent a body before calling start_response')
+            body = {'type': 'http.response.body', 'body': chunk, 'more_body': True}
+            if head[0] is not None:
+                deliver(head[0], body)
+                head[0] = None
+            else:
+                deliver(body)
+        if not head:
+            raise RuntimeError('The WSGI app returned without calling start_response')
+        if head[0] is not None:
+            deliver(head[0], {'type': 'http.response.body', 'body': b''})
+        else:
+            deliver({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+
+async def _read_body(receive):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return False
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            _executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """The ASGI application"""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return None
+
+    try:
+        endpoint, arguments = _routes.match(_app_path(scope), scope['method'])
+    except HTTPException:
+        endpoint = None
+    stream = STREAMS.get(endpoint)
+    if stream is not None:
+        exchange = _Exchange(scope, receive, send, endpoint)
+        quota = bughunt.RATE_LIMITS.get(endpoint)
+        if quota is not None:
+            client = scope.get('client')
+            try:
+                bughunt.rate_limiter.acquire(f'{endpoint}:{client[0] if client else ""}', quota)
+            except RateLimited as exc:
+                bughunt.rate_limited.inc(endpoint)
+                return await exchange.json(429, {'error': 'Too many requests, slow down'},
+                                           [(b'retry-after', str(exc.retry_after).encode())])
+        return await stream(exchange, **arguments)
+
+    body = await _read_body(receive)
+    if body is None:
+        return None
+    if body is False:
+        return await _Exchange(scope, receive, send, endpoint or 'unmatched').json(
+            413, {'error': 'Request body too large'})
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_executor, _run_wsgi, _environ(scope, body), loop, send)
+
+
+def main():
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('python asgi.py needs uvicorn (pip install uvicorn); '
+                 'any other ASGI server can run asgi:application')
+    # One process can hold thousands of idle streams; raise `ulimit -n` to match
+    uvicorn.run('asgi:application',
+                host=os.environ.get('HOST', '127.0.0.1'),
+                port=int(os.environ.get('PORT', '8000')),
+                workers=int(os.environ.get('WEB_CONCURRENCY', '1')),
+                backlog=int(os.environ.get('ASGI_BACKLOG', '2048')),
+                limit_concurrency=int(os.environ.get('ASGI_MAX_CONNECTIONS', '10000')),
+                timeout_keep_alive=int(os.environ.get('ASGI_KEEPALIVE_SECONDS', '5')),
+                proxy_headers=True, access_log=False, lifespan='on')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Content-hashed front-end bundles built by ``build_assets.py``.
+
+The build writes each bundle under a name containing a hash of its content,
+plus a manifest mapping ``app.css`` and friends to those names. A hashed file
+never changes, so it is served with a year-long, immutable ``Cache-Control``:
+browsers fetch it once and a new build simply links different names. Each
+bundle also has a gzip copy, sent to clients that accept it.
+"""
+import json
+import logging
+import os
+
+from flask import abort, send_from_directory
+
+logger = logging.getLogger(__name__)
+
+# A year: hashed names change whenever the content does
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class AssetManifest:
+    """Maps bundle names to hashed files and serves them"""
+
+    def __init__(self, directory, prefix='/assets/'):
+        self.directory = directory
+        self.prefix = prefix
+        try:
+            with open(os.path.join(directory, 'manifest.json')) as f:
+                self._files = json.load(f)
+        except FileNotFoundError:
+            self._files = {}
+        except (OSError, ValueError):
+            logger.exception('Ignoring unreadable asset manifest in %s', directory)
+            self._files = {}
+        self._served = frozenset(self._files.values())
+
+    def url(self, name):
+        """URL of a built bundle, or None if it has not been built"""
+        hashed = self._files.get(name)
+        return self.prefix + hashed if hashed else None
+
+    def send(self, filename, request):
+        """Response for one hashed file, precompressed when the client allows"""
+        if filename not in self._served:
+            abort(404)
+        # The mimetype comes from the real name, not from the .gz copy's
+        mimetype = 'text/css' if filename.endswith('.css') else 'text/javascript'
+        if request.accept_encodings['gzip'] and os.path.exists(os.path.join(self.directory, filename + '.gz')):
+            response = send_from_directory(self.directory, filename + '.gz', mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE, etag=False)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = send_from_directory(self.directory, filename, mimetype=mimetype,
+                                           max_age=IMMUTABLE_MAX_AGE, etag=False)
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,9 @@
+// Only classes that appear in the page templates end up in the bundle.
+// Paths are relative to the repository root, where build_assets.py runs Tailwind.
+module.exports = {
+  content: ['./*.html', './templates/**/*.html'],
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};
@@ -0,0 +1,262 @@
+"""Benchmarks for the challenge and submission paths.
+
+Three groups, selectable with ``--only``:
+
+- ``micro``: ``check_bug_fix``, ``get_random_challenge`` and
+  ``simulate_ai_time`` in-process, across growing catalog and submission sizes
+- ``client``: ``/get-challenge`` -> ``/submit-fix`` -> result round trips
+  through the Flask test client
+- ``http``: the same round trips against a real threaded WSGI server on
+  localhost
+
+Every benchmark reports operations per second and latency percentiles.
+``--save`` writes the results as a JSON baseline. ``--compare`` checks them
+against a saved baseline, and the run exits with status 1 when any p50
+latency is slower than the baseline by more than ``--threshold``.
+
+    python benchmarks/bench.py --save benchmarks/baselines/local.json
+    python benchmarks/bench.py --compare benchmarks/baselines/local.json
+"""
+import argparse
+import atexit
+import http.client
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# One benchmark client must not trip the per-client fairness limits or rate limits
+os.environ.setdefault('SUBMISSION_QUEUE_PER_CLIENT', '1000')
+os.environ.setdefault('SUBMISSION_QUEUE_SIZE', '1000')
+os.environ.setdefault('RATE_LIMITS', 'get_challenge=off,submit_fix=off')
+
+# Benchmark games go to a scratch directory, never the real match history or token store
+SCRATCH = tempfile.mkdtemp(prefix='bughunt-bench-')
+atexit.register(shutil.rmtree, SCRATCH, ignore_errors=True)
+os.environ.setdefault('MATCH_HISTORY_PATH', os.path.join(SCRATCH, 'match_history.db'))
+os.environ.setdefault('CHALLENGE_STORE_URL', 'sqlite:///' + os.path.join(SCRATCH, 'challenges.db'))
+
+import app as bughunt  # noqa: E402
+from catalog import LiveCatalog  # noqa: E402
+
+LEVELS = ('easy', 'medium', 'hard')
+LANGUAGES = ('python', 'javascript', 'java')
+
+
+def summarize(latencies, elapsed):
+    """Throughput and latency percentiles (milliseconds) for one benchmark"""
+    ordered = sorted(latencies)
+
+    def percentile(fraction):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 4)
+
+    return {'ops': len(ordered), 'ops_per_sec': round(len(ordered) / elapsed, 1),
+            'p50_ms': percentile(0.50), 'p95_ms': percentile(0.95), 'p99_ms': percentile(0.99),
+            'mean_ms': round(statistics.fmean(ordered) * 1000, 4)}
+
+
+def measure(func, iterations, concurrency=1):
+    """Call func iterations times on concurrency threads and summarize the latencies"""
+    def run(count):
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    shares = [iterations // concurrency + (i < iterations % concurrency) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = [value for part in pool.map(run, shares) for value in part]
+    return summarize(latencies, time.perf_counter() - started)
+
+
+# --- micro -------------------------------------------------------------------
+
+def build_corpus(directory, size):
+    """Write a catalog of about size challenges by repeating the shipped bundle"""
+    with open(os.path.join(ROOT, 'challenges', 'bug_hunt.jsonl'), encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    with open(os.path.join(directory, 'corpus.jsonl'), 'w', encoding='utf-8') as f:
+        for index in range(size):
+            f.write(lines[index % len(lines)])
+
+
+def padded_submission(code, size):
+    """A submission of roughly size characters that still contains the original code"""
+    filler = '# padding line to grow the submission\n'
+    return code + '\n' + filler * max(0, (size - len(code)) // len(filler))
+
+
+def bench_micro(args, results):
+    results['simulate_ai_time'] = measure(lambda: bughunt.simulate_ai_time('medium'), args.iterations * 10)
+
+    original = bughunt.catalog
+    for size in args.corpus_sizes:
+        directory = tempfile.mkdtemp(prefix='bughunt-bench-')
+        try:
+            build_corpus(directory, size)
+            bughunt.catalog = LiveCatalog(directory, poll_interval=3600)
+            pairs = [(level, language) for level in LEVELS for language in LANGUAGES]
+            counter = iter(range(10 ** 9))
+
+            def draw():
+                level, language = pairs[next(counter) % len(pairs)]
+                bughunt.get_random_challenge(level, language)
+
+            results[f'get_random_challenge[corpus={size}]'] = measure(draw, args.iterations)
+        finally:
+            bughunt.catalog = original
+            shutil.rmtree(directory, ignore_errors=True)
+
+    challenge = bughunt.catalog.current.get('easy', 'python', 0)
+    for size in args.submission_sizes:
+        submission = padded_submission(challenge['fixed_code'], size)
+        results[f'check_bug_fix[chars={size}]'] = measure(
+            lambda: bughunt.check_bug_fix(submission, challenge), args.iterations)
+
+
+# --- round trips -------------------------------------------------------------
+
+def client_round_trip(client):
+    challenge = client.post('/get-challenge', json={'level': 'easy', 'language': 'python'}).get_json()
+    job = client.post('/submit-fix', json={'user_code': challenge['code'],
+                                           'challenge_id': challenge['challenge_id']}).get_json()
+    # The event stream ends once the result is ready
+    body = client.get(job['events_url']).get_data(as_text=True)
+    if 'event: result' not in body:
+        raise RuntimeError(f'No result for job {job["job_id"]}')
+
+
+def bench_client(args, results):
+    local = threading.local()
+
+    def round_trip():
+        if not hasattr(local, 'client'):
+            local.client = bughunt.app.test_client()
+        client_round_trip(local.client)
+
+    for concurrency in args.concurrency:
+        results[f'client_round_trip[c={concurrency}]'] = measure(round_trip, args.requests, concurrency)
+
+
+def http_round_trip(connection):
+    def request(method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        connection.request(method, path, body=json.dumps(body) if body is not None else None,
+                           headers=headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+
+    _, data = request('POST', '/get-challenge', {'level': 'easy', 'language': 'python'})
+    challenge = json.loads(data)
+    _, data = request('POST', '/submit-fix', {'user_code': challenge['code'],
+                                              'challenge_id': challenge['challenge_id']})
+    job = json.loads(data)
+    _, data = request('GET', job['events_url'])
+    if b'event: result' not in data:
+        raise RuntimeError(f'No result for job {job["job_id"]}')
+
+
+def bench_http(args, results):
+    from werkzeug.serving import make_server
+
+    # Per-request access log lines would dominate the output
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, bughunt.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    local = threading.local()
+
+    def round_trip():
+        if not hasattr(local, 'connection'):
+            local.connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=30)
+        try:
+            http_round_trip(local.connection)
+        except (http.client.HTTPException, OSError):
+            # The server closed a kept-alive connection; reconnect once
+            local.connection.close()
+            http_round_trip(local.connection)
+
+    try:
+        for concurrency in args.concurrency:
+            results[f'http_round_trip[c={concurrency}]'] = measure(round_trip, args.requests, concurrency)
+    finally:
+        server.shutdown()
+
+
+# --- baselines ---------------------------------------------------------------
+
+def compare(results, baseline, threshold):
+    """Return a list of human-readable regressions against a baseline"""
+    regressions = []
+    for name, previous in baseline['results'].items():
+        current = results.get(name)
+        if current is None:
+            continue
+        limit = previous['p50_ms'] * (1 + threshold)
+        if current['p50_ms'] > limit:
+            regressions.append(f'{name}: p50 {current["p50_ms"]:.3f} ms vs baseline '
+                               f'{previous["p50_ms"]:.3f} ms (+{threshold:.0%} allowed)')
+    return regressions
+
+
+def parse_sizes(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--only', choices=('micro', 'client', 'http'), action='append',
+                        help='run only these groups (repeatable)')
+    parser.add_argument('--iterations', type=int, default=2000, help='calls per micro-benchmark')
+    parser.add_argument('--requests', type=int, default=200, help='round trips per concurrency level')
+    parser.add_argument('--concurrency', type=parse_sizes, default=[1, 4, 16])
+    parser.add_argument('--corpus-sizes', type=parse_sizes, default=[15, 1500, 15000])
+    parser.add_argument('--submission-sizes', type=parse_sizes, default=[1000, 10000, 100000])
+    parser.add_argument('--save', metavar='PATH', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='fail on regressions against this baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed p50 slowdown before a benchmark counts as regressed')
+    args = parser.parse_args(argv)
+
+    groups = args.only or ['micro', 'client', 'http']
+    results = {}
+    for name, bench in (('micro', bench_micro), ('client', bench_client), ('http', bench_http)):
+        if name in groups:
+            bench(args, results)
+
+    for name, summary in results.items():
+        print(f'{name:40} {summary["ops_per_sec"]:>10.1f} ops/s  p50 {summary["p50_ms"]:>9.3f} ms  '
+              f'p95 {summary["p95_ms"]:>9.3f} ms  p99 {summary["p99_ms"]:>9.3f} ms')
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
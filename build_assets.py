@@ -0,0 +1,137 @@
+"""Build the self-hosted front-end bundles.
+
+Produces, in ``assets/dist/``:
+
+- ``app.<hash>.css``: Tailwind compiled from ``assets/app.css``, purged down
+  to the classes the templates use, and minified
+- ``prism.<hash>.js`` / ``prism.<hash>.css``: Prism core with the Python,
+  JavaScript and Java grammars built in, and the Tomorrow theme
+- a ``.gz`` copy of each bundle, and ``manifest.json`` mapping each bundle's
+  name to its hashed file
+
+The app serves whatever the manifest lists from ``/assets/`` with immutable
+caching. Without a manifest the pages fall back to the CDN scripts.
+
+Tailwind comes from a ``tailwindcss`` executable on the PATH (the standalone
+CLI or ``node_modules/.bin``), or else ``npx``. Prism files are read from
+``--prism-dir`` (e.g. ``node_modules/prismjs``) or downloaded once from the
+CDN at the pinned version. Only this build needs the network, never the app.
+
+    python build_assets.py
+    python build_assets.py --prism-dir node_modules/prismjs
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(ROOT, 'assets')
+DIST_DIR = os.path.join(SOURCE_DIR, 'dist')
+
+TAILWIND_VERSION = '3.4.17'
+PRISM_VERSION = '1.29.0'
+PRISM_CDN = f'https://cdnjs.cloudflare.com/ajax/libs/prism/{PRISM_VERSION}/'
+
+# Concatenated in this order: clike is what javascript and java build on
+PRISM_SCRIPTS = ('prism-core', 'prism-clike', 'prism-javascript', 'prism-python', 'prism-java')
+PRISM_THEME = 'prism-tomorrow'
+
+
+def tailwind_command():
+    """How to run the Tailwind CLI here"""
+    local = os.path.join(ROOT, 'node_modules', '.bin', 'tailwindcss')
+    if os.path.exists(local):
+        return [local]
+    found = shutil.which('tailwindcss')
+    if found:
+        return [found]
+    if shutil.which('npx'):
+        return ['npx', '--yes', f'tailwindcss@{TAILWIND_VERSION}']
+    sys.exit('Tailwind CLI not found: install the standalone tailwindcss binary or Node.js')
+
+
+def build_css():
+    with tempfile.TemporaryDirectory() as scratch:
+        output = os.path.join(scratch, 'app.css')
+        subprocess.run(tailwind_command() + [
+            '--config', os.path.join(SOURCE_DIR, 'tailwind.config.js'),
+            '--input', os.path.join(SOURCE_DIR, 'app.css'),
+            '--output', output, '--minify',
+        ], cwd=ROOT, check=True)
+        with open(output, 'rb') as f:
+            return f.read()
+
+
+def prism_file(prism_dir, relative):
+    """One minified Prism file, from a local package or the CDN"""
+    if prism_dir:
+        with open(os.path.join(prism_dir, relative), 'rb') as f:
+            return f.read()
+    with urllib.request.urlopen(PRISM_CDN + relative, timeout=30) as response:
+        return response.read()
+
+
+def build_prism(prism_dir):
+    script = b';\n'.join(prism_file(prism_dir, f'components/{name}.min.js').rstrip().rstrip(b';')
+                         for name in PRISM_SCRIPTS) + b';\n'
+    theme = prism_file(prism_dir, f'themes/{PRISM_THEME}.min.css')
+    return script, theme
+
+
+def write_bundle(name, data):
+    """Write a bundle under a name derived from its content; returns that name"""
+    stem, extension = os.path.splitext(name)
+    hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+    with open(os.path.join(DIST_DIR, hashed), 'wb') as f:
+        f.write(data)
+    with open(os.path.join(DIST_DIR, hashed + '.gz'), 'wb') as f:
+        f.write(gzip.compress(data, 9, mtime=0))
+    return hashed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the self-hosted CSS and Prism bundles')
+    parser.add_argument('--prism-dir', help='local prismjs package to read instead of the CDN')
+    parser.add_argument('--skip-css', action='store_true', help='only rebuild the Prism bundle')
+    parser.add_argument('--prune', action='store_true',
+                        help='delete bundles from earlier builds (once no running worker still links them)')
+    args = parser.parse_args()
+
+    os.makedirs(DIST_DIR, exist_ok=True)
+    manifest_path = os.path.join(DIST_DIR, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    if not args.skip_css:
+        manifest['app.css'] = write_bundle('app.css', build_css())
+    script, theme = build_prism(args.prism_dir)
+    manifest['prism.js'] = write_bundle('prism.js', script)
+    manifest['prism.css'] = write_bundle('prism.css', theme)
+
+    if args.prune:
+        # Bundles no longer in the manifest are left over from earlier builds
+        keep = set(manifest.values()) | {name + '.gz' for name in manifest.values()} | {'manifest.json'}
+        for name in os.listdir(DIST_DIR):
+            if name not in keep:
+                os.remove(os.path.join(DIST_DIR, name))
+
+    # Written last and atomically, so a running app never sees a half-built set
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    for name, hashed in sorted(manifest.items()):
+        size = os.path.getsize(os.path.join(DIST_DIR, hashed))
+        print(f'{name:10} -> assets/dist/{hashed} ({size} bytes)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,283 @@
+"""On-disk challenge catalog with a compact index and lazily loaded bodies.
+
+Challenges live in JSON Lines bundles: one challenge object per line, starting
+with its ``level`` and ``language`` keys, e.g.::
+
+    {"level": "easy", "language": "python", "code": "...", "fixed_code": "...", ...}
+
+The catalog can be pointed at a single bundle or at a directory of ``*.jsonl``
+bundles. Opening it scans each bundle once to build a (level, language) ->
+offsets index; bodies stay on disk (memory-mapped) and are parsed on demand
+into a bounded LRU cache together with their compiled grader,
+pre-serialized response payload, highlighted HTML and fix diff.
+
+A ``ChallengeCatalog`` is an immutable snapshot of the bundles as they were
+when it was opened. ``LiveCatalog`` watches the bundles, builds a new snapshot
+in the background when they change and swaps it in atomically, keeping recent
+snapshots around so challenges already handed out still resolve. Replace
+bundle files atomically (write a new file, then rename it over the old one)
+so older snapshots keep reading the content they indexed.
+"""
+import json
+import logging
+import mmap
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+
+from challenge_payloads import ChallengePayload
+from code_diff import line_diff
+from grading import compile_grader
+from highlight import highlight
+
+# Fast path for reading a line's bucket without parsing the whole body
+_BUCKET_RE = re.compile(rb'\{\s*"level"\s*:\s*"(\w+)"\s*,\s*"language"\s*:\s*"(\w+)"')
+
+logger = logging.getLogger(__name__)
+
+
+def bundle_paths(path):
+    """List the bundle files that make up a catalog source"""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path)
+                      if name.endswith('.jsonl'))
+    return [path]
+
+
+def source_signature(path):
+    """Cheap fingerprint of a catalog source that changes when any bundle does.
+
+    Built from file metadata, so it only tells this process when to look
+    again; it differs between machines and checkouts of the same files.
+    """
+    signature = []
+    for bundle in bundle_paths(path):
+        try:
+            stat = os.stat(bundle)
+        except FileNotFoundError:
+            continue
+        signature.append((os.path.basename(bundle), stat.st_size, stat.st_mtime_ns, stat.st_ino))
+    return tuple(signature)
+
+
+class _Bucket:
+    """Locations of every challenge for one (level, language) pair"""
+
+    __slots__ = ('files', 'offsets', 'lengths')
+
+    def __init__(self):
+        self.files = array('H')
+        self.offsets = array('Q')
+        self.lengths = array('I')
+
+
+class ChallengeCatalog:
+    """Immutable indexed snapshot of one or more challenge bundles"""
+
+    def __init__(self, path, cache_size=1024):
+        self.path = path
+        self.signature = source_signature(path)
+        self._maps = []
+        self._buckets = {}
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+        # 32-bit checksum of every bundle's name and bytes. Every worker and node
+        # serving the same files computes the same version, so a version in a
+        # challenge token means the same thing wherever it comes back.
+        self.version = 0
+        for bundle in bundle_paths(path):
+            self._index_bundle(bundle)
+
+    def _index_bundle(self, bundle):
+        with open(bundle, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        file_no = len(self._maps)
+        self._maps.append(mm)
+        self.version = zlib.crc32(mm, zlib.crc32(os.path.basename(bundle).encode(), self.version))
+
+        pos, size = 0, len(mm)
+        while pos < size:
+            end = mm.find(b'\n', pos)
+            if end == -1:
+                end = size
+            if end > pos and not mm[pos:end].isspace():
+                match = _BUCKET_RE.match(mm, pos, end)
+                if match:
+                    key = (match.group(1).decode(), match.group(2).decode())
+                else:
+                    record = json.loads(mm[pos:end])
+                    key = (record['level'], record['language'])
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = _Bucket()
+                bucket.files.append(file_no)
+                bucket.offsets.append(pos)
+                bucket.lengths.append(end - pos)
+            pos = end + 1
+
+    def count(self, level, language):
+        """Number of challenges available for a level and language"""
+        bucket = self._buckets.get((level, language))
+        return len(bucket.offsets) if bucket else 0
+
+    def _load(self, level, language, index):
+        """Return the cached (challenge, grader, payload) entry, reading it if needed"""
+        key = (level, language, index)
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                return entry
+
+        bucket = self._buckets.get((level, language))
+        if bucket is None or not 0 <= index < len(bucket.offsets):
+            return None
+        offset = bucket.offsets[index]
+        raw = self._maps[bucket.files[index]][offset:offset + bucket.lengths[index]]
+        try:
+            challenge = json.loads(raw)
+        except ValueError:
+            # The bundle was rewritten in place instead of being replaced
+            logger.warning('Challenge %s/%s/%d changed under catalog %08x',
+                           level, language, index, self.version)
+            return None
+        challenge['id'] = f'{level}/{language}/{index}'
+        challenge['index'] = index
+        challenge['catalog_version'] = self.version
+        # Rendered once here so neither the server nor the browser redoes it per game
+        challenge['code_html'] = highlight(challenge['code'], language)
+        challenge['fixed_html'] = highlight(challenge['fixed_code'], language)
+        challenge['fix_diff'] = line_diff(challenge['code'], challenge['fixed_code'])
+        entry = (challenge, compile_grader(challenge, level), ChallengePayload(challenge))
+
+        with self._cache_lock:
+            self._cache[key] = entry
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return entry
+
+    def get(self, level, language, index):
+        """Return a challenge by position, or None if it doesn't exist"""
+        entry = self._load(level, language, index)
+        return entry[0] if entry else None
+
+    def get_grader(self, level, language, index):
+        """Return the precompiled grader for a challenge"""
+        entry = self._load(level, language, index)
+        return entry[1] if entry else None
+
+    def get_payload(self, level, language, index):
+        """Return the pre-serialized response payload for a challenge"""
+        entry = self._load(level, language, index)
+        return entry[2] if entry else None
+
+    def preload(self):
+        """Load every challenge into the cache, as far as it holds; returns how many"""
+        loaded = 0
+        for (level, language), bucket in self._buckets.items():
+            for index in range(len(bucket.offsets)):
+                if loaded >= self._cache_size:
+                    return loaded
+                if self._load(level, language, index) is not None:
+                    loaded += 1
+        return loaded
+
+    def challenges(self):
+        """Yield every challenge in the snapshot, level by level"""
+        for (level, language), bucket in self._buckets.items():
+            for index in range(len(bucket.offsets)):
+                challenge = self.get(level, language, index)
+                if challenge is not None:
+                    yield challenge
+
+    def random_challenge(self, level, language):
+        """Pick a challenge uniformly at random, or None if there are none"""
+        count = self.count(level, language)
+        if not count:
+            return None
+        return self.get(level, language, random.randrange(count))
+
+
+class LiveCatalog:
+    """Hot-reloading catalog that swaps in new snapshots without locking readers"""
+
+    def __init__(self, path, poll_interval=2.0, retain_seconds=300, cache_size=1024):
+        self.path = path
+        self._poll_interval = poll_interval
+        self._retain_seconds = retain_seconds
+        self._cache_size = cache_size
+        self._current = ChallengeCatalog(path, cache_size)
+        # version -> (snapshot, retired_at); replaced wholesale, never mutated
+        self._snapshots = {self._current.version: (self._current, None)}
+        self._reload_lock = threading.Lock()
+        self._watcher_lock = threading.Lock()
+        self._watcher_pid = None
+
+    @property
+    def current(self):
+        """The newest snapshot; reading it takes no lock"""
+        self._ensure_watcher()
+        return self._current
+
+    def preload(self):
+        """Load the current snapshot's challenges without starting the watcher"""
+        return self._current.preload()
+
+    def snapshot(self, version):
+        """Return the snapshot a challenge was issued from, if still retained"""
+        entry = self._snapshots.get(version)
+        if entry is None and version != self._current.version:
+            # Another worker may have picked up a change this one hasn't seen yet
+            self.reload()
+            entry = self._snapshots.get(version)
+        return entry[0] if entry else None
+
+    def reload(self):
+        """Rebuild the index if the source changed; return True if swapped"""
+        with self._reload_lock:
+            if source_signature(self.path) == self._current.signature:
+                return False
+            try:
+                fresh = ChallengeCatalog(self.path, self._cache_size)
+            except (OSError, ValueError, KeyError):
+                logger.exception('Keeping catalog %08x; failed to load %s',
+                                 self._current.version, self.path)
+                return False
+
+            now = time.monotonic()
+            snapshots = {version: (snapshot, retired_at)
+                         for version, (snapshot, retired_at) in self._snapshots.items()
+                         if retired_at is None or now - retired_at < self._retain_seconds}
+            snapshots[self._current.version] = (self._current, now)
+            snapshots[fresh.version] = (fresh, None)
+            self._snapshots = snapshots
+            self._current = fresh
+            logger.info('Loaded challenge catalog %08x from %s', fresh.version, self.path)
+            return True
+
+    def _ensure_watcher(self):
+        # Threads don't survive fork, so each worker process starts its own
+        if self._watcher_pid == os.getpid() or not self._poll_interval:
+            return
+        with self._watcher_lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            threading.Thread(target=self._watch_forever, name='catalog-watcher',
+                             daemon=True).start()
+
+    def _watch_forever(self):
+        while True:
+            time.sleep(self._poll_interval)
+            try:
+                self.reload()
+            except Exception:
+                logger.exception('Catalog reload failed')
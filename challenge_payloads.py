@@ -0,0 +1,55 @@
+"""Pre-serialized /get-challenge response bodies.
+
+Everything in a challenge response except ``ai_time``, ``time_limit`` and
+``challenge_id`` is fixed per challenge, so that part is serialized (and
+deflated) once when the challenge is loaded. Each response then only
+serializes the three dynamic fields and splices them onto the cached bytes.
+"""
+import json
+import struct
+import zlib
+
+# Minimal gzip member header: deflate, no flags, no mtime, unknown OS
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+
+class ChallengePayload:
+    """Cached static part of one challenge's JSON response"""
+
+    __slots__ = ('prefix', 'deflated_prefix', 'crc')
+
+    def __init__(self, challenge):
+        static = json.dumps({
+            'code': challenge['code'],
+            'code_html': challenge.get('code_html'),
+            'description': challenge['description'],
+            'bugs': challenge['bugs'],
+            'hint': challenge.get('hint', ''),
+            'level': challenge['level'],
+            'language': challenge['language'],
+        }, separators=(',', ':'))
+        # Drop the closing brace so dynamic fields can be appended
+        self.prefix = static[:-1].encode()
+
+        # A full flush ends the deflate data on a byte boundary without
+        # referencing it later, so a fresh compressor can continue the stream
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.deflated_prefix = compressor.compress(self.prefix) + compressor.flush(zlib.Z_FULL_FLUSH)
+        self.crc = zlib.crc32(self.prefix)
+
+    def _suffix(self, ai_time, time_limit, challenge_id):
+        return (',"ai_time":%s,"time_limit":%d,"challenge_id":%s}'
+                % (json.dumps(ai_time), time_limit, json.dumps(challenge_id))).encode()
+
+    def render(self, ai_time, time_limit, challenge_id):
+        """Return the full JSON body for one issued challenge"""
+        return self.prefix + self._suffix(ai_time, time_limit, challenge_id)
+
+    def render_gzip(self, ai_time, time_limit, challenge_id):
+        """Return the full JSON body as a gzip stream, reusing the deflated prefix"""
+        suffix = self._suffix(ai_time, time_limit, challenge_id)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        tail = compressor.compress(suffix) + compressor.flush()
+        size = len(self.prefix) + len(suffix)
+        trailer = struct.pack('<II', zlib.crc32(suffix, self.crc), size & 0xffffffff)
+        return _GZIP_HEADER + self.deflated_prefix + tail + trailer
@@ -0,0 +1,510 @@
+"""Session stores for challenges that are currently being played.
+
+Every backend maps a random challenge ID to a string value with a per-entry
+TTL and supports an atomic get-and-delete (``pop``):
+
+- ``MemoryChallengeStore``: sharded, process-local, with lazy plus periodic
+  eviction and a hard LRU capacity that never drops a live claim. Fine for a
+  single worker process.
+- ``SQLiteChallengeStore``: a WAL-mode database file shared by every worker
+  on one machine.
+- ``RedisChallengeStore``: any server speaking the Redis protocol, shared by
+  workers across machines.
+
+Use ``create_challenge_store(url)`` to pick one from configuration.
+"""
+import math
+import os
+import queue
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+
+
+class StoreFull(Exception):
+    """Raised when a store cannot remember another claim without forgetting a live one"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Shard:
+    __slots__ = ('lock', 'entries', 'expired', 'evicted', 'rejected')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> (expires_at, value, claimed), oldest access first
+        self.entries = OrderedDict()
+        # Eviction and rejection counts, only changed under the lock
+        self.expired = self.evicted = self.rejected = 0
+
+
+class ChallengeStore:
+    """Interface shared by all challenge store backends"""
+
+    def new_id(self):
+        """Return a random, URL-safe challenge ID"""
+        return secrets.token_urlsafe(12)
+
+    def put(self, value, ttl):
+        """Store a value for ttl seconds and return its new unique ID"""
+        raise NotImplementedError
+
+    def get(self, key):
+        """Return the live value for key, or None if missing or expired"""
+        raise NotImplementedError
+
+    def pop(self, key):
+        """Remove key and return its live value, or None if missing or expired"""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        """Store a value under a caller-chosen key for ttl seconds"""
+        raise NotImplementedError
+
+    def claim(self, key, ttl):
+        """Mark a caller-chosen key as used for ttl seconds.
+
+        Returns True the first time a key is claimed and False while an
+        earlier claim is still live, which makes it a single-use guard. A
+        live claim is never forgotten early; a store with no room left for
+        another raises StoreFull instead.
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class MemoryChallengeStore(ChallengeStore):
+    """TTL-bounded, sharded in-memory map of challenge ID to value"""
+
+    def __init__(self, shards=16, capacity=10000, sweep_interval=30.0):
+        self._shards = [_Shard() for _ in range(shards)]
+        self._shard_capacity = max(1, -(-capacity // shards))
+        self._sweep_interval = sweep_interval
+        self._sweeper_pid = None
+        self._sweeper_lock = threading.Lock()
+
+    @property
+    def expired_evictions(self):
+        return sum(shard.expired for shard in self._shards)
+
+    @property
+    def capacity_evictions(self):
+        return sum(shard.evicted for shard in self._shards)
+
+    @property
+    def rejected_claims(self):
+        return sum(shard.rejected for shard in self._shards)
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def put(self, value, ttl):
+        self._ensure_sweeper()
+        key = self.new_id()
+        shard = self._shard(key)
+        now = time.monotonic()
+        with shard.lock:
+            while key in shard.entries:
+                key = self.new_id()
+            shard.entries[key] = (now + ttl, value, False)
+            self._trim(shard, now)
+        return key
+
+    def _trim(self, shard, now):
+        # Caller holds shard.lock. Over capacity, drops expired entries and then
+        # unclaimed ones, least recently used first. Live claims are kept: dropping
+        # one would let its token be submitted again.
+        excess = len(shard.entries) - self._shard_capacity
+        if excess <= 0:
+            return
+        for key, (expires_at, _, claimed) in list(shard.entries.items()):
+            if expires_at <= now:
+                shard.expired += 1
+            elif not claimed:
+                shard.evicted += 1
+            else:
+                continue
+            del shard.entries[key]
+            excess -= 1
+            if not excess:
+                return
+
+    def get(self, key):
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del shard.entries[key]
+                shard.expired += 1
+                return None
+            shard.entries.move_to_end(key)
+            return entry[1]
+
+    def pop(self, key):
+        shard = self._shard(key)
+        with shard.lock:
+            entry = shard.entries.pop(key, None)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                shard.expired += 1
+                return None
+        return entry[1]
+
+    def set(self, key, value, ttl):
+        self._ensure_sweeper()
+        shard = self._shard(key)
+        now = time.monotonic()
+        with shard.lock:
+            shard.entries[key] = (now + ttl, value, False)
+            shard.entries.move_to_end(key)
+            self._trim(shard, now)
+
+    def claim(self, key, ttl):
+        self._ensure_sweeper()
+        shard = self._shard(key)
+        now = time.monotonic()
+        with shard.lock:
+            entry = shard.entries.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            shard.entries[key] = (now + ttl, '1', True)
+            shard.entries.move_to_end(key)
+            self._trim(shard, now)
+            if len(shard.entries) > self._shard_capacity:
+                # Everything left is a live claim
+                del shard.entries[key]
+                shard.rejected += 1
+                soonest = min(expires_at for expires_at, _, _ in shard.entries.values())
+                raise StoreFull('Too many challenges are in play; try again shortly',
+                                max(1, math.ceil(soonest - now)))
+        return True
+
+    def evict_expired(self):
+        """Drop every expired entry and return how many were removed"""
+        removed = 0
+        for shard in self._shards:
+            now = time.monotonic()
+            with shard.lock:
+                expired = [key for key, (expires_at, _, _) in shard.entries.items() if expires_at <= now]
+                for key in expired:
+                    del shard.entries[key]
+                shard.expired += len(expired)
+            removed += len(expired)
+        return removed
+
+    def _ensure_sweeper(self):
+        # Threads don't survive fork, so each worker process starts its own
+        if self._sweeper_pid == os.getpid() or not self._sweep_interval:
+            return
+        with self._sweeper_lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_forever, name='challenge-store-sweeper',
+                             daemon=True).start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self._sweep_interval)
+            self.evict_expired()
+
+    def __len__(self):
+        return sum(len(shard.entries) for shard in self._shards)
+
+
+class _ConnectionPool:
+    """Small LIFO pool that reuses connections and caps how many exist"""
+
+    def __init__(self, connect, size, timeout):
+        self._connect = connect
+        self._size = size
+        self._timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self._size)
+
+    def acquire(self):
+        # Connections opened before a fork must not be shared with the parent
+        if self._pid != os.getpid():
+            self._reset()
+        if not self._slots.acquire(timeout=self._timeout):
+            raise TimeoutError('Timed out waiting for a challenge store connection')
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            self._idle.put(conn)
+        self._slots.release()
+
+    def run(self, func):
+        """Call func(conn) with a pooled connection, discarding it on error"""
+        conn = self.acquire()
+        try:
+            result = func(conn)
+        except BaseException:
+            self.release(conn, broken=True)
+            raise
+        self.release(conn)
+        return result
+
+
+class SQLiteChallengeStore(ChallengeStore):
+    """Challenge store in a WAL-mode SQLite file shared by local workers"""
+
+    # Expired rows are purged once every this many puts
+    PURGE_EVERY = 256
+
+    def __init__(self, path, table='challenges', pool_size=8, timeout=5.0):
+        if not path or path == ':memory:':
+            raise ValueError('SQLiteChallengeStore needs a database file shared by the workers')
+        if not table.isidentifier():
+            raise ValueError(f'Invalid table name: {table}')
+        self._path = path
+        self._table = table
+        self._timeout = timeout
+        self._pool = _ConnectionPool(self._connect, pool_size, timeout)
+        self._puts = 0
+        self._pool.run(self._create_schema)
+
+    def _connect(self):
+        conn = sqlite3.connect(self._path, timeout=self._timeout,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _create_schema(self, conn):
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {self._table} ('
+                     'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {self._table}_expiry ON {self._table} (expires_at)')
+
+    def put(self, value, ttl):
+        self._puts += 1
+        purge = self._puts % self.PURGE_EVERY == 0
+
+        def insert(conn):
+            now = time.time()
+            while True:
+                key = self.new_id()
+                cursor = conn.execute(f'INSERT OR IGNORE INTO {self._table} VALUES (?, ?, ?)',
+                                      (key, value, now + ttl))
+                if cursor.rowcount:
+                    break
+            if purge:
+                conn.execute(f'DELETE FROM {self._table} WHERE expires_at <= ?', (now,))
+            return key
+
+        return self._pool.run(insert)
+
+    def get(self, key):
+        row = self._pool.run(lambda conn: conn.execute(
+            f'SELECT value FROM {self._table} WHERE key = ? AND expires_at > ?',
+            (key, time.time())).fetchone())
+        return row[0] if row else None
+
+    def pop(self, key):
+        # DELETE ... RETURNING reads and removes the row in one statement
+        row = self._pool.run(lambda conn: conn.execute(
+            f'DELETE FROM {self._table} WHERE key = ? RETURNING value, expires_at',
+            (key,)).fetchone())
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0]
+
+    def set(self, key, value, ttl):
+        self._pool.run(lambda conn: conn.execute(
+            f'INSERT OR REPLACE INTO {self._table} VALUES (?, ?, ?)', (key, value, time.time() + ttl)))
+
+    def claim(self, key, ttl):
+        def upsert(conn):
+            now = time.time()
+            # Inserts a new row, or takes over one whose earlier claim has expired
+            return conn.execute(
+                f'INSERT INTO {self._table} VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE '
+                'SET value = excluded.value, expires_at = excluded.expires_at '
+                f'WHERE {self._table}.expires_at <= ?', (key, '1', now + ttl, now)).rowcount
+
+        return self._pool.run(upsert) == 1
+
+    def evict_expired(self):
+        """Drop every expired row and return how many were removed"""
+        return self._pool.run(lambda conn: conn.execute(
+            f'DELETE FROM {self._table} WHERE expires_at <= ?', (time.time(),)).rowcount)
+
+    def __len__(self):
+        return self._pool.run(lambda conn: conn.execute(
+            f'SELECT COUNT(*) FROM {self._table}').fetchone()[0])
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class _RedisConnection:
+    """Minimal RESP client connection: send pipelined commands, read replies"""
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    def send(self, *commands):
+        """Write several commands in a single round trip"""
+        buf = []
+        for command in commands:
+            buf.append(b'*%d\r\n' % len(command))
+            for arg in command:
+                if not isinstance(arg, bytes):
+                    arg = str(arg).encode()
+                buf.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self.sock.sendall(b''.join(buf))
+
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by challenge store')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            length = int(rest)
+            if length < 0:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise RedisError(f'Unexpected reply: {line!r}')
+
+    def execute(self, *commands):
+        """Send commands pipelined and return their replies in order"""
+        self.send(*commands)
+        return [self.read_reply() for _ in commands]
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisChallengeStore(ChallengeStore):
+    """Challenge store on a Redis-protocol server shared by every worker"""
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None,
+                 prefix='bughunt:challenge:', pool_size=8, timeout=5.0):
+        self._host = host
+        self._port = port
+        self._db = db
+        self._password = password
+        self._prefix = prefix
+        self._timeout = timeout
+        self._pool = _ConnectionPool(self._connect, pool_size, timeout)
+
+    def _connect(self):
+        conn = _RedisConnection(self._host, self._port, self._timeout)
+        setup = []
+        if self._password:
+            setup.append(('AUTH', self._password))
+        if self._db:
+            setup.append(('SELECT', self._db))
+        if setup:
+            conn.execute(*setup)
+        return conn
+
+    def put(self, value, ttl):
+        def insert(conn):
+            while True:
+                key = self.new_id()
+                # NX guards against the (unlikely) reuse of a live ID
+                if conn.execute(('SET', self._prefix + key, value, 'PX', max(1, int(ttl * 1000)), 'NX'))[0]:
+                    return key
+
+        return self._pool.run(insert)
+
+    def get(self, key):
+        return self._pool.run(lambda conn: conn.execute(('GET', self._prefix + key))[0])
+
+    def pop(self, key):
+        # GET and DEL run atomically inside MULTI/EXEC, sent as one pipeline
+        name = self._prefix + key
+        replies = self._pool.run(lambda conn: conn.execute(
+            ('MULTI',), ('GET', name), ('DEL', name), ('EXEC',)))
+        results = replies[-1]
+        return results[0] if results else None
+
+    def set(self, key, value, ttl):
+        self._pool.run(lambda conn: conn.execute(
+            ('SET', self._prefix + key, value, 'PX', max(1, int(ttl * 1000)))))
+
+    def claim(self, key, ttl):
+        return self._pool.run(lambda conn: conn.execute(
+            ('SET', self._prefix + key, '1', 'PX', max(1, int(ttl * 1000)), 'NX'))[0]) is not None
+
+    def __len__(self):
+        # Only this store's keys: several namespaces (and other apps) can share a database.
+        # SCAN walks the keyspace in batches without blocking the server the way KEYS
+        # would; it may return a key more than once, hence the set.
+        def count(conn):
+            cursor, seen = '0', set()
+            while True:
+                cursor, keys = conn.execute(('SCAN', cursor, 'MATCH', self._prefix + '*',
+                                             'COUNT', 1000))[0]
+                seen.update(keys)
+                if cursor == '0':
+                    return len(seen)
+
+        return self._pool.run(count)
+
+
+def create_challenge_store(url, namespace='challenge', capacity=10000):
+    """Build a challenge store from a URL.
+
+    Supported forms: ``memory://``, ``sqlite:///path/to/file.db`` and
+    ``redis://[:password@]host[:port][/db]``. Stores with different
+    namespaces can share one database without their keys colliding.
+    ``capacity`` bounds the in-memory store; the others are bounded by TTLs.
+    """
+    parsed = urlparse(url or 'memory://')
+    if parsed.scheme == 'memory':
+        return MemoryChallengeStore(capacity=capacity)
+    if parsed.scheme == 'sqlite':
+        return SQLiteChallengeStore(unquote(parsed.path), table=f'{namespace}s')
+    if parsed.scheme == 'redis':
+        db = parsed.path.lstrip('/')
+        return RedisChallengeStore(host=parsed.hostname or '127.0.0.1', port=parsed.port or 6379,
+                                   db=int(db) if db else 0, prefix=f'bughunt:{namespace}:',
+                                   password=unquote(parsed.password) if parsed.password else None)
+    raise ValueError(f'Unsupported challenge store URL: {url}')
@@ -0,0 +1,71 @@
+"""Stateless, HMAC-signed challenge tokens.
+
+A token carries everything ``/submit-fix`` needs to resolve and time a
+challenge: the catalog version it was issued from, level, language, challenge
+index, issue time, the AI's time and a random nonce. The server signs it when
+the challenge is handed out and only has to verify the signature on
+submission, so any worker can accept it.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import time
+from collections import namedtuple
+
+TOKEN_VERSION = 2
+
+# Levels and languages are encoded as their position in these tuples
+LEVELS = ('easy', 'medium', 'hard')
+LANGUAGES = ('python', 'javascript', 'java')
+
+# version, catalog version, level, language, challenge index, issued_at (ms), ai_time (cs), nonce
+_PAYLOAD = struct.Struct('>BIBBIQI8s')
+_SIGNATURE_SIZE = 16
+
+ChallengeToken = namedtuple('ChallengeToken',
+                            'catalog_version level language index issued_at ai_time nonce')
+
+
+class InvalidToken(Exception):
+    """Raised when a challenge token is malformed or its signature is wrong"""
+
+
+def _sign(secret, payload):
+    return hmac.new(secret, payload, hashlib.sha256).digest()[:_SIGNATURE_SIZE]
+
+
+def issue_token(secret, catalog_version, level, language, index, ai_time, issued_at=None, nonce=None):
+    """Return a signed, URL-safe token for a challenge handed out now"""
+    if issued_at is None:
+        issued_at = time.time()
+    if nonce is None:
+        nonce = os.urandom(8)
+    payload = _PAYLOAD.pack(TOKEN_VERSION, catalog_version, LEVELS.index(level),
+                            LANGUAGES.index(language), index, int(issued_at * 1000),
+                            int(round(ai_time * 100)), nonce)
+    token = payload + _sign(secret, payload)
+    return base64.urlsafe_b64encode(token).rstrip(b'=').decode('ascii')
+
+
+def verify_token(secret, token):
+    """Check a token's signature and return its decoded ChallengeToken"""
+    if not isinstance(token, str) or len(token) > 128:
+        raise InvalidToken('Malformed challenge token')
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (ValueError, TypeError):
+        raise InvalidToken('Malformed challenge token')
+    if len(raw) != _PAYLOAD.size + _SIGNATURE_SIZE:
+        raise InvalidToken('Malformed challenge token')
+
+    payload, signature = raw[:_PAYLOAD.size], raw[_PAYLOAD.size:]
+    if not hmac.compare_digest(signature, _sign(secret, payload)):
+        raise InvalidToken('Bad challenge token signature')
+
+    version, catalog_version, level, language, index, issued_ms, ai_cs, nonce = _PAYLOAD.unpack(payload)
+    if version != TOKEN_VERSION or level >= len(LEVELS) or language >= len(LANGUAGES):
+        raise InvalidToken('Unsupported challenge token')
+    return ChallengeToken(catalog_version, LEVELS[level], LANGUAGES[language], index,
+                          issued_ms / 1000, ai_cs / 100, nonce.hex())
@@ -0,0 +1,122 @@
+"""Line diffs between two versions of a snippet.
+
+``line_diff`` uses Myers' O(ND) algorithm, which runs in time proportional
+to the input size times the number of edits. Both are capped, so a
+submission that has nothing in common with the fix costs a bounded amount
+of work: past ``max_edits`` edits, or ``max_lines`` changed lines on either
+side, the changed middle is reported as one block replaced by another.
+Lines shared at the start and end are stripped before the search starts.
+
+A diff is a list of ``[op, line]`` pairs, where op is ``' '`` for a kept
+line, ``'-'`` for a removed one and ``'+'`` for an added one.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Edits searched for before giving up on a minimal diff
+MAX_EDITS = 200
+
+# Longest changed region (in lines, per side) searched for a minimal diff
+MAX_LINES = 2000
+
+
+def _myers(old, new, max_edits):
+    """Shortest edit script between two line lists, or None past max_edits edits"""
+    n, m = len(old), len(new)
+    offset = max_edits + 1
+    frontier = [0] * (2 * offset + 1)
+    trace = []
+    for edits in range(max_edits + 1):
+        trace.append(frontier[:])
+        for diagonal in range(-edits, edits + 1, 2):
+            # Step down (insert) from the diagonal above, or right (delete) from the one below
+            if diagonal == -edits or (diagonal != edits
+                                      and frontier[offset + diagonal - 1] < frontier[offset + diagonal + 1]):
+                x = frontier[offset + diagonal + 1]
+            else:
+                x = frontier[offset + diagonal - 1] + 1
+            y = x - diagonal
+            while x < n and y < m and old[x] == new[y]:
+                x += 1
+                y += 1
+            frontier[offset + diagonal] = x
+            if x >= n and y >= m:
+                return _backtrack(old, new, trace, offset, edits)
+    return None
+
+
+def _backtrack(old, new, trace, offset, edits):
+    script = []
+    x, y = len(old), len(new)
+    for step in range(edits, 0, -1):
+        frontier = trace[step]
+        diagonal = x - y
+        if diagonal == -step or (diagonal != step
+                                 and frontier[offset + diagonal - 1] < frontier[offset + diagonal + 1]):
+            previous = diagonal + 1
+        else:
+            previous = diagonal - 1
+        start_x = frontier[offset + previous]
+        start_y = start_x - previous
+        while x > start_x and y > start_y:
+            x -= 1
+            y -= 1
+            script.append([' ', old[x]])
+        if x > start_x:
+            x -= 1
+            script.append(['-', old[x]])
+        else:
+            y -= 1
+            script.append(['+', new[y]])
+    while x > 0 and y > 0:
+        x -= 1
+        y -= 1
+        script.append([' ', old[x]])
+    script.reverse()
+    return script
+
+
+def line_diff(old, new, max_edits=MAX_EDITS, max_lines=MAX_LINES):
+    """Line diff turning old into new, minimal up to max_edits changed lines"""
+    old_lines, new_lines = old.splitlines(), new.splitlines()
+    start = 0
+    while start < len(old_lines) and start < len(new_lines) and old_lines[start] == new_lines[start]:
+        start += 1
+    end_old, end_new = len(old_lines), len(new_lines)
+    while end_old > start and end_new > start and old_lines[end_old - 1] == new_lines[end_new - 1]:
+        end_old -= 1
+        end_new -= 1
+    middle_old, middle_new = old_lines[start:end_old], new_lines[start:end_new]
+    middle = None
+    if len(middle_old) <= max_lines and len(middle_new) <= max_lines:
+        middle = _myers(middle_old, middle_new, max_edits)
+    if middle is None:
+        middle = [['-', line] for line in middle_old] + [['+', line] for line in middle_new]
+    return ([[' ', line] for line in old_lines[:start]] + middle
+            + [[' ', line] for line in old_lines[end_old:]])
+
+
+class DiffCache:
+    """Bounded LRU of line diffs, keyed by the reference and a digest of the other side"""
+
+    def __init__(self, capacity=1024, max_edits=MAX_EDITS):
+        self._capacity = capacity
+        self._max_edits = max_edits
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def diff(self, reference_key, old, new):
+        """line_diff(old, new), reused when the same code is diffed against the same reference"""
+        key = (reference_key, hashlib.blake2b(old.encode(), digest_size=16).digest())
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                return cached
+        result = line_diff(old, new, self._max_edits)
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+        return result
@@ -0,0 +1,299 @@
+"""Precompiled grading rules for Bug Hunt challenges.
+
+Every challenge carries its own acceptance rules. They are compiled once at
+startup so a submission is normalized a single time and scanned in one pass.
+
+Python challenges are also graded structurally. The buggy code and the
+reference fix are parsed once, and where their syntax trees differ becomes a
+set of tree-path predicates: "the node at this path must match the
+reference". A submission is parsed and each predicate is checked against its
+tree, so formatting, comments and edits away from the bug do not matter, and
+a change that only looks like the fix does not count.
+
+JavaScript and Java fixes are compared as token streams, which ignore
+whitespace and comments. The tokens of the buggy code and of the reference
+fix are diffed once, and each changed region becomes a hunk: the fixed
+tokens with a few unchanged tokens either side to pin them in place. A
+submission is accepted when every hunk appears in its tokens, in order.
+"""
+import ast
+import re
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+from tokenizer import TOKEN_LANGUAGES, TokenStream, tokenize
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Phrases that count as a correct answer for challenges without a real bug
+NO_BUG_PHRASES = ('no bug', 'works fine')
+
+# Word-overlap thresholds used when no explicit rule accepts the fix
+SIMILARITY_THRESHOLDS = {'easy': 0.3, 'medium': 0.5, 'hard': 0.6}
+
+# Unchanged tokens kept on each side of a token hunk
+HUNK_CONTEXT = 3
+
+
+def normalize_code(code):
+    """Lowercase code and collapse whitespace runs into single spaces"""
+    return WHITESPACE_RE.sub(' ', code.strip().lower())
+
+
+_DEFINITIONS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+# What parsing, comparing or unparsing a submission can raise. Long chains such
+# as 1+1+1... or a.b.b... nest too deeply for the parser or for the recursive
+# walks over the tree; like a syntax error, that is code that fixed nothing.
+_UNPARSEABLE = (SyntaxError, ValueError, RecursionError, MemoryError)
+
+
+def _without_strings(tree):
+    """Empty every string and bytes literal in a tree, so their text cannot match a snippet"""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes)):
+            node.value = type(node.value)()
+    return tree
+
+
+def _definitions(tree):
+    """Top-level functions and classes by name; paths start from one of these"""
+    return {node.name: node for node in tree.body if isinstance(node, _DEFINITIONS)}
+
+
+def _same(a, b):
+    """Whether two syntax trees are equal, ignoring positions"""
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, ast.AST):
+        return all(_same(getattr(a, field, None), getattr(b, field, None)) for field in a._fields)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(map(_same, a, b))
+    return a == b
+
+
+def _diff(buggy, fixed, path, anchor, out):
+    """Append the path of the innermost statement or expression around each difference.
+
+    ``anchor`` is the path of the closest enclosing statement or expression
+    seen so far; a difference is reported there, so a predicate always
+    compares a whole expression rather than, say, a lone operator.
+    """
+    if isinstance(fixed, (ast.stmt, ast.expr)):
+        anchor = path
+    if type(buggy) is not type(fixed):
+        out.append(anchor)
+    elif isinstance(fixed, ast.AST):
+        for field in fixed._fields:
+            _diff(getattr(buggy, field, None), getattr(fixed, field, None), path + (field,), anchor, out)
+    elif isinstance(fixed, list):
+        if len(buggy) != len(fixed):
+            # Statements were added or removed: the whole block must match
+            out.append(path)
+        else:
+            for index, (old, new) in enumerate(zip(buggy, fixed)):
+                _diff(old, new, path + (index,), anchor, out)
+    elif buggy != fixed:
+        out.append(anchor)
+
+
+def _resolve(tree, definitions, path):
+    """Follow a tree path in a parsed submission; None if it does not exist"""
+    if path[0] is None:
+        node = tree
+    else:
+        node = definitions.get(path[0])
+    for step in path[1:]:
+        if node is None:
+            return None
+        if isinstance(step, int):
+            node = node[step] if isinstance(node, list) and step < len(node) else None
+        else:
+            node = getattr(node, step, None)
+    return node
+
+
+def format_path(path):
+    """Readable form of a tree path, e.g. ``check_age.body[0].orelse[0].test``"""
+    text = path[0] or '<module>'
+    for step in path[1:]:
+        text += f'[{step}]' if isinstance(step, int) else f'.{step}'
+    return text
+
+
+@lru_cache(maxsize=1024)
+def fix_predicates(code, fixed_code):
+    """Tree-path predicates that tell the fix apart from the bug.
+
+    Returns a tuple of ``(path, reference_node)`` pairs, where a path starts
+    with the name of a top-level definition (or None for the module), or
+    None when either version does not parse or they do not differ. Cached
+    on the source text, so reloading the catalog does not parse again.
+    """
+    try:
+        buggy_tree, fixed_tree = ast.parse(code), ast.parse(fixed_code)
+        buggy_defs, fixed_defs = _definitions(buggy_tree), _definitions(fixed_tree)
+        paths = []
+        # Differences inside functions and classes are the bug; module-level lines
+        # are usually demo calls, and only count when nothing else changed
+        for name, node in fixed_defs.items():
+            if name in buggy_defs:
+                _diff(buggy_defs[name], node, (name,), (name,), paths)
+            else:
+                paths.append((name,))
+        if not paths:
+            _diff(buggy_tree, fixed_tree, (None,), (None,), paths)
+    except _UNPARSEABLE:
+        return None
+    if not paths:
+        return None
+    return tuple((path, _resolve(fixed_tree, fixed_defs, path)) for path in paths)
+
+
+@lru_cache(maxsize=1024)
+def fix_hunks(code, fixed_code):
+    """Token hunks that tell the fix apart from the bug.
+
+    Returns a tuple of ``(needle, advance)`` pairs: ``needle`` is the fixed
+    tokens of one changed region with up to ``HUNK_CONTEXT`` unchanged tokens
+    either side, and ``advance`` is how far past the start of a match the
+    next hunk may begin. None when the two versions have the same tokens.
+    Cached on the source text, so reloading the catalog does not diff again.
+    """
+    buggy, fixed = tokenize(code), tokenize(fixed_code)
+    changes = [opcode for opcode in SequenceMatcher(None, buggy, fixed, autojunk=False).get_opcodes()
+               if opcode[0] != 'equal']
+    if not changes:
+        return None
+    # Changes only a few tokens apart are one rewrite, not several small fixes
+    regions = [[changes[0][3], changes[0][4]]]
+    for _, _, _, start, end in changes[1:]:
+        if start - regions[-1][1] <= 2 * HUNK_CONTEXT:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+    hunks = []
+    for index, (start, end) in enumerate(regions):
+        # Context never reaches into a neighbouring hunk's replacement
+        previous_end = regions[index - 1][1] if index else 0
+        next_start = regions[index + 1][0] if index + 1 < len(regions) else len(fixed)
+        before = max(start - HUNK_CONTEXT, previous_end)
+        after = min(end + HUNK_CONTEXT, next_start)
+        hunks.append((fixed[before:after], end - before))
+    return tuple(hunks)
+
+
+# First characters of string, character and template literal tokens
+_STRING_QUOTES = ('"', "'", '`')
+
+
+def _token_text(tokens):
+    """Tokens as one lowercase string for snippet matching, padded so matches end on token boundaries.
+
+    String and template literals are left out: text inside a string is not code.
+    """
+    return ' ' + ' '.join(token for token in tokens if not token.startswith(_STRING_QUOTES)).lower() + ' '
+
+
+class CompiledGrader:
+    """Acceptance rules for one challenge, ready to check submissions"""
+
+    __slots__ = ('alternatives', 'needle_re', 'implied', 'buggy_normalized',
+                 'expected_words', 'expected_word_count', 'threshold', 'predicates', 'hunks')
+
+    def __init__(self, challenge, level):
+        language = challenge.get('language')
+        # Python fixes are checked against the reference tree, JavaScript and Java
+        # fixes against its tokens; either replaces the word-overlap fallback
+        self.predicates = self.hunks = None
+        if not challenge.get('no_bug'):
+            if language == 'python':
+                self.predicates = fix_predicates(challenge['code'], challenge['fixed_code'])
+            elif language in TOKEN_LANGUAGES:
+                self.hunks = fix_hunks(challenge['code'], challenge['fixed_code'])
+
+        # Each alternative is a group of snippets that must all be present
+        if self.hunks is not None:
+            normalize = lambda snippet: _token_text(tokenize(snippet))  # noqa: E731
+        else:
+            normalize = normalize_code
+        alternatives = [(f'accept:{index}', tuple(normalize(snippet) for snippet in group))
+                        for index, group in enumerate(challenge.get('accept', []))]
+        if challenge.get('no_bug'):
+            alternatives.extend(('no_bug', (phrase,)) for phrase in NO_BUG_PHRASES)
+        self.alternatives = tuple(alternatives)
+
+        needles = sorted({snippet for _, group in alternatives for snippet in group},
+                         key=len, reverse=True)
+        if needles:
+            # A lookahead finds a needle at every position, longest first
+            pattern = '(?=(' + '|'.join(re.escape(needle) for needle in needles) + '))'
+            self.needle_re = re.compile(pattern)
+        else:
+            self.needle_re = None
+        # A longer needle found at a position also proves its prefixes are present
+        self.implied = {needle: frozenset(other for other in needles if needle.startswith(other))
+                        for needle in needles}
+
+        # Handing back the untouched buggy code never counts as a fix
+        self.buggy_normalized = None if challenge.get('no_bug') else normalize_code(challenge['code'])
+
+        expected_words = normalize_code(challenge['fixed_code']).split()
+        self.expected_words = frozenset(expected_words)
+        self.expected_word_count = max(len(expected_words), 1)
+        self.threshold = SIMILARITY_THRESHOLDS.get(level, SIMILARITY_THRESHOLDS['hard'])
+
+    def grade(self, user_code):
+        """Return the name of the rule that accepts the fix, or None"""
+        if self.predicates is not None:
+            try:
+                tree = ast.parse(user_code)
+                definitions = _definitions(tree)
+                if all(_same(_resolve(tree, definitions, path), expected)
+                       for path, expected in self.predicates):
+                    return 'ast'
+                # Other fixes the author accepts are looked for in the code itself,
+                # so a snippet sitting in a comment or a string does not count
+                normalized = normalize_code(ast.unparse(_without_strings(tree)))
+            except _UNPARSEABLE:
+                # Code that does not even parse has not fixed anything
+                return None
+        elif self.hunks is not None:
+            stream = TokenStream(user_code)
+            position = 0
+            for needle, advance in self.hunks:
+                found = stream.find(needle, position)
+                if found < 0:
+                    break
+                position = found + advance
+            else:
+                return 'tokens'
+            # As for Python, accepted snippets only count outside comments and strings
+            normalized = _token_text(stream.rest())
+        else:
+            normalized = normalize_code(user_code)
+
+        if self.needle_re is not None:
+            found = set()
+            for match in self.needle_re.finditer(normalized):
+                found |= self.implied[match.group(1)]
+            for name, group in self.alternatives:
+                if found.issuperset(group):
+                    return name
+
+        if self.predicates is not None or self.hunks is not None:
+            return None
+
+        if normalized == self.buggy_normalized:
+            return None
+
+        # Simple similarity check (in real app, use more sophisticated comparison)
+        common_words = self.expected_words.intersection(normalized.split())
+        if len(common_words) / self.expected_word_count >= self.threshold:
+            return 'similarity'
+        return None
+
+
+def compile_grader(challenge, level):
+    """Precompile the acceptance rules attached to a challenge"""
+    return CompiledGrader(challenge, level)
@@ -0,0 +1,79 @@
+"""gunicorn settings: build shared state once in the master, then fork.
+
+gunicorn reads this file from the working directory, so the commands in the
+README pick it up as they are:
+
+    gunicorn -w 4 app:app
+    gunicorn -w 4 -k uvicorn.workers.UvicornWorker asgi:application
+
+The master imports the app, parses the whole challenge catalog, compiles its
+graders and folds in the match history before forking. It then moves all of
+it into the collector's permanent generation with ``gc.freeze()``. Collections
+in the workers skip those objects instead of writing to them, so the pages
+stay shared copy-on-write. Each worker logs its boot time, the time until its
+first request (WSGI workers; ASGI workers have no request hook) and its
+memory, shared vs private.
+"""
+import gc
+import os
+import sys
+import time
+
+preload_app = True
+
+# Collecting while the master builds its state would leave freed holes all
+# over the pages the workers share; the workers turn collection back on.
+gc.disable()
+
+_MASTER_STARTED = time.monotonic()
+_forked_at = None
+_first_request = True
+
+
+def _memory():
+    # Imported here: gunicorn reads this file before the app directory is on sys.path
+    from metrics import process_memory
+    return ', '.join(f'{kind} {value / 2 ** 20:.1f} MiB' for kind, value in sorted(process_memory().items()))
+
+
+def when_ready(server):
+    bughunt = sys.modules.get('app')
+    if bughunt is None:
+        return
+    # Forked workers inherit this; -w does not show up in WEB_CONCURRENCY
+    bughunt.configure_workers(server.cfg.workers)
+    started = time.monotonic()
+    loaded = bughunt.preload()
+    gc.freeze()
+    server.log.info('Preloaded %d challenges in %.1f ms; master ready %.2f s after start (%s)',
+                    loaded, (time.monotonic() - started) * 1000, time.monotonic() - _MASTER_STARTED,
+                    _memory())
+
+
+def pre_fork(server, worker):
+    # Whatever the master allocated since (e.g. while replacing a worker) is frozen too
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    global _forked_at
+    _forked_at = time.monotonic()
+    gc.enable()
+
+
+def post_worker_init(worker):
+    bughunt = sys.modules.get('app')
+    if bughunt is not None:
+        # The solver's threads and sockets have to be started in the worker itself
+        bughunt.prewarm_ai_opponent()
+    worker.log.info('Worker %d booted in %.1f ms (%s)', os.getpid(),
+                    (time.monotonic() - _forked_at) * 1000, _memory())
+
+
+def pre_request(worker, req):
+    global _first_request
+    if _first_request:
+        _first_request = False
+        worker.log.info('Worker %d took its first request %.1f ms after fork, %.2f s after the master started (%s)',
+                        os.getpid(), (time.monotonic() - _forked_at) * 1000,
+                        time.monotonic() - _MASTER_STARTED, _memory())
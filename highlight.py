@@ -0,0 +1,128 @@
+"""Server-side syntax highlighting in Prism's markup.
+
+Code is split into tokens and wrapped in ``<span class="token keyword">``
+and friends, the same classes Prism produces, so the page's Prism theme
+styles it and the browser has nothing left to do. Python is tokenized with
+the standard library's ``tokenize``; JavaScript and Java with ``tokenizer``.
+Anything that cannot be tokenized is returned escaped but unhighlighted.
+"""
+import builtins
+import html
+import io
+import keyword
+import tokenize as python_tokenize
+
+from tokenizer import iter_spans
+
+_PYTHON_BUILTINS = frozenset(name for name in dir(builtins) if not name.startswith('_'))
+_PYTHON_BOOLEANS = frozenset({'True', 'False', 'None'})
+
+_KEYWORDS = {
+    'javascript': frozenset('''
+        as async await break case catch class const continue debugger default delete do else
+        export extends finally for from function get if import in instanceof let new of return
+        set static super switch this throw try typeof var void while with yield
+    '''.split()),
+    'java': frozenset('''
+        abstract assert boolean break byte case catch char class const continue default do
+        double else enum extends final finally float for goto if implements import instanceof
+        int interface long native new package private protected public return short static
+        strictfp super switch synchronized this throw throws transient try var void volatile
+        while record yield
+    '''.split()),
+}
+_BOOLEANS = frozenset({'true', 'false', 'null', 'undefined'})
+_PUNCTUATION = frozenset('()[]{},;:.')
+
+
+def _span(kind, text):
+    text = html.escape(text, quote=False)
+    return f'<span class="token {kind}">{text}</span>' if kind else text
+
+
+def _python_pieces(code):
+    # (kind, text) covering all of code; the gaps between tokens are kept as plain text
+    lines = code.splitlines(keepends=True)
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    tokens = list(python_tokenize.generate_tokens(io.StringIO(code).readline))
+    position, previous = 0, None
+    for index, token in enumerate(tokens):
+        if token.type == python_tokenize.ENDMARKER:
+            break
+        start = offsets[token.start[0] - 1] + token.start[1] if token.start[0] <= len(lines) else len(code)
+        end = offsets[token.end[0] - 1] + token.end[1] if token.end[0] <= len(lines) else len(code)
+        if start < position:
+            continue
+        if start > position:
+            yield None, code[position:start]
+        kind = None
+        if token.type == python_tokenize.NAME:
+            following = tokens[index + 1].string if index + 1 < len(tokens) else ''
+            if token.string in _PYTHON_BOOLEANS:
+                kind = 'boolean'
+            elif keyword.iskeyword(token.string):
+                kind = 'keyword'
+            elif previous == 'def' or following == '(':
+                kind = 'function'
+            elif previous == 'class':
+                kind = 'class-name'
+            elif token.string in _PYTHON_BUILTINS:
+                kind = 'builtin'
+            previous = token.string
+        elif token.type == python_tokenize.OP:
+            kind = 'punctuation' if token.string in _PUNCTUATION else 'operator'
+        elif token.type == python_tokenize.NUMBER:
+            kind = 'number'
+        elif token.type == python_tokenize.STRING:
+            kind = 'string'
+        elif token.type == python_tokenize.COMMENT:
+            kind = 'comment'
+        yield kind, code[start:end]
+        position = end
+    if position < len(code):
+        yield None, code[position:]
+
+
+def _c_like_pieces(code, language):
+    keywords = _KEYWORDS[language]
+    spans = list(iter_spans(code))
+    previous = None
+    for index, (kind, text) in enumerate(spans):
+        css = None
+        if kind == 'name':
+            after = index + 1
+            if after < len(spans) and spans[after][0] == 'space':
+                after += 1
+            following = spans[after][1] if after < len(spans) else ''
+            if text in _BOOLEANS:
+                css = 'boolean'
+            elif text in keywords:
+                css = 'keyword'
+            elif following == '(':
+                css = 'function'
+            elif previous in ('class', 'new', 'extends', 'implements') or (
+                    language == 'java' and text[:1].isupper()):
+                css = 'class-name'
+        elif kind in ('string', 'number', 'comment', 'operator'):
+            css = kind
+        elif kind == 'other':
+            css = 'punctuation' if text in _PUNCTUATION else 'operator' if text in '+-*/%=<>!&|^~?' else None
+        if kind != 'space' and kind != 'comment':
+            previous = text
+        yield css, text
+
+
+def highlight(code, language):
+    """Code as HTML in Prism's token markup, ready for a ``<code>`` element"""
+    try:
+        if language == 'python':
+            pieces = list(_python_pieces(code))
+        elif language in _KEYWORDS:
+            pieces = list(_c_like_pieces(code, language))
+        else:
+            pieces = [(None, code)]
+    except (python_tokenize.TokenError, IndentationError, SyntaxError):
+        pieces = [(None, code)]
+    return ''.join(_span(kind, text) for kind, text in pieces)
@@ -0,0 +1,209 @@
+"""Match history and leaderboard.
+
+Every graded match is appended to a ``matches`` table in a WAL-mode SQLite
+database. Rows are never updated or deleted. ``record`` only queues the row,
+and a background writer commits queued rows in batches, one transaction per
+batch (group commit).
+
+Leaderboard and win-rate queries never scan the table. Each process keeps
+in-memory aggregates: a bounded heap of the fastest human wins per
+(level, language), and play/win counts per challenge. Aggregates are fed from
+the log itself by reading rows past the last one seen, so every worker that
+shares the database converges on the same numbers. The first query in a
+process folds in the existing history once. Other aggregates, such as player
+ratings, can subscribe to the same feed of rows.
+"""
+import heapq
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+Match = namedtuple('Match', 'played_at player level language challenge_id winner is_correct user_time ai_time')
+
+_COLUMNS = 'played_at, player, level, language, challenge_id, winner, is_correct, user_time, ai_time'
+
+
+class _ChallengeStats:
+    __slots__ = ('plays', 'human_wins', 'correct')
+
+    def __init__(self):
+        self.plays = 0
+        self.human_wins = 0
+        self.correct = 0
+
+    def as_dict(self):
+        return {'plays': self.plays, 'human_wins': self.human_wins, 'correct': self.correct,
+                'human_win_rate': round(self.human_wins / self.plays, 4) if self.plays else 0.0}
+
+
+class MatchHistory:
+    """Append-only match log with incrementally maintained leaderboards"""
+
+    def __init__(self, path, top_n=10, batch_size=64, flush_interval=0.05, refresh_interval=1.0):
+        self._path = path
+        self.top_n = top_n
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._refresh_interval = refresh_interval
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._pending_ready = threading.Condition(self._pending_lock)
+        self._writer_pid = None
+        self._read_conn = None
+        self._read_pid = None
+        self._aggregate_lock = threading.Lock()
+        self._last_id = 0
+        self._refreshed_at = 0.0
+        # (level, language) -> heap of (-user_time, -row id, Match); the root is the slowest
+        # kept win, and among equal times the newest, so earlier wins keep their place
+        self._fastest = {}
+        # (level, language) -> {challenge_id: _ChallengeStats}, and the bucket's totals
+        self._stats = {}
+        self._totals = {}
+        self._subscribers = []
+        # Closed, not just committed: a preloaded master would hand it to every worker
+        with closing(self._connect()) as conn, conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS matches (id INTEGER PRIMARY KEY, {_COLUMNS})')
+
+    def _connect(self):
+        conn = sqlite3.connect(self._path, timeout=5.0, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    # --- writing ---------------------------------------------------------------
+
+    def record(self, match):
+        """Queue a match for the next group commit"""
+        self._ensure_writer()
+        with self._pending_lock:
+            self._pending.append(match)
+            if len(self._pending) in (1, self._batch_size):
+                self._pending_ready.notify()
+
+    def _ensure_writer(self):
+        # The writer thread does not survive fork; each worker starts its own
+        if self._writer_pid == os.getpid():
+            return
+        with self._pending_lock:
+            if self._writer_pid != os.getpid():
+                self._writer_pid = os.getpid()
+                self._pending = []
+                threading.Thread(target=self._write_loop, daemon=True, name='match-history-writer').start()
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            with self._pending_lock:
+                while not self._pending:
+                    self._pending_ready.wait()
+                # Let a batch build up for a moment unless it is already full
+                if len(self._pending) < self._batch_size:
+                    self._pending_ready.wait(self._flush_interval)
+                batch, self._pending = self._pending, []
+            if batch:
+                self._write(conn, batch)
+
+    def _write(self, conn, batch):
+        try:
+            with conn:
+                conn.executemany(f'INSERT INTO matches ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 batch)
+        except sqlite3.Error:
+            logger.exception('Dropped %d match history rows', len(batch))
+
+    def flush(self):
+        """Write every queued match now (used at shutdown and by tools)"""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if batch:
+            conn = self._connect()
+            try:
+                self._write(conn, batch)
+            finally:
+                conn.close()
+
+    # --- aggregates ------------------------------------------------------------
+
+    def subscribe(self, callback):
+        """Call callback(match) for every row folded in from now on, in log order.
+
+        Subscribe before the first query so the existing history is included.
+        """
+        self._subscribers.append(callback)
+
+    def refresh(self):
+        """Fold in rows appended since the last refresh, by any process (at most once per interval)"""
+        now = time.monotonic()
+        if now - self._refreshed_at < self._refresh_interval:
+            return
+        with self._aggregate_lock:
+            if now - self._refreshed_at < self._refresh_interval:
+                return
+            if self._read_pid != os.getpid():
+                self._read_conn, self._read_pid = self._connect(), os.getpid()
+            rows = self._read_conn.execute(f'SELECT id, {_COLUMNS} FROM matches WHERE id > ? ORDER BY id',
+                                           (self._last_id,)).fetchall()
+            for row in rows:
+                match = Match(*row[1:])
+                self._apply(row[0], match)
+                for callback in self._subscribers:
+                    callback(match)
+            if rows:
+                self._last_id = rows[-1][0]
+            self._refreshed_at = time.monotonic()
+
+    def _apply(self, row_id, match):
+        bucket = (match.level, match.language)
+        challenges = self._stats.setdefault(bucket, {})
+        stats = challenges.get(match.challenge_id)
+        if stats is None:
+            stats = challenges[match.challenge_id] = _ChallengeStats()
+        totals = self._totals.get(bucket)
+        if totals is None:
+            totals = self._totals[bucket] = _ChallengeStats()
+        human_won = match.winner == 'human'
+        for counts in (stats, totals):
+            counts.plays += 1
+            counts.human_wins += human_won
+            counts.correct += bool(match.is_correct)
+
+        if human_won:
+            heap = self._fastest.setdefault(bucket, [])
+            entry = (-match.user_time, -row_id, match)
+            if len(heap) < self.top_n:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    def leaderboard(self, level, language, limit=None):
+        """Fastest human wins for one (level, language), fastest first"""
+        self.refresh()
+        with self._aggregate_lock:
+            entries = sorted(self._fastest.get((level, language), ()), reverse=True)
+        return [{'player': match.player, 'user_time': round(match.user_time, 2),
+                 'ai_time': match.ai_time, 'challenge_id': match.challenge_id,
+                 'played_at': match.played_at}
+                for _, _, match in entries[:limit or self.top_n]]
+
+    def challenge_stats(self, level, language, challenge_id):
+        """Play and win counts for one challenge"""
+        self.refresh()
+        with self._aggregate_lock:
+            stats = self._stats.get((level, language), {}).get(challenge_id)
+            return (stats or _ChallengeStats()).as_dict()
+
+    def bucket_stats(self, level, language):
+        """Totals for a (level, language) and the per-challenge counts inside it"""
+        self.refresh()
+        with self._aggregate_lock:
+            totals = self._totals.get((level, language)) or _ChallengeStats()
+            challenges = {challenge_id: stats.as_dict()
+                          for challenge_id, stats in self._stats.get((level, language), {}).items()}
+            return {'totals': totals.as_dict(), 'challenges': challenges}
@@ -0,0 +1,246 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+Counters and histograms record into a dict owned by the calling thread, so
+the hot path takes no lock and touches no shared state. ``render`` sums every
+thread's dict when ``/metrics`` is scraped. A thread's totals are folded into
+a shared dict when it exits, so short-lived request threads do not pile up.
+Gauges are callbacks evaluated at scrape time.
+"""
+import bisect
+import math
+import sys
+import threading
+import time
+import weakref
+
+# Seconds; fine-grained at the low end where most requests land
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                  .replace('\n', '\\n'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by label values"""
+
+    kind = 'counter'
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, *labelvalues, amount=1):
+        cells = self._registry._cells()
+        key = (self.name, labelvalues)
+        cells[key] = cells.get(key, 0) + amount
+
+    def _merge(self, total, value):
+        return (total or 0) + value
+
+    def _samples(self, values):
+        for labelvalues, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}'
+
+
+class Histogram:
+    """Distribution of observed values over fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        cells = self._registry._cells()
+        key = (self.name, labelvalues)
+        cell = cells.get(key)
+        if cell is None:
+            # One count per bucket plus +Inf, then sum and count
+            cell = cells[key] = [0] * (len(self.buckets) + 3)
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def time(self, *labelvalues):
+        """Context manager observing the seconds spent inside it"""
+        return _Timer(self, labelvalues)
+
+    def _merge(self, total, cell):
+        if total is None:
+            return list(cell)
+        for index, value in enumerate(cell):
+            total[index] += value
+        return total
+
+    def _samples(self, values):
+        bounds = self.buckets + (math.inf,)
+        names = self.labelnames + ('le',)
+        for labelvalues, cell in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, cell):
+                cumulative += count
+                labels = _format_labels(names, labelvalues + (_format_value(bound),))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f'{self.name}_sum{labels} {_format_value(float(cell[-2]))}'
+            yield f'{self.name}_count{labels} {cell[-1]}'
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labelvalues', 'started')
+
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+
+
+class Gauge:
+    """Value read from a callback at scrape time.
+
+    The callback returns a number, or an iterable of (labelvalues, number)
+    pairs for a labelled gauge. ``kind='counter'`` exposes a callback that
+    reads an existing monotonic count (such as eviction totals); as with
+    ``Counter``, its name should end in ``_total``.
+    """
+
+    def __init__(self, name, help, callback, labelnames=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        self._callback = callback
+
+    def _samples(self, values):
+        value = self._callback()
+        pairs = value if self.labelnames else [((), value)]
+        for labelvalues, number in pairs:
+            yield (f'{self.name}{_format_labels(self.labelnames, tuple(labelvalues))} '
+                   f'{_format_value(number)}')
+
+
+# smaps_rollup fields, in kB, summed into each kind process_memory reports
+_SMAPS_KINDS = {'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared', 'Shared_Dirty': 'shared',
+                'Private_Clean': 'private', 'Private_Dirty': 'private'}
+
+
+def process_memory():
+    """Bytes of memory this process uses: rss, plus pss, shared and private on Linux.
+
+    Shared pages are the ones still shared copy-on-write with the preloaded
+    master (or other processes); private ones are this process's own.
+    """
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                field, _, value = line.partition(':')
+                kind = _SMAPS_KINDS.get(field)
+                if kind:
+                    usage[kind] = usage.get(kind, 0) + int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        try:
+            import resource
+        except ImportError:
+            return usage
+        # Peak rather than current; kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        usage['rss'] = peak if sys.platform == 'darwin' else peak * 1024
+    return usage
+
+
+class Metrics:
+    """Registry of metrics with per-thread, lock-free recording"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._local = threading.local()
+        # Every live thread's cells, and the folded totals of threads that exited
+        self._live = {}
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _cells(self):
+        try:
+            return self._local.cells
+        except AttributeError:
+            pass
+        cells = self._local.cells = {}
+        ident = id(cells)
+        with self._lock:
+            self._live[ident] = cells
+        weakref.finalize(threading.current_thread(), self._retire, ident)
+        return cells
+
+    def _retire(self, ident):
+        with self._lock:
+            cells = self._live.pop(ident, None)
+            if cells:
+                self._fold(self._retired, cells)
+
+    def _fold(self, totals, cells):
+        # Copying first keeps iteration safe while the owning thread records
+        for key, value in cells.copy().items():
+            metric = self._metrics.get(key[0])
+            if metric is not None:
+                totals[key] = metric._merge(totals.get(key), value)
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(self, name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def gauge(self, name, help, callback, labelnames=(), kind='gauge'):
+        return self._register(Gauge(name, help, callback, labelnames, kind))
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        totals = {}
+        with self._lock:
+            self._fold(totals, self._retired)
+            live = list(self._live.values())
+        for cells in live:
+            self._fold(totals, cells)
+
+        by_metric = {}
+        for (name, labelvalues), value in totals.items():
+            by_metric.setdefault(name, {})[labelvalues] = value
+        lines = []
+        for name, metric in self._metrics.items():
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            lines.extend(metric._samples(by_metric.get(name, {})))
+        return '\n'.join(lines) + '\n'
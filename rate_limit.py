@@ -0,0 +1,187 @@
+"""Per-client token-bucket rate limiting.
+
+Each (route, client) pair owns a bucket that holds up to ``burst`` tokens and
+refills at ``rate`` tokens per second; a request takes one token or is turned
+away with the time until the next one arrives. A bucket only has to
+remember its token count and when it was last touched, so a check is O(1).
+
+- ``MemoryRateLimiter``: sharded and process-local. Buckets that have
+  refilled completely carry no information and are dropped as newer ones
+  arrive, and the table never holds more than ``capacity`` buckets.
+- ``SQLiteRateLimiter``: one WAL-mode database file shared by every worker
+  on a machine, so a client gets the same quota however requests are spread.
+  Each check is a single UPSERT.
+
+Use ``create_rate_limiter(url)`` to pick one from configuration.
+"""
+import logging
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import unquote, urlparse
+
+from challenge_store import _ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+Quota = namedtuple('Quota', 'rate burst')
+
+
+class RateLimited(Exception):
+    """Raised when a client has used up its quota for a route"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_quota(text):
+    """Parse ``"<requests>/<seconds>"``, e.g. ``"30/60"``; None for ``"off"``"""
+    text = text.strip()
+    if text.lower() in ('', 'off', 'none'):
+        return None
+    count, _, seconds = text.partition('/')
+    count, seconds = int(count), float(seconds or 1)
+    if count < 1 or seconds <= 0:
+        raise ValueError(f'Invalid rate limit: {text}')
+    return Quota(count / seconds, count)
+
+
+def parse_quotas(text, defaults=None):
+    """Parse ``"route=30/60,other=off"`` on top of a dict of default quotas"""
+    quotas = dict(defaults or {})
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        route, _, quota = item.partition('=')
+        quotas[route.strip()] = parse_quota(quota)
+    return {route: quota for route, quota in quotas.items() if quota is not None}
+
+
+def _retry_after(tokens, quota):
+    # Seconds until the bucket is back to one whole token
+    return max(1, math.ceil((1 - tokens) / quota.rate))
+
+
+class _Shard:
+    __slots__ = ('lock', 'buckets')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> [tokens, updated_at, full_at], least recently used first
+        self.buckets = OrderedDict()
+
+
+class MemoryRateLimiter:
+    """Process-local token buckets in a bounded, self-expiring table"""
+
+    def __init__(self, shards=16, capacity=100000):
+        self._shards = [_Shard() for _ in range(shards)]
+        self._shard_capacity = max(1, capacity // shards)
+
+    def acquire(self, key, quota):
+        """Take one token from key's bucket, or raise RateLimited"""
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with shard.lock:
+            buckets = shard.buckets
+            bucket = buckets.get(key)
+            if bucket is None:
+                tokens = quota.burst
+            else:
+                buckets.move_to_end(key)
+                tokens = min(quota.burst, bucket[0] + (now - bucket[1]) * quota.rate)
+            if tokens < 1:
+                bucket[0], bucket[1] = tokens, now
+                raise RateLimited('Too many requests', _retry_after(tokens, quota))
+            tokens -= 1
+            buckets[key] = [tokens, now, now + (quota.burst - tokens) / quota.rate]
+            # A full bucket is the same as no bucket; the oldest go first
+            while buckets and (len(buckets) > self._shard_capacity
+                               or next(iter(buckets.values()))[2] <= now):
+                buckets.popitem(last=False)
+
+    def __len__(self):
+        return sum(len(shard.buckets) for shard in self._shards)
+
+
+class SQLiteRateLimiter:
+    """Token buckets in a WAL-mode SQLite file shared by local workers"""
+
+    # Full buckets are purged once every this many checks
+    PURGE_EVERY = 1024
+
+    def __init__(self, path, table='rate_limits', pool_size=8, timeout=1.0):
+        if not path or path == ':memory:':
+            raise ValueError('SQLiteRateLimiter needs a database file shared by the workers')
+        if not table.isidentifier():
+            raise ValueError(f'Invalid table name: {table}')
+        self._path = path
+        self._table = table
+        self._timeout = timeout
+        self._pool = _ConnectionPool(self._connect, pool_size, timeout)
+        self._checks = 0
+        self._pool.run(self._create_schema)
+
+    def _connect(self):
+        conn = sqlite3.connect(self._path, timeout=self._timeout,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _create_schema(self, conn):
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {self._table} ('
+                     'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, '
+                     'full_at REAL NOT NULL)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {self._table}_full ON {self._table} (full_at)')
+
+    def acquire(self, key, quota):
+        """Take one token from key's bucket, or raise RateLimited"""
+        self._checks += 1
+        purge = self._checks % self.PURGE_EVERY == 0
+
+        def take(conn):
+            now = time.time()
+            refilled = f'min(:burst, {self._table}.tokens + (:now - {self._table}.updated_at) * :rate)'
+            # Refill and take a token in one statement; no row back means the bucket was empty
+            row = conn.execute(
+                f'INSERT INTO {self._table} VALUES (:key, :burst - 1, :now, :now + 1 / :rate) '
+                f'ON CONFLICT (key) DO UPDATE SET tokens = {refilled} - 1, updated_at = :now, '
+                f'full_at = :now + (:burst - {refilled} + 1) / :rate WHERE {refilled} >= 1 '
+                'RETURNING tokens',
+                {'key': key, 'burst': quota.burst, 'rate': quota.rate, 'now': now}).fetchone()
+            if purge:
+                conn.execute(f'DELETE FROM {self._table} WHERE full_at <= ?', (now,))
+            if row is not None:
+                return None
+            tokens, updated_at = conn.execute(
+                f'SELECT tokens, updated_at FROM {self._table} WHERE key = ?', (key,)).fetchone()
+            return min(quota.burst, tokens + (now - updated_at) * quota.rate)
+
+        try:
+            tokens = self._pool.run(take)
+        except (sqlite3.Error, TimeoutError):
+            # Better to let a request through than to fail it over the limiter
+            logger.exception('Rate limit check failed; allowing the request')
+            return
+        if tokens is not None:
+            raise RateLimited('Too many requests', _retry_after(tokens, quota))
+
+    def __len__(self):
+        return self._pool.run(lambda conn: conn.execute(
+            f'SELECT COUNT(*) FROM {self._table}').fetchone()[0])
+
+
+def create_rate_limiter(url):
+    """Build a rate limiter from a URL.
+
+    - ``memory://`` (the default): per-process buckets
+    - ``sqlite:///path/to/file.db``: buckets shared by workers on one machine
+    """
+    parsed = urlparse(url or 'memory://')
+    if parsed.scheme == 'memory':
+        return MemoryRateLimiter()
+    if parsed.scheme == 'sqlite':
+        return SQLiteRateLimiter(unquote(parsed.path))
+    raise ValueError(f'Unsupported rate limiter URL: {url}')
@@ -0,0 +1,190 @@
+"""Skill ratings for players and challenges, and matchmaking on them.
+
+Every finished match is a game between a player and a challenge: a correct
+fix is a win for the player, anything else a win for the challenge. Both
+sides carry an Elo rating that moves after each game by how surprising the
+result was, with a larger step while a rating is still provisional.
+
+Each (level, language) keeps its challenges sorted by rating, so picking a
+challenge near a player's rating is a bisect. A per-player bitset over the
+bucket's challenge indices remembers what they played recently, so repeats
+only happen once they have seen everything close to their level.
+
+Ratings are fed from the match history (see ``MatchHistory.subscribe``), so
+every worker sharing the history converges on the same numbers. The recent
+bitsets also learn from challenges handed out by this process.
+"""
+import random
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+
+DEFAULT_PLAYER_RATING = 1500.0
+
+# Starting rating of a challenge nobody has played yet
+LEVEL_RATINGS = {'easy': 1300.0, 'medium': 1500.0, 'hard': 1700.0}
+
+# Rating step: larger for the first few games, while a rating is still a guess
+K_PROVISIONAL = 48.0
+K_SETTLED = 24.0
+PROVISIONAL_GAMES = 10
+
+# Players kept in memory; the least recently seen are forgotten first
+MAX_PLAYERS = 100000
+
+# Players whose results are not attributed to anyone
+ANONYMOUS = 'Anonymous'
+
+
+def expected_score(rating, opponent):
+    """Chance that rating beats opponent under the Elo model"""
+    return 1.0 / (1.0 + 10.0 ** ((opponent - rating) / 400.0))
+
+
+def _k(games):
+    return K_PROVISIONAL if games < PROVISIONAL_GAMES else K_SETTLED
+
+
+class _Player:
+    __slots__ = ('rating', 'games', 'recent')
+
+    def __init__(self):
+        self.rating = DEFAULT_PLAYER_RATING
+        self.games = 0
+        # (level, language) -> int whose bit i is set once challenge i was played
+        self.recent = {}
+
+
+class _Bucket:
+    """Ratings of one (level, language)'s challenges, kept sorted for matchmaking"""
+
+    __slots__ = ('initial', 'ratings', 'games', 'order')
+
+    def __init__(self, initial):
+        self.initial = initial
+        self.ratings = []
+        self.games = []
+        # (rating, index) pairs in rating order
+        self.order = []
+
+    def grow(self, count):
+        # Challenges added to the catalog start at the level's rating
+        for index in range(len(self.ratings), count):
+            self.ratings.append(self.initial)
+            self.games.append(0)
+            insort(self.order, (self.initial, index))
+
+    def update(self, index, rating):
+        order = self.order
+        del order[bisect_left(order, (self.ratings[index], index))]
+        insort(order, (rating, index))
+        self.ratings[index] = rating
+
+
+class Ratings:
+    """Elo ratings for players and challenges, with a rating-ordered challenge index"""
+
+    def __init__(self, max_players=MAX_PLAYERS, window=100.0, attempts=4):
+        self._max_players = max_players
+        self.window = window
+        self._attempts = attempts
+        self._players = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _player(self, name):
+        player = self._players.get(name)
+        if player is None:
+            player = self._players[name] = _Player()
+            while len(self._players) > self._max_players:
+                self._players.popitem(last=False)
+        else:
+            self._players.move_to_end(name)
+        return player
+
+    def _bucket(self, level, language):
+        bucket = self._buckets.get((level, language))
+        if bucket is None:
+            initial = LEVEL_RATINGS.get(level, DEFAULT_PLAYER_RATING)
+            bucket = self._buckets[(level, language)] = _Bucket(initial)
+        return bucket
+
+    def apply(self, match):
+        """Update both ratings from one finished match (a ``history.Match``)"""
+        index = int(match.challenge_id.rsplit('/', 1)[1])
+        with self._lock:
+            bucket = self._bucket(match.level, match.language)
+            bucket.grow(index + 1)
+            player = self._player(match.player) if match.player != ANONYMOUS else None
+            player_rating = player.rating if player else DEFAULT_PLAYER_RATING
+            challenge_rating = bucket.ratings[index]
+            surprise = (1.0 if match.is_correct else 0.0) - expected_score(player_rating, challenge_rating)
+
+            bucket.update(index, challenge_rating - _k(bucket.games[index]) * surprise)
+            bucket.games[index] += 1
+            if player is not None:
+                player.rating += _k(player.games) * surprise
+                player.games += 1
+                key = (match.level, match.language)
+                player.recent[key] = player.recent.get(key, 0) | (1 << index)
+
+    def player_rating(self, name):
+        """A player's rating and games played"""
+        with self._lock:
+            player = self._players.get(name)
+            if player is None:
+                return {'rating': DEFAULT_PLAYER_RATING, 'games': 0}
+            return {'rating': round(player.rating, 1), 'games': player.games}
+
+    def challenge_rating(self, level, language, index):
+        """A challenge's rating"""
+        with self._lock:
+            bucket = self._buckets.get((level, language))
+            if bucket is None or index >= len(bucket.ratings):
+                return LEVEL_RATINGS.get(level, DEFAULT_PLAYER_RATING)
+            return round(bucket.ratings[index], 1)
+
+    def pick(self, level, language, count, name):
+        """Index of a challenge near the player's rating that they have not played recently.
+
+        count is the number of challenges in the bucket right now. Returns
+        None if there are none. The pick is remembered as played.
+        """
+        if not count:
+            return None
+        with self._lock:
+            bucket = self._bucket(level, language)
+            bucket.grow(count)
+            player = self._player(name) if name != ANONYMOUS else None
+            target = player.rating if player else DEFAULT_PLAYER_RATING
+            key = (level, language)
+            recent = player.recent.get(key, 0) if player else 0
+            if bin(recent & ((1 << count) - 1)).count('1') >= count:
+                # Everything has been played: start over
+                recent = 0
+
+            order, window = bucket.order, self.window
+            while True:
+                low = bisect_left(order, (target - window, -1))
+                high = bisect_right(order, (target + window, count))
+                index = self._choose(order, low, high, count, recent)
+                if index is not None or (low == 0 and high == len(order)):
+                    break
+                window *= 2
+            if index is None:
+                index = random.randrange(count)
+
+            if player is not None:
+                player.recent[key] = recent | (1 << index)
+            return index
+
+    def _choose(self, order, low, high, count, recent):
+        # A few random tries, then a scan, for a fresh challenge in order[low:high]
+        if low >= high:
+            return None
+        for _ in range(self._attempts):
+            index = order[random.randrange(low, high)][1]
+            if index < count and not recent >> index & 1:
+                return index
+        candidates = [index for _, index in order[low:high] if index < count and not recent >> index & 1]
+        return random.choice(candidates) if candidates else None
@@ -0,0 +1,409 @@
+"""Head-to-head multiplayer rooms.
+
+Players in a room get the same challenge at the same moment and race each
+other (and the AI's time). Room events (players joining, the countdown, each
+submission and its result, the final standings) are pushed to every
+subscriber from a single asyncio event loop running in a background thread:
+publishing from a request thread only schedules the fan-out on that loop,
+and countdowns and deadlines are loop timers rather than threads.
+
+The registry is bounded. It holds at most ``capacity`` rooms, each with at
+most ``max_players`` players and a few subscribers with bounded event queues.
+Finished and abandoned rooms are swept, and a subscriber that falls behind
+is disconnected (it reconnects and gets a fresh snapshot) instead of
+buffering without limit.
+"""
+import asyncio
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds of "3, 2, 1" before the challenge is revealed
+COUNTDOWN_SECONDS = 3
+
+# Marks a subscription the hub has closed
+_CLOSED = {'type': 'closed'}
+
+
+class RoomError(Exception):
+    """Raised when a room action is not allowed in the room's current state"""
+
+
+class RoomNotFound(RoomError):
+    """Raised for unknown or expired room IDs"""
+
+
+class RoomsFull(RoomError):
+    """Raised when the registry has no room for another active room"""
+
+
+class _Player:
+    __slots__ = ('name', 'submitted_at', 'result')
+
+    def __init__(self, name):
+        self.name = name
+        self.submitted_at = None
+        self.result = None
+
+
+class Room:
+    """One match: its challenge, players and subscribers"""
+
+    __slots__ = ('id', 'level', 'language', 'challenge', 'source', 'ai_time', 'time_limit', 'host',
+                 'players', 'state', 'started_at', 'started_wall', 'updated_at', 'subscribers',
+                 'timers')
+
+    def __init__(self, room_id, level, language, challenge, source, ai_time, time_limit):
+        self.id = room_id
+        self.level = level
+        self.language = language
+        # What players see, and the (catalog_version, index) it was drawn from
+        self.challenge = challenge
+        self.source = source
+        self.ai_time = ai_time
+        self.time_limit = time_limit
+        self.host = None
+        # player_id -> _Player; the ID is the player's secret, names are public
+        self.players = OrderedDict()
+        self.state = 'waiting'
+        self.started_at = None
+        self.started_wall = None
+        self.updated_at = time.monotonic()
+        # asyncio.Queue per subscriber, only touched on the event loop
+        self.subscribers = set()
+        self.timers = []
+
+    def standings(self):
+        """Players ordered by correct fixes first, then by time"""
+        rows = []
+        for player in self.players.values():
+            result = player.result or {}
+            rows.append({'player': player.name, 'submitted': player.submitted_at is not None,
+                         'is_correct': result.get('is_correct'), 'user_time': result.get('user_time'),
+                         'beat_ai': result.get('winner') == 'human'})
+        rows.sort(key=lambda row: (not row['is_correct'], row['user_time'] is None,
+                                   row['user_time'] or 0))
+        return rows
+
+    def snapshot(self):
+        """Public state of the room, sent to every new subscriber"""
+        state = {'type': 'state', 'room_id': self.id, 'state': self.state, 'level': self.level,
+                 'language': self.language, 'players': [p.name for p in self.players.values()],
+                 'time_limit': self.time_limit}
+        if self.state in ('running', 'finished'):
+            state['challenge'] = self.challenge
+            state['elapsed'] = round(time.monotonic() - self.started_at, 2)
+        if self.state == 'finished':
+            state['standings'] = self.standings()
+            state['ai_time'] = self.ai_time
+        return state
+
+
+class RoomHub:
+    """Bounded room registry with event fan-out on a background asyncio loop"""
+
+    def __init__(self, capacity=5000, max_players=8, max_subscribers=16, queue_size=64,
+                 idle_seconds=600, finished_seconds=120, sweep_interval=30.0):
+        self.capacity = capacity
+        self.max_players = max_players
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.idle_seconds = idle_seconds
+        self.finished_seconds = finished_seconds
+        self.sweep_interval = sweep_interval
+        # room_id -> Room, least recently active first
+        self._rooms = OrderedDict()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._loop_pid = None
+        self._loop_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rooms)
+
+    # --- event loop ------------------------------------------------------------
+
+    def loop(self):
+        """The hub's event loop, started on first use in each process"""
+        if self._loop_pid != os.getpid():
+            with self._loop_lock:
+                if self._loop_pid != os.getpid():
+                    self._rooms = OrderedDict()
+                    self._loop = loop = asyncio.new_event_loop()
+                    threading.Thread(target=self._run_loop, args=(loop,), daemon=True,
+                                     name='room-events').start()
+                    self._loop_pid = os.getpid()
+        return self._loop
+
+    def _run_loop(self, loop):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(self._sweep_periodically)
+        loop.run_forever()
+
+    def _sweep_periodically(self):
+        self.sweep()
+        self._loop.call_later(self.sweep_interval, self._sweep_periodically)
+
+    def _later(self, room, delay, callback, *args):
+        # Loop timers are created on the loop thread; handles are kept to cancel them
+        def schedule():
+            room.timers.append(self._loop.call_later(delay, callback, *args))
+        self.loop().call_soon_threadsafe(schedule)
+
+    def publish(self, room, event):
+        """Send an event to every subscriber of a room"""
+        self.loop().call_soon_threadsafe(self._fan_out, room, event)
+
+    def _fan_out(self, room, event):
+        for queue in list(room.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind: disconnect it; it will resubscribe and get a snapshot
+                self._close(room, queue)
+
+    def _close(self, room, queue):
+        room.subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(_CLOSED)
+
+    # --- registry --------------------------------------------------------------
+
+    def _touch(self, room):
+        room.updated_at = time.monotonic()
+        self._rooms.move_to_end(room.id)
+
+    def _get(self, room_id):
+        room = self._rooms.get(room_id)
+        if room is None:
+            raise RoomNotFound('Room not found or expired')
+        return room
+
+    def create(self, level, language, challenge, source, ai_time, time_limit, host_name):
+        """Open a room and join its host; returns (room, host player ID)"""
+        self.loop()
+        with self._lock:
+            if len(self._rooms) >= self.capacity:
+                self._sweep_locked()
+                if len(self._rooms) >= self.capacity:
+                    raise RoomsFull('Too many rooms are open; try again shortly')
+            room_id = secrets.token_urlsafe(6)
+            while room_id in self._rooms:
+                room_id = secrets.token_urlsafe(6)
+            room = self._rooms[room_id] = Room(room_id, level, language, challenge, source,
+                                                   ai_time, time_limit)
+            player_id = self._join_locked(room, host_name)
+            room.host = player_id
+        return room, player_id
+
+    def join(self, room_id, name):
+        """Add a player to a waiting room; returns (room, player ID)"""
+        with self._lock:
+            room = self._get(room_id)
+            if room.state != 'waiting':
+                raise RoomError('This room has already started')
+            if len(room.players) >= self.max_players:
+                raise RoomError('This room is full')
+            player_id = self._join_locked(room, name)
+        self.publish(room, {'type': 'joined', 'player': name,
+                            'players': [p.name for p in room.players.values()]})
+        return room, player_id
+
+    def _join_locked(self, room, name):
+        names = {player.name for player in room.players.values()}
+        base, suffix = name, 2
+        while name in names:
+            name, suffix = f'{base} ({suffix})', suffix + 1
+        player_id = secrets.token_urlsafe(12)
+        room.players[player_id] = _Player(name)
+        self._touch(room)
+        return player_id
+
+    def start(self, room_id, player_id):
+        """Begin the countdown; only the host may start a room"""
+        with self._lock:
+            room = self._get(room_id)
+            if player_id != room.host:
+                raise RoomError('Only the host can start the room')
+            if room.state != 'waiting':
+                raise RoomError('This room has already started')
+            room.state = 'countdown'
+            self._touch(room)
+        for remaining in range(COUNTDOWN_SECONDS, 0, -1):
+            self._later(room, COUNTDOWN_SECONDS - remaining, self.publish, room,
+                        {'type': 'countdown', 'seconds': remaining})
+        self._later(room, COUNTDOWN_SECONDS, self._begin, room)
+        return room
+
+    def _begin(self, room):
+        with self._lock:
+            if room.state != 'countdown':
+                return
+            room.state = 'running'
+            room.started_at = time.monotonic()
+            room.started_wall = time.time()
+            self._touch(room)
+        self.publish(room, {'type': 'start', 'challenge': room.challenge,
+                            'time_limit': room.time_limit})
+        room.timers.append(self._loop.call_later(room.time_limit, self._deadline, room))
+
+    def submit(self, room_id, player_id):
+        """Mark a player's submission and return the seconds since the start"""
+        with self._lock:
+            room = self._get(room_id)
+            player = room.players.get(player_id)
+            if player is None:
+                raise RoomError('You are not in this room')
+            if room.state != 'running':
+                raise RoomError('This room is not running')
+            if player.submitted_at is not None:
+                raise RoomError('You have already submitted')
+            player.submitted_at = time.monotonic()
+            user_time = player.submitted_at - room.started_at
+            self._touch(room)
+        self.publish(room, {'type': 'submitted', 'player': player.name,
+                            'user_time': round(user_time, 2)})
+        return room, user_time
+
+    def report(self, room_id, player_id, result):
+        """Record a graded submission and finish the room once everyone has a result"""
+        with self._lock:
+            room = self._rooms.get(room_id)
+            player = room.players.get(player_id) if room else None
+            if player is None:
+                return
+            player.result = result
+            finished = self._maybe_finish_locked(room)
+        self.publish(room, {'type': 'result', 'player': player.name,
+                            'is_correct': result['is_correct'], 'user_time': round(result['user_time'], 2)})
+        if finished:
+            self._finished(room)
+
+    def _deadline(self, room):
+        with self._lock:
+            if room.state != 'running':
+                return
+            timed_out = []
+            for player in room.players.values():
+                if player.submitted_at is None:
+                    player.submitted_at = room.started_at + room.time_limit
+                    player.result = {'is_correct': False, 'user_time': None, 'winner': 'ai'}
+                    timed_out.append(player.name)
+            finished = self._maybe_finish_locked(room)
+        if timed_out:
+            self.publish(room, {'type': 'timeout', 'players': timed_out})
+        if finished:
+            self._finished(room)
+
+    def _maybe_finish_locked(self, room):
+        if room.state != 'running' or any(p.result is None for p in room.players.values()):
+            return False
+        room.state = 'finished'
+        self._touch(room)
+        return True
+
+    def _finished(self, room):
+        standings = room.standings()
+        winner = standings[0]['player'] if standings and standings[0]['is_correct'] else None
+        self.publish(room, {'type': 'finished', 'winner': winner, 'standings': standings,
+                            'ai_time': room.ai_time})
+
+    def room(self, room_id):
+        """Return a room by ID or raise RoomNotFound"""
+        with self._lock:
+            return self._get(room_id)
+
+    # --- subscriptions ---------------------------------------------------------
+
+    def subscribe(self, room_id):
+        """Start receiving a room's events, beginning with a snapshot of its state"""
+        room = self.room(room_id)
+        future = asyncio.run_coroutine_threadsafe(self._subscribe(room), self.loop())
+        return Subscription(self, room, future.result())
+
+    async def _subscribe(self, room):
+        if len(room.subscribers) >= self.max_subscribers:
+            raise RoomError('Too many viewers in this room')
+        queue = asyncio.Queue(self.queue_size)
+        queue.put_nowait(room.snapshot())
+        room.subscribers.add(queue)
+        return queue
+
+    # --- expiry ----------------------------------------------------------------
+
+    def sweep(self):
+        """Drop finished and abandoned rooms; returns how many were removed"""
+        with self._lock:
+            return self._sweep_locked()
+
+    def _sweep_locked(self):
+        now = time.monotonic()
+        removed = []
+        # Least recently active first, so stop at the first room still in use
+        for room in list(self._rooms.values()):
+            age = now - room.updated_at
+            if age < min(self.idle_seconds, self.finished_seconds):
+                break
+            if room.state == 'finished' and age >= self.finished_seconds:
+                removed.append(room)
+            elif room.state in ('waiting', 'countdown') and age >= self.idle_seconds:
+                removed.append(room)
+            elif room.state == 'running' and age >= self.idle_seconds + room.time_limit:
+                removed.append(room)
+        for room in removed:
+            del self._rooms[room.id]
+            self._loop.call_soon_threadsafe(self._discard, room)
+        return len(removed)
+
+    def _discard(self, room):
+        for timer in room.timers:
+            timer.cancel()
+        for queue in list(room.subscribers):
+            self._close(room, queue)
+
+
+class Subscription:
+    """A subscriber's view of a room's event stream"""
+
+    def __init__(self, hub, room, queue):
+        self._hub = hub
+        self._room = room
+        self._queue = queue
+        self.closed = False
+
+    def get(self, timeout):
+        """Next event, or None if nothing arrived within timeout seconds"""
+        if self.closed:
+            return None
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(self._queue.get(), timeout), self._hub.loop())
+        try:
+            event = future.result()
+        except asyncio.TimeoutError:
+            return None
+        if event is _CLOSED:
+            self.closed = True
+            return None
+        return event
+
+    async def aget(self, timeout):
+        """Like get, for callers already running on the hub's event loop"""
+        if self.closed:
+            return None
+        try:
+            event = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is _CLOSED:
+            self.closed = True
+            return None
+        return event
+
+    def close(self):
+        """Stop receiving events"""
+        if not self.closed:
+            self.closed = True
+            self._hub.loop().call_soon_threadsafe(self._room.subscribers.discard, self._queue)
@@ -0,0 +1,212 @@
+"""Execution-based grading: run submissions against per-challenge tests.
+
+Python and JavaScript submissions go to pools of warm worker processes
+(``sandbox_worker.py`` / ``sandbox_worker.js``) that are started once and
+reused, so a submission doesn't pay interpreter startup. Each Python job runs
+in a freshly forked child with CPU, memory, file and process limits, inside
+its own network, PID and mount namespaces; each JavaScript job runs in a
+fresh vm context with code generation disabled. Java is not executed: a JVM
+gets none of those limits, so Java submissions stay on the rule grader.
+
+Jobs wait in a bounded queue per language; when it is full ``submit`` raises
+``GraderBusy`` so callers can fall back instead of piling up work. Results
+are cached by (challenge, normalized code hash).
+"""
+import hashlib
+import json
+import os
+import queue
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ExecutionResult = namedtuple('ExecutionResult', 'passed timed_out error')
+
+
+class GraderBusy(Exception):
+    """Raised when the execution grader's queue is full"""
+
+
+class GraderUnavailable(Exception):
+    """Raised when a worker could not run a job (crash, missing interpreter)"""
+
+
+def normalize_source(code):
+    """Normalize code in ways that never change what it does, for cache keys"""
+    lines = [line.rstrip() for line in code.replace('\r\n', '\n').split('\n')]
+    while lines and not lines[-1]:
+        lines.pop()
+    return '\n'.join(lines)
+
+
+class _WorkerProcess:
+    """One warm interpreter speaking the JSON-lines job protocol"""
+
+    def __init__(self, argv):
+        self.argv = argv
+        self.proc = None
+        self.jobs = 0
+
+    def _start(self):
+        self.proc = subprocess.Popen(self.argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.DEVNULL, cwd=tempfile.gettempdir(),
+                                     env={'PATH': os.environ.get('PATH', '')}, close_fds=True)
+
+    def stop(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def run(self, job):
+        if self.proc is None or self.proc.poll() is not None:
+            self._start()
+        ready = False
+        try:
+            self.proc.stdin.write((json.dumps(job) + '\n').encode())
+            self.proc.stdin.flush()
+            # Give the worker a little longer than the job's own timeout
+            ready, _, _ = select.select([self.proc.stdout], [], [], job['timeout'] + 2)
+            line = self.proc.stdout.readline() if ready else b''
+        except OSError:
+            line = b''
+        if not line:
+            # Hung or crashed: start a fresh worker for the next job
+            self.stop()
+            if not ready:
+                return ExecutionResult(False, True, f'Timed out after {job["timeout"]:g} seconds')
+            raise GraderUnavailable('Execution worker crashed')
+        self.jobs += 1
+        reply = json.loads(line)
+        if reply.get('unavailable'):
+            raise GraderUnavailable(reply['error'])
+        return ExecutionResult(reply['passed'], reply['timed_out'], reply['error'])
+
+
+class _Pool:
+    """Fixed set of runners fed from one bounded queue"""
+
+    def __init__(self, make_runner, size, queue_size):
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._runners = [make_runner() for _ in range(size)]
+        for index, runner in enumerate(self._runners):
+            threading.Thread(target=self._serve, args=(runner,), daemon=True,
+                             name=f'execution-grader-{index}').start()
+
+    def submit(self, job):
+        future = Future()
+        try:
+            self._jobs.put_nowait((job, future))
+        except queue.Full:
+            raise GraderBusy('Execution grader queue is full')
+        return future
+
+    def _serve(self, runner):
+        while True:
+            job, future = self._jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(runner.run(job))
+            except Exception as exc:
+                future.set_exception(exc)
+
+    def stop(self):
+        for runner in self._runners:
+            runner.stop()
+
+
+class ExecutionGrader:
+    """Runs submissions against challenge tests on warm, sandboxed workers"""
+
+    def __init__(self, workers=2, queue_size=16, timeout=3.0, cache_size=4096):
+        self.timeout = timeout
+        self._workers = workers
+        self._queue_size = queue_size
+        self._commands = {'python': [sys.executable, '-I', os.path.join(HERE, 'sandbox_worker.py')]}
+        node = shutil.which('node')
+        if node:
+            self._commands['javascript'] = [node, '--disallow-code-generation-from-strings',
+                                            '--max-old-space-size=128',
+                                            os.path.join(HERE, 'sandbox_worker.js')]
+        self._pools = {}
+        self._pools_pid = None
+        self._pools_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_lock = threading.Lock()
+        self._job_ids = 0
+
+    def supports(self, language):
+        """Whether submissions in this language can be executed here"""
+        return language in self._commands
+
+    def _pool(self, language):
+        # Worker processes and their threads belong to the process that started them
+        if self._pools_pid != os.getpid():
+            with self._pools_lock:
+                if self._pools_pid != os.getpid():
+                    self._pools = {}
+                    self._pools_pid = os.getpid()
+        pool = self._pools.get(language)
+        if pool is None:
+            with self._pools_lock:
+                pool = self._pools.get(language)
+                if pool is None:
+                    pool = self._pools[language] = _Pool(lambda: _WorkerProcess(self._commands[language]),
+                                                         self._workers, self._queue_size)
+        return pool
+
+    def cache_key(self, challenge, code):
+        digest = hashlib.sha256(normalize_source(code).encode('utf-8', 'surrogatepass')).hexdigest()
+        return (challenge.get('catalog_version'), challenge['id'], digest)
+
+    def submit(self, challenge, code):
+        """Queue a submission; returns a Future resolving to an ExecutionResult"""
+        key = self.cache_key(challenge, code)
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        self._job_ids += 1
+        job = {'id': self._job_ids, 'code': code, 'tests': challenge['tests'],
+               'setup': challenge.get('test_setup', ''), 'timeout': self.timeout}
+        future = self._pool(challenge['language']).submit(job)
+        future.add_done_callback(lambda done: self._remember(key, done))
+        return future
+
+    def _remember(self, key, future):
+        if future.exception() is not None:
+            return
+        with self._cache_lock:
+            self._cache[key] = future.result()
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def grade(self, challenge, code):
+        """Run a submission against its challenge's tests and wait for the result"""
+        future = self.submit(challenge, code)
+        try:
+            return future.result(timeout=self.timeout * 2 + 2)
+        except FutureTimeout:
+            # Still queued behind other work: drop it rather than run it late
+            future.cancel()
+            raise GraderUnavailable('Execution grader did not answer in time')
+
+    def stop(self):
+        """Stop every worker process started by this process"""
+        with self._pools_lock:
+            for pool in self._pools.values():
+                pool.stop()
@@ -0,0 +1,79 @@
+// Warm JavaScript worker for the execution grader (see sandbox.py).
+//
+// Started once with `node --disallow-code-generation-from-strings sandbox_worker.js`
+// and reused: it reads one JSON job per line from stdin, runs the submission
+// and its tests in a fresh vm context (no require, process or network APIs),
+// and writes one JSON result per line to stdout. The parent kills and
+// restarts this process if a job overruns its wall-clock timeout.
+//
+// The submission runs as a script of its own, so nothing in it (a top-level
+// `return`, say) can skip the tests. A job passes only when the tests run to
+// their end and hand back a per-job secret the submission never sees.
+'use strict';
+
+const crypto = require('crypto');
+const readline = require('readline');
+const vm = require('vm');
+
+function assert(condition, message) {
+    if (!condition) {
+        throw new Error(message ? `Assertion failed: ${message}` : 'Assertion failed');
+    }
+}
+
+const silentConsole = { log() {}, info() {}, warn() {}, error() {}, debug() {} };
+
+async function runJob(job) {
+    const timeoutMs = Math.round(job.timeout * 1000);
+    const context = vm.createContext({
+        console: silentConsole,
+        assert,
+        setTimeout,
+        clearTimeout,
+        setInterval,
+        clearInterval,
+    }, { codeGeneration: { strings: false, wasm: false } });
+
+    // Top-level declarations of the submission are globals the tests can see.
+    // Top-level await is allowed in tests, so they run in an async function,
+    // strict so that nothing they call can read them through `caller`.
+    const secret = crypto.randomBytes(16).toString('hex');
+    const tests = `(async () => {\n'use strict';\n${job.tests}\n;\nreturn '${secret}';\n})()`;
+    let timer;
+    try {
+        const submission = new vm.Script(`${job.setup || ''}\n${job.code}\n`, { filename: 'submission.js' });
+        const harness = new vm.Script(tests, { filename: 'tests.js' });
+        const started = Date.now();
+        submission.runInContext(context, { timeout: timeoutMs });
+        const promise = harness.runInContext(context, { timeout: Math.max(1, timeoutMs - (Date.now() - started)) });
+        // This realm's `then`: the submission may have replaced the context's own
+        const run = new Promise((resolve, reject) => Promise.prototype.then.call(promise, resolve, reject));
+        const expired = new Promise((_, reject) => {
+            timer = setTimeout(() => reject(new Error(`Timed out after ${job.timeout} seconds`)), timeoutMs);
+        });
+        if (await Promise.race([run, expired]) !== secret) {
+            throw new Error('The tests did not run to completion');
+        }
+        return { id: job.id, passed: true, timed_out: false, error: null };
+    } catch (error) {
+        const message = String(error && error.message ? error.message : error).slice(0, 1000);
+        return { id: job.id, passed: false, timed_out: message.startsWith('Timed out') || message.includes('timed out'), error: message };
+    } finally {
+        clearTimeout(timer);
+    }
+}
+
+// A submission's own stray rejections must not take the worker down with them
+process.on('unhandledRejection', () => {});
+
+const input = readline.createInterface({ input: process.stdin });
+let queue = Promise.resolve();
+input.on('line', (line) => {
+    if (!line.trim()) {
+        return;
+    }
+    const job = JSON.parse(line);
+    queue = queue.then(() => runJob(job)).then((result) => {
+        process.stdout.write(JSON.stringify(result) + '\n');
+    });
+});
@@ -0,0 +1,260 @@
+"""Warm Python worker for the execution grader (see sandbox.py).
+
+Started once with ``python -I sandbox_worker.py`` and reused: it reads one
+JSON job per line from stdin, forks a resource-limited child for each job so
+every submission starts from a clean, already-initialised interpreter, and
+writes one JSON result per line to stdout. Only the standard library is used.
+
+Each child runs in its own user, mount, PID and network namespaces: no
+network, no view of other processes, and no environment. A host that cannot
+create them gets no execution grading rather than a weaker sandbox.
+
+The exit status never decides a result: the submission runs in the same
+process as its tests and could simply exit 0. The harness reports over a pipe
+instead, prefixed with a per-job nonce; no report, or a report without the
+nonce, is a failure. (Code that digs the nonce out of the interpreter's own
+frames could still forge a report; exiting early or skipping the tests
+cannot.)
+"""
+import builtins
+import ctypes
+import json
+import os
+import secrets
+import resource
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MEMORY_LIMIT = 256 * 1024 * 1024
+MAX_MESSAGE = 1000
+
+# Processes a submission may run at once, itself included
+MAX_PROCESSES = 8
+
+# Who submissions run as when the worker itself runs as root, which
+# RLIMIT_NPROC does not apply to
+NOBODY = 65534
+
+# Outcomes the harness reports after the nonce
+PASSED = 'passed'
+FAILED = 'failed'
+UNAVAILABLE = 'unavailable'
+
+# Longest report read back: nonce, outcome and message
+MAX_REPORT = 64 + MAX_MESSAGE * 4
+
+CLONE_NEWNS = 0x00020000
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWPID = 0x20000000
+CLONE_NEWNET = 0x40000000
+
+MS_NOSUID = 0x2
+MS_NODEV = 0x4
+MS_NOEXEC = 0x8
+MS_REC = 0x4000
+MS_PRIVATE = 0x40000
+
+_libc = ctypes.CDLL(None, use_errno=True)
+
+# Set once a job has found that this host cannot sandbox; later jobs fail fast
+_unavailable = None
+
+
+def _check(result):
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def _mount(source, target, fstype, flags):
+    _check(_libc.mount(source and source.encode(), target.encode(), fstype and fstype.encode(),
+                       flags, None))
+
+
+def _enter_namespaces(workdir):
+    """Give up root, then move into fresh user, mount, PID and network namespaces"""
+    if os.getuid() == 0:
+        os.chown(workdir, NOBODY, NOBODY)
+        os.setgroups([])
+        os.setgid(NOBODY)
+        os.setuid(NOBODY)
+    # No fallback: without a network namespace the submission does not run at all
+    _check(_libc.unshare(CLONE_NEWUSER | CLONE_NEWNS | CLONE_NEWPID | CLONE_NEWNET))
+
+
+def _hide_host():
+    # Runs as PID 1 of the new namespace. Only the submission's own processes
+    # show up in /proc, and the application directory (match history, config)
+    # is covered by an empty tmpfs.
+    _mount(None, '/', None, MS_REC | MS_PRIVATE)
+    flags = MS_NOSUID | MS_NODEV | MS_NOEXEC
+    try:
+        _mount('proc', '/proc', 'proc', flags)
+    except OSError:
+        # Hosts that mask parts of /proc refuse a new one; hide it instead
+        _mount('tmpfs', '/proc', 'tmpfs', flags)
+    if os.access(HERE, os.X_OK):
+        # (Otherwise the submission cannot reach it anyway)
+        _mount('tmpfs', HERE, 'tmpfs', flags)
+
+
+def _limit_child(timeout, workdir):
+    _hide_host()
+    cpu = int(timeout) + 1
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+    resource.setrlimit(resource.RLIMIT_AS, (MEMORY_LIMIT, MEMORY_LIMIT))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (1024 * 1024, 1024 * 1024))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+    # Run in an empty scratch directory with no environment and no terminal
+    os.chdir(workdir)
+    os.environ.clear()
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+
+
+def _report(report_fd, nonce, outcome, message=''):
+    os.write(report_fd, f'{nonce} {outcome}\n{message[:MAX_MESSAGE]}'.encode('utf-8', 'replace'))
+
+
+def _run_in_child(job, workdir, report_fd, nonce):
+    try:
+        _limit_child(job['timeout'], workdir)
+    except OSError as exc:
+        _report(report_fd, nonce, UNAVAILABLE, f'Sandbox unavailable: {exc}')
+        os._exit(1)
+    outcome, message = FAILED, ''
+    try:
+        namespace = {'__name__': '__main__', '__builtins__': builtins}
+        exec(compile(job.get('setup', '') + job['code'], '<submission>', 'exec'), namespace)
+        exec(compile(job['tests'], '<tests>', 'exec'), namespace)
+        outcome = PASSED
+    except AssertionError as exc:
+        message = f'Assertion failed: {exc}' if str(exc) else 'Assertion failed'
+    except BaseException as exc:
+        message = f'{type(exc).__name__}: {exc}'
+    try:
+        _report(report_fd, nonce, outcome, message)
+    finally:
+        os._exit(0)
+
+
+def _supervise(job, workdir, report_fd, nonce):
+    # Forked per job: builds the sandbox, then forks the submission into it as
+    # PID 1. When PID 1 exits the kernel kills everything else in the
+    # namespace, including processes that left the process group with setsid().
+    status = 1
+    try:
+        os.setpgid(0, 0)
+        try:
+            _enter_namespaces(workdir)
+            resource.setrlimit(resource.RLIMIT_NPROC, (MAX_PROCESSES, MAX_PROCESSES))
+        except OSError as exc:
+            _report(report_fd, nonce, UNAVAILABLE, f'Sandbox unavailable: {exc}')
+            return
+        # The worker asks for a time-out kill with SIGTERM, held back until the handler is in place
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+        child = os.fork()
+        if child == 0:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+            _run_in_child(job, workdir, report_fd, nonce)
+        signal.signal(signal.SIGTERM, lambda *args: os.kill(child, signal.SIGKILL))
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+        _, raw = os.waitpid(child, 0)
+        status = os.WEXITSTATUS(raw) if os.WIFEXITED(raw) else 128 + os.WTERMSIG(raw)
+    finally:
+        os._exit(status)
+
+
+def _kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_job(job):
+    """Run one job in a sandboxed child and return its result dict"""
+    global _unavailable
+    if _unavailable is not None:
+        return {'id': job['id'], 'passed': False, 'timed_out': False, 'error': _unavailable,
+                'unavailable': True}
+    workdir = tempfile.mkdtemp(prefix='bughunt-')
+    nonce = secrets.token_hex(16)
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        _supervise(job, workdir, write_fd, nonce)
+    os.close(write_fd)
+
+    deadline = time.monotonic() + job['timeout']
+    timed_out = False
+    while True:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            break
+        if time.monotonic() >= deadline:
+            timed_out = True
+            os.kill(pid, signal.SIGTERM)
+            grace = time.monotonic() + 1.0
+            while not done and time.monotonic() < grace:
+                time.sleep(0.002)
+                done, status = os.waitpid(pid, os.WNOHANG)
+            if not done:
+                _kill_group(pid)
+                _, status = os.waitpid(pid, 0)
+            break
+        time.sleep(0.002)
+    # Whatever finished or not, nothing from this job outlives it
+    _kill_group(pid)
+
+    # Never blocks: the report is already in the pipe, or there is none
+    os.set_blocking(read_fd, False)
+    try:
+        report = os.read(read_fd, MAX_REPORT).decode('utf-8', 'replace')
+    except BlockingIOError:
+        report = ''
+    finally:
+        os.close(read_fd)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    # Anything the submission wrote itself lacks the nonce and counts as no report
+    head, _, message = report.partition('\n')
+    outcome = head[len(nonce) + 1:] if head.startswith(nonce + ' ') else None
+    if outcome == UNAVAILABLE:
+        _unavailable = message or 'Sandbox unavailable'
+        return {'id': job['id'], 'passed': False, 'timed_out': False, 'error': _unavailable,
+                'unavailable': True}
+    code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else None
+    if timed_out:
+        message = f'Timed out after {job["timeout"]:g} seconds'
+    elif outcome is None:
+        if code is not None and code > 128:
+            message = f'Killed by signal {code - 128} (resource limit)'
+        elif os.WIFSIGNALED(status):
+            message = f'Killed by signal {os.WTERMSIG(status)} (resource limit)'
+        else:
+            message = 'The submission exited before its tests finished'
+    passed = not timed_out and outcome == PASSED
+    return {'id': job['id'], 'passed': passed, 'timed_out': timed_out, 'error': message or None}
+
+
+def main():
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        job = json.loads(line)
+        sys.stdout.write(json.dumps(run_job(job)) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Pages rendered once and served from memory.
+
+The site's HTML pages have no per-request data, so each is rendered a single
+time and kept as ready-to-send bytes: plain, gzip and, when the optional
+``brotli`` package is installed, brotli. Every encoding gets a strong ETag,
+so revalidation requests are answered ``304 Not Modified`` without sending
+the page again, and ``Cache-Control`` lets browsers and CDNs reuse it for a
+while without asking at all.
+"""
+import gzip
+import hashlib
+import threading
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class StaticPage:
+    """One rendered page in every encoding it can be sent in"""
+
+    __slots__ = ('bodies', 'etags')
+
+    def __init__(self, html):
+        body = html.encode()
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        # Content-Encoding -> bytes; each encoding is its own representation with its own tag
+        self.bodies = {None: body, 'gzip': gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body, quality=11)
+        self.etags = {encoding: f'{digest}-{encoding}' if encoding else digest
+                      for encoding in self.bodies}
+
+
+class StaticPages:
+    """Renders pages on first use (or ahead of time) and serves the cached bytes"""
+
+    def __init__(self, render, max_age=300):
+        self._render = render
+        self.max_age = max_age
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, reload=False):
+        """Return the rendered page, rendering it if this is the first use"""
+        page = self._pages.get(name)
+        if page is None or reload:
+            with self._lock:
+                page = None if reload else self._pages.get(name)
+                if page is None:
+                    page = self._pages[name] = StaticPage(self._render(name))
+        return page
+
+    def prerender(self, names):
+        """Render pages ahead of their first request"""
+        for name in names:
+            self.get(name)
+
+    def response(self, name, request, reload=False):
+        """Serve a page in the best encoding the client accepts, or 304 if it has it already"""
+        page = self.get(name, reload)
+        encoding = None
+        if 'br' in page.bodies and request.accept_encodings['br']:
+            encoding = 'br'
+        elif request.accept_encodings['gzip']:
+            encoding = 'gzip'
+
+        # A tag the client holds for any encoding means it has the current page
+        if any(request.if_none_match.contains(etag) for etag in page.etags.values()):
+            response = Response(status=304)
+        else:
+            response = Response(page.bodies[encoding], mimetype='text/html')
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(page.etags[encoding])
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = f'public, max-age={self.max_age}'
+        return response
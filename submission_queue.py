@@ -0,0 +1,259 @@
+"""Asynchronous grading queue behind ``/submit-fix``.
+
+Submissions are accepted immediately and graded by a small pool of worker
+threads. Pending jobs are kept per client and served round-robin, so one
+client submitting in a loop cannot starve everybody else; both the whole
+queue and each client's share of it are bounded, and a full queue rejects
+new work instead of growing. Job states and results are written to a
+challenge store so any worker process sharing that store can answer polls.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Raised when the submission queue cannot take more work"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ClientQueueFull(QueueFull):
+    """Raised when one client already has its maximum number of pending jobs"""
+
+
+class SubmissionQueue:
+    """Bounded, per-client fair job queue drained by a thread pool"""
+
+    def __init__(self, handler, results, workers=4, capacity=64, per_client=4,
+                 result_ttl=300, poll_interval=0.25):
+        self._handler = handler
+        self._results = results
+        self._workers = workers
+        self._capacity = capacity
+        self._per_client = per_client
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        # client -> deque of (job_id, payload); _ring holds clients with pending jobs
+        self._pending = {}
+        self._ring = deque()
+        self._size = 0
+        # job_id -> Event for jobs submitted to this process, and the asyncio
+        # futures of coroutines waiting on them
+        self._events = {}
+        self._futures = {}
+        self._threads_pid = None
+        # Moving average of job duration, used to suggest a Retry-After
+        self._avg_seconds = 0.5
+        self.rejected = 0
+
+    def _ensure_workers(self):
+        # Threads don't survive fork; each worker process starts its own pool
+        if self._threads_pid == os.getpid():
+            return
+        with self._lock:
+            if self._threads_pid == os.getpid():
+                return
+            self._threads_pid = os.getpid()
+            self._pending, self._ring, self._size, self._events, self._futures = {}, deque(), 0, {}, {}
+            for index in range(self._workers):
+                threading.Thread(target=self._serve, daemon=True,
+                                 name=f'submission-worker-{index}').start()
+
+    def __len__(self):
+        return self._size
+
+    def retry_after(self):
+        """Seconds a rejected client should wait before trying again"""
+        return max(1, math.ceil(self._size * self._avg_seconds / self._workers))
+
+    def submit(self, client, payload):
+        """Queue a job for client and return its ID, or raise QueueFull"""
+        self._ensure_workers()
+        job_id = self._results.new_id()
+        with self._lock:
+            jobs = self._pending.get(client)
+            if jobs is not None and len(jobs) >= self._per_client:
+                self.rejected += 1
+                raise ClientQueueFull('Too many submissions are already waiting to be graded',
+                                      self.retry_after())
+            if self._size >= self._capacity:
+                self.rejected += 1
+                raise QueueFull('The grading queue is full', self.retry_after())
+            self._results.set(job_id, json.dumps({'status': 'queued'}), self.result_ttl)
+            if jobs is None:
+                jobs = self._pending[client] = deque()
+                self._ring.append(client)
+            jobs.append((job_id, payload))
+            self._events[job_id] = threading.Event()
+            self._size += 1
+            self._ready.notify()
+        return job_id
+
+    def _next_job(self):
+        with self._lock:
+            while not self._ring:
+                self._ready.wait()
+            # Take one job from the client at the head, then send it to the back
+            client = self._ring.popleft()
+            jobs = self._pending[client]
+            job = jobs.popleft()
+            if jobs:
+                self._ring.append(client)
+            else:
+                del self._pending[client]
+            self._size -= 1
+            return job
+
+    def _store(self, job_id, record):
+        # A store that is briefly down (Redis restarting, SQLite locked) must not
+        # take a grading thread with it; the job is still graded and its waiters woken
+        try:
+            self._results.set(job_id, json.dumps(record), self.result_ttl)
+        except Exception:
+            logger.exception('Could not store the %s state of submission %s', record['status'], job_id)
+
+    def _serve(self):
+        while True:
+            job_id, payload = self._next_job()
+            try:
+                self._store(job_id, {'status': 'running'})
+                started = time.monotonic()
+                try:
+                    record = {'status': 'done', 'result': self._handler(payload)}
+                except Exception as exc:
+                    record = {'status': 'error', 'error': str(exc) or type(exc).__name__}
+                self._avg_seconds += (time.monotonic() - started - self._avg_seconds) * 0.2
+                self._store(job_id, record)
+            finally:
+                self._wake(job_id)
+
+    def _wake(self, job_id):
+        with self._lock:
+            event = self._events.pop(job_id, None)
+            futures = self._futures.pop(job_id, ())
+        if event is not None:
+            event.set()
+        for loop, future in futures:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def _forget(self, job_id, future):
+        with self._lock:
+            futures = self._futures.get(job_id)
+            if futures is not None:
+                futures[:] = [entry for entry in futures if entry[1] is not future]
+                if not futures:
+                    del self._futures[job_id]
+
+    def status(self, job_id):
+        """Return a job's state record, or None if it is unknown or expired"""
+        value = self._results.get(job_id)
+        return json.loads(value) if value is not None else None
+
+    def publish(self, job_id, record):
+        """Store a finished record produced outside the queue and wake local waiters"""
+        self._results.set(job_id, json.dumps(record), self.result_ttl)
+        self._wake(job_id)
+
+    def wait_published(self, job_id, timeout):
+        """Wait up to timeout seconds for a record that may not exist yet"""
+        record = self.status(job_id)
+        if record is not None:
+            return record
+        with self._lock:
+            event = self._events.setdefault(job_id, threading.Event())
+        try:
+            # Checked again in case it was published before the event was registered
+            record = self.status(job_id)
+            if record is None:
+                # Only a local publish sets the event; one by another process is
+                # found in the store once the timeout runs out
+                event.wait(timeout)
+                record = self.status(job_id)
+        finally:
+            with self._lock:
+                if self._events.get(job_id) is event:
+                    del self._events[job_id]
+        return record
+
+    def wait(self, job_id, timeout):
+        """Wait up to timeout seconds for a job to finish and return its state record"""
+        event = self._events.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+            return self.status(job_id)
+        # Submitted to another worker process: watch the shared store instead
+        deadline = time.monotonic() + timeout
+        while True:
+            record = self.status(job_id)
+            if record is None or record['status'] in ('done', 'error'):
+                return record
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return record
+            time.sleep(min(self.poll_interval, remaining))
+
+    async def wait_published_async(self, job_id, timeout):
+        """Like wait_published, for coroutines: no thread is held while waiting"""
+        record = self.status(job_id)
+        if record is not None:
+            return record
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            self._futures.setdefault(job_id, []).append((loop, future))
+        try:
+            record = self.status(job_id)
+            if record is None:
+                await _wait(future, timeout)
+                record = self.status(job_id)
+        finally:
+            self._forget(job_id, future)
+        return record
+
+    async def wait_async(self, job_id, timeout):
+        """Like wait, for coroutines: no thread is held while waiting"""
+        loop = asyncio.get_running_loop()
+        future = None
+        with self._lock:
+            if job_id in self._events:
+                future = loop.create_future()
+                self._futures.setdefault(job_id, []).append((loop, future))
+        if future is not None:
+            try:
+                await _wait(future, timeout)
+            finally:
+                self._forget(job_id, future)
+            return self.status(job_id)
+        deadline = loop.time() + timeout
+        while True:
+            record = self.status(job_id)
+            if record is None or record['status'] in ('done', 'error'):
+                return record
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return record
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+async def _wait(future, timeout):
+    try:
+        await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        pass
@@ -0,0 +1,371 @@
+"""Challenge store backends: claim, pop, TTLs and expiry.
+
+Every backend runs the same cases. Redis is tested against a small
+in-process server speaking the subset of the protocol the store uses; set
+BUGHUNT_TEST_REDIS_URL (e.g. redis://localhost:6379/15) to run the same cases
+against a real server as well. That database is flushed between tests.
+
+    python -m unittest discover tests
+    python -m pytest tests
+"""
+import fnmatch
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from challenge_store import (MemoryChallengeStore, RedisChallengeStore,  # noqa: E402
+                             SQLiteChallengeStore, StoreFull, create_challenge_store)
+
+# Short enough to keep the suite fast, long enough not to lapse mid-assertion
+TTL = 0.2
+
+
+class _FakeRedis(socketserver.ThreadingTCPServer):
+    """In-process server for the commands RedisChallengeStore sends"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _FakeRedisHandler)
+        self.lock = threading.Lock()
+        # db -> key -> (value, expires_at or None)
+        self.dbs = {}
+
+    def live(self, db):
+        now = time.monotonic()
+        keys = self.dbs.setdefault(db, {})
+        for key in [key for key, (_, expires_at) in keys.items() if expires_at and expires_at <= now]:
+            del keys[key]
+        return keys
+
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.db = 0
+        queued = None
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            name = command[0].upper()
+            if name == 'MULTI':
+                queued = []
+                self.write('+OK')
+            elif name == 'EXEC':
+                replies = [self.run(*queued_command) for queued_command in queued]
+                queued = None
+                self.write(replies)
+            elif queued is not None:
+                queued.append(command)
+                self.write('+QUEUED')
+            else:
+                self.write(self.run(*command))
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def run(self, name, *args):
+        server = self.server
+        with server.lock:
+            keys = server.live(self.db)
+            name = name.upper()
+            if name == 'AUTH':
+                return '+OK'
+            if name == 'SELECT':
+                self.db = int(args[0])
+                return '+OK'
+            if name == 'GET':
+                entry = keys.get(args[0])
+                return entry[0] if entry else None
+            if name == 'DEL':
+                return int(keys.pop(args[0], None) is not None)
+            if name == 'SET':
+                key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+                if 'NX' in options and key in keys:
+                    return None
+                expires_at = None
+                if 'PX' in options:
+                    expires_at = time.monotonic() + int(options[options.index('PX') + 1]) / 1000
+                keys[key] = (value, expires_at)
+                return '+OK'
+            if name == 'DBSIZE':
+                return len(keys)
+            if name == 'SCAN':
+                # The cursor is an offset into the sorted keyspace
+                options = [arg.upper() for arg in args]
+                pattern = args[options.index('MATCH') + 1] if 'MATCH' in options else '*'
+                count = int(args[options.index('COUNT') + 1]) if 'COUNT' in options else 10
+                start = int(args[0])
+                names = sorted(keys)[start:start + count]
+                following = start + count if start + count < len(keys) else 0
+                return [str(following), [key for key in names if fnmatch.fnmatchcase(key, pattern)]]
+            return f'-ERR unknown command {name}'
+
+    def write(self, reply):
+        self.wfile.write(self.encode(reply))
+
+    def encode(self, reply):
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, list):
+            return b'*%d\r\n' % len(reply) + b''.join(self.encode(item) for item in reply)
+        if reply[:1] in ('+', '-'):
+            return reply.encode() + b'\r\n'
+        data = reply.encode()
+        return b'$%d\r\n%s\r\n' % (len(data), data)
+
+
+class StoreCases:
+    """Cases every backend must pass; subclasses build the stores"""
+
+    def make_store(self, namespace='challenge'):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.make_store()
+
+    def test_put_get_pop(self):
+        key = self.store.put('payload', 60)
+        self.assertEqual(self.store.get(key), 'payload')
+        self.assertEqual(self.store.get(key), 'payload')
+        self.assertEqual(self.store.pop(key), 'payload')
+        self.assertIsNone(self.store.pop(key))
+        self.assertIsNone(self.store.get(key))
+
+    def test_put_returns_unique_ids(self):
+        keys = {self.store.put(str(number), 60) for number in range(50)}
+        self.assertEqual(len(keys), 50)
+        self.assertEqual(len(self.store), 50)
+
+    def test_set_overwrites(self):
+        self.store.set('job', 'queued', 60)
+        self.store.set('job', 'done', 60)
+        self.assertEqual(self.store.get('job'), 'done')
+        self.assertEqual(len(self.store), 1)
+
+    def test_missing_key(self):
+        self.assertIsNone(self.store.get('missing'))
+        self.assertIsNone(self.store.pop('missing'))
+
+    def test_claim_is_single_use(self):
+        self.assertTrue(self.store.claim('nonce', 60))
+        self.assertFalse(self.store.claim('nonce', 60))
+        self.assertTrue(self.store.claim('other', 60))
+
+    def test_pop_releases_claim(self):
+        # /submit-fix gives the token back this way when the queue is full
+        self.assertTrue(self.store.claim('nonce', 60))
+        self.store.pop('nonce')
+        self.assertTrue(self.store.claim('nonce', 60))
+
+    def test_entries_expire(self):
+        key = self.store.put('payload', TTL)
+        self.store.set('job', 'done', TTL)
+        time.sleep(TTL * 1.5)
+        self.assertIsNone(self.store.get(key))
+        self.assertIsNone(self.store.pop(key))
+        self.assertIsNone(self.store.get('job'))
+
+    def test_claim_expires(self):
+        self.assertTrue(self.store.claim('nonce', TTL))
+        self.assertFalse(self.store.claim('nonce', TTL))
+        time.sleep(TTL * 1.5)
+        self.assertTrue(self.store.claim('nonce', 60))
+        self.assertFalse(self.store.claim('nonce', 60))
+
+    def test_ttl_is_per_entry(self):
+        short = self.store.put('short', TTL)
+        long = self.store.put('long', 60)
+        time.sleep(TTL * 1.5)
+        self.assertIsNone(self.store.get(short))
+        self.assertEqual(self.store.get(long), 'long')
+
+    def test_concurrent_claims_have_one_winner(self):
+        results = []
+        barrier = threading.Barrier(8)
+
+        def contend():
+            barrier.wait()
+            results.append(self.store.claim('nonce', 60))
+
+        threads = [threading.Thread(target=contend) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [False] * 7 + [True])
+
+    def test_namespaces_are_separate(self):
+        other = self.make_store(namespace='submission')
+        self.store.set('key', 'challenge', 60)
+        other.set('key', 'submission', 60)
+        self.assertTrue(other.claim('nonce', 60))
+        self.assertTrue(self.store.claim('nonce', 60))
+        self.assertEqual(self.store.get('key'), 'challenge')
+        self.assertEqual(other.get('key'), 'submission')
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(len(other), 2)
+
+
+class MemoryStoreTest(StoreCases, unittest.TestCase):
+
+    def make_store(self, namespace='challenge', capacity=10000):
+        return MemoryChallengeStore(shards=1, capacity=capacity, sweep_interval=0)
+
+    def test_capacity_evicts_unclaimed_first(self):
+        store = self.make_store(capacity=3)
+        self.assertTrue(store.claim('a', 60))
+        store.set('b', 'value', 60)
+        self.assertTrue(store.claim('c', 60))
+        store.set('d', 'value', 60)
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.capacity_evictions, 1)
+        self.assertFalse(store.claim('a', 60))
+        self.assertFalse(store.claim('c', 60))
+
+    def test_full_of_live_claims_rejects_new_claim(self):
+        store = self.make_store(capacity=2)
+        self.assertTrue(store.claim('a', 60))
+        self.assertTrue(store.claim('b', 60))
+        with self.assertRaises(StoreFull) as raised:
+            store.claim('c', 60)
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(store.rejected_claims, 1)
+        # Neither earlier claim was forgotten, and the rejected one was not kept
+        self.assertFalse(store.claim('a', 60))
+        self.assertFalse(store.claim('b', 60))
+        self.assertEqual(len(store), 2)
+
+    def test_expired_claim_makes_room(self):
+        store = self.make_store(capacity=2)
+        self.assertTrue(store.claim('a', TTL))
+        self.assertTrue(store.claim('b', 60))
+        time.sleep(TTL * 1.5)
+        self.assertTrue(store.claim('c', 60))
+        self.assertEqual(store.expired_evictions, 1)
+
+    def test_evict_expired(self):
+        self.store.put('short', TTL)
+        self.store.claim('nonce', TTL)
+        self.store.put('long', 60)
+        time.sleep(TTL * 1.5)
+        self.assertEqual(self.store.evict_expired(), 2)
+        self.assertEqual(len(self.store), 1)
+
+
+class SQLiteStoreTest(StoreCases, unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='bughunt-test-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        super().setUp()
+
+    def make_store(self, namespace='challenge'):
+        return create_challenge_store('sqlite:///' + os.path.join(self.directory, 'store.db'),
+                                      namespace=namespace)
+
+    def test_workers_share_claims(self):
+        # Another worker opens the same file
+        other = self.make_store()
+        self.assertTrue(self.store.claim('nonce', 60))
+        self.assertFalse(other.claim('nonce', 60))
+        key = other.put('payload', 60)
+        self.assertEqual(self.store.pop(key), 'payload')
+        self.assertIsNone(other.pop(key))
+
+    def test_evict_expired(self):
+        self.store.put('short', TTL)
+        self.store.claim('nonce', TTL)
+        self.store.put('long', 60)
+        time.sleep(TTL * 1.5)
+        self.assertEqual(self.store.evict_expired(), 2)
+        self.assertEqual(len(self.store), 1)
+
+    def test_rejects_private_database(self):
+        with self.assertRaises(ValueError):
+            SQLiteChallengeStore(':memory:')
+
+
+class RedisStoreTest(StoreCases, unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = _FakeRedis()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'redis://127.0.0.1:%d/3' % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        with self.server.lock:
+            self.server.dbs.clear()
+        super().setUp()
+
+    def make_store(self, namespace='challenge'):
+        return create_challenge_store(self.url, namespace=namespace)
+
+    def test_len_counts_only_this_store(self):
+        unrelated = RedisChallengeStore(port=self.store._port, db=3, prefix='other-app:')
+        for number in range(2500):
+            unrelated.set(str(number), 'value', 60)
+        for number in range(1200):
+            self.store.set(str(number), 'value', 60)
+        self.assertEqual(len(self.store), 1200)
+        self.assertEqual(len(unrelated), 2500)
+
+    def test_workers_share_claims(self):
+        other = self.make_store()
+        self.assertTrue(self.store.claim('nonce', 60))
+        self.assertFalse(other.claim('nonce', 60))
+        key = other.put('payload', 60)
+        self.assertEqual(self.store.pop(key), 'payload')
+        self.assertIsNone(other.pop(key))
+
+
+@unittest.skipUnless(os.environ.get('BUGHUNT_TEST_REDIS_URL'), 'BUGHUNT_TEST_REDIS_URL is not set')
+class LiveRedisStoreTest(StoreCases, unittest.TestCase):
+
+    def setUp(self):
+        self.make_store()._pool.run(lambda conn: conn.execute(('FLUSHDB',)))
+        super().setUp()
+
+    def make_store(self, namespace='challenge'):
+        return create_challenge_store(os.environ['BUGHUNT_TEST_REDIS_URL'], namespace=namespace)
+
+
+class CreateStoreTest(unittest.TestCase):
+
+    def test_urls(self):
+        self.assertIsInstance(create_challenge_store('memory://'), MemoryChallengeStore)
+        self.assertIsInstance(create_challenge_store(None), MemoryChallengeStore)
+        store = create_challenge_store('redis://:secret@cache:6380/2', namespace='submission')
+        self.assertEqual((store._host, store._port, store._db, store._password, store._prefix),
+                         ('cache', 6380, 2, 'secret', 'bughunt:submission:'))
+        with self.assertRaises(ValueError):
+            create_challenge_store('postgres://localhost/bughunt')
+
+
+if __name__ == '__main__':
+    unittest.main()
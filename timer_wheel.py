@@ -0,0 +1,107 @@
+"""Hashed timer wheel on the monotonic clock.
+
+Timers are dropped into one of ``slots`` buckets by their due tick, so
+scheduling and cancelling are O(1) and each tick only looks at one bucket,
+however many timers are pending. A timer further out than one revolution
+waits for the wheel to come round again. Callbacks run on the wheel's
+background thread, which is started lazily in each process, so they should
+be quick.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class _Timer:
+    __slots__ = ('key', 'rounds', 'callback', 'args', 'cancelled')
+
+    def __init__(self, key, rounds, callback, args):
+        self.key = key
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class TimerWheel:
+    """Keyed one-shot timers with tick-level precision"""
+
+    def __init__(self, tick=0.1, slots=1024):
+        self.tick = tick
+        self._slots = [[] for _ in range(slots)]
+        self._timers = {}
+        self._lock = threading.Lock()
+        self._position = 0
+        self._started_at = None
+        self._thread_pid = None
+
+    def __len__(self):
+        return len(self._timers)
+
+    def _ensure_thread(self):
+        # Timers and their thread belong to the process that scheduled them
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+            self._slots = [[] for _ in self._slots]
+            self._timers = {}
+            self._position = 0
+            self._started_at = time.monotonic()
+            threading.Thread(target=self._run, daemon=True, name='timer-wheel').start()
+
+    def schedule(self, key, delay, callback, *args):
+        """Call callback(*args) after delay seconds; replaces any timer with this key"""
+        self._ensure_thread()
+        ticks = max(1, int(-(-delay // self.tick)))
+        with self._lock:
+            previous = self._timers.pop(key, None)
+            if previous is not None:
+                previous.cancelled = True
+            slot = (self._position + ticks) % len(self._slots)
+            timer = _Timer(key, (ticks - 1) // len(self._slots), callback, args)
+            self._slots[slot].append(timer)
+            self._timers[key] = timer
+
+    def cancel(self, key):
+        """Cancel a pending timer; returns whether one was pending"""
+        with self._lock:
+            timer = self._timers.pop(key, None)
+        if timer is None:
+            return False
+        # Left in its slot and skipped when the wheel reaches it
+        timer.cancelled = True
+        return True
+
+    def _run(self):
+        while True:
+            # Ticks are counted from the start time so sleep jitter does not accumulate
+            due = self._started_at + (self._position + 1) * self.tick
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self._lock:
+                self._position += 1
+                slot = self._position % len(self._slots)
+                bucket, waiting = self._slots[slot], []
+                fired = []
+                for timer in bucket:
+                    if timer.cancelled:
+                        continue
+                    if timer.rounds:
+                        timer.rounds -= 1
+                        waiting.append(timer)
+                    else:
+                        del self._timers[timer.key]
+                        fired.append(timer)
+                self._slots[slot] = waiting
+            for timer in fired:
+                try:
+                    timer.callback(*timer.args)
+                except Exception:
+                    logger.exception('Timer %r failed', timer.key)
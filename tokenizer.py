@@ -0,0 +1,100 @@
+"""Small tokenizer for JavaScript and Java source.
+
+Splits code into identifiers, keywords, literals and operators and drops
+whitespace and comments, so two snippets that differ only in formatting give
+the same token stream. Tokens are produced lazily, so a caller that has seen
+enough can stop without scanning the rest of the code.
+
+It is deliberately not a parser: a JavaScript regular expression literal
+comes out as ordinary operator and identifier tokens. That is consistent on
+both sides of a comparison, which is all grading needs.
+"""
+import re
+
+TOKEN_LANGUAGES = frozenset({'javascript', 'java'})
+
+# Longest operators first so that ">>>=" is not read as ">>" then ">="
+_OPERATORS = sorted('''
+    >>>= ... === !== **= <<= >>= >>> &&= ||= ??= => :: -> ?. == != <= >= && || ++ --
+    += -= *= /= %= &= |= ^= << >> ** ??
+'''.split(), key=len, reverse=True)
+
+_TOKEN_RE = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*[\s\S]*?(?:\*/|$))
+  | (?P<string>
+        "{3}[\s\S]*?"{3}                            # Java text block
+      | "(?:[^"\\\n]|\\.)*"?
+      | '(?:[^'\\\n]|\\.)*'?
+      | `(?:[^`\\]|\\.)*`?                          # template literal, kept whole
+    )
+  | (?P<number>
+        0[xXbB][0-9a-fA-F_]+[lLn]?
+      | (?:\d[\d_]*(?:\.[\d_]*)?|\.\d[\d_]*)(?:[eE][+-]?\d+)?[lLfFdDn]?
+    )
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<operator>''' + '|'.join(re.escape(operator) for operator in _OPERATORS) + r''')
+  | (?P<other>.)                                    # any other single character
+''', re.VERBOSE)
+
+_SKIPPED = frozenset({'space', 'comment'})
+
+
+def iter_spans(code):
+    """Yield (kind, text) for every piece of code, whitespace and comments included.
+
+    kind is one of space, comment, string, number, name, operator or other;
+    joining the texts gives back the original code.
+    """
+    for match in _TOKEN_RE.finditer(code):
+        yield match.lastgroup, match.group()
+
+
+def iter_tokens(code):
+    """Yield the tokens of code one at a time, skipping whitespace and comments"""
+    for match in _TOKEN_RE.finditer(code):
+        if match.lastgroup not in _SKIPPED:
+            yield match.group()
+
+
+def tokenize(code):
+    """All of code's tokens as a tuple"""
+    return tuple(iter_tokens(code))
+
+
+class TokenStream:
+    """Tokens of a piece of code, scanned only as far as has been asked for"""
+
+    __slots__ = ('tokens', '_source')
+
+    def __init__(self, code):
+        self.tokens = []
+        self._source = iter_tokens(code)
+
+    def fill(self, count):
+        """Scan until at least count tokens are known; False if the code is shorter"""
+        tokens = self.tokens
+        while len(tokens) < count:
+            token = next(self._source, None)
+            if token is None:
+                return False
+            tokens.append(token)
+        return True
+
+    def find(self, needle, start=0):
+        """Index of the first run of tokens equal to needle at or after start, or -1"""
+        size = len(needle)
+        if not size:
+            return start
+        tokens, first = self.tokens, needle[0]
+        index = start
+        while self.fill(index + size):
+            if tokens[index] == first and tuple(tokens[index:index + size]) == needle:
+                return index
+            index += 1
+        return -1
+
+    def rest(self):
+        """Scan to the end and return every token"""
+        self.tokens.extend(self._source)
+        return self.tokens